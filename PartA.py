@@ -1,17 +1,28 @@
 import re
 import sys
 import logging
+from collections import Counter
+
+# a token is a maximal run of ascii letters and digits. Splitting on whitespace and then on everything that isn't a
+# letter or a digit gives exactly these runs, so a single findall over the whole text does both splits at once
+TOKEN_PATTERN = re.compile(r'[0-9a-zA-Z]+')
 
 
 # proj2 stuff
 def tokenize(str: str):
-    tokens: list = []
-    for token in str.split():
-        splitNonAlphaNum: list = list(filter(None, re.split(r'[^0-9a-zA-Z]+', token)))
-        if splitNonAlphaNum:
-            for word in splitNonAlphaNum:
-                tokens.append(word)
-    return tokens
+    return TOKEN_PATTERN.findall(str)
+
+
+# Complexity: O(n) for n tokens, plus O(d) lowercasing and stop word lookups for the d distinct words
+def count_words(tokens: list, stop_words) -> dict:
+    """
+    frequencies of the alphabetic tokens that aren't stop words, case preserved, in order of first appearance.
+    stop_words should be a set (lowercase), each distinct word is looked up once
+    """
+    counts = Counter(filter(str.isalpha, tokens))
+    for word in [word for word in counts if word.lower() in stop_words]:
+        del counts[word]
+    return counts
 
 
 # List<Token> tokenize(TextFilePath)
@@ -19,23 +30,12 @@ def tokenize(str: str):
 # void print(Frequencies<Token, Count>)
 
 # Complexity: O(n), where n is the size of input (linear)
-# While there are nested loops, O(n) can be also thought of as O(m*p),
-# where m is the number of lines in the input file (separated by newline chars),
-# and p is the average number of tokens per line (separated by space chars)
-# Just a different way of saying input size. More lines, or tokens per line still means input size grows.
-# The innermost for loop growth directly correlates with tokens per line.
+# tokenize makes a single pass over the whole text, lines and spaces are just non token characters
 def tokenize_file(TextFilePath: str) -> list:
     try:
         file = open(TextFilePath, 'r')
         text: str = file.read().strip()
-        lines: list = text.splitlines()
-        tokens: list = []
-        for line in lines:
-            for token in line.split():
-                splitNonAlphaNum: list = list(filter(None, re.split(r'[^0-9a-zA-Z]+', token)))
-                if splitNonAlphaNum:
-                    for word in splitNonAlphaNum:
-                        tokens.append(word)
+        tokens: list = tokenize(text)
         file.close()
     except FileNotFoundError:
         print('Debug: file doens\'t exist')
@@ -0,0 +1,326 @@
+import heapq
+import json
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class TopWords:
+    """
+    Word frequencies kept in bounded memory. Counts are exact until more than 2 * capacity distinct words have been seen;
+    then only the capacity most frequent words are kept, and a word seen for the first time after that starts from the
+    highest count dropped so far (space saving), so a frequent word is never lost and a count is never underestimated.
+    Words that are tied keep the order they were first seen in, like a plain dict. With capacity None every word is kept
+
+    Attributes:
+        counts: word -> count
+        errors: word -> the most its count can be overestimated by, for the words whose count isn't exact
+        floor: the highest count dropped so far, the most a word that isn't kept can have been counted, and the most a
+            kept count can be overestimated by
+    """
+
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self.counts: dict = {}
+        self.errors: dict = {}
+        self.floor = 0
+
+    def add(self, word, count=1):
+        counts = self.counts
+        if word in counts:
+            counts[word] += count
+            return
+        counts[word] = self.floor + count
+        if self.floor:
+            self.errors[word] = self.floor
+        if self.capacity is not None and len(counts) > 2 * self.capacity:
+            self.prune()
+
+    def update(self, frequencies):
+        for word, count in frequencies.items():
+            self.add(word, count)
+
+    def prune(self):
+        kept = heapq.nlargest(self.capacity, self.counts.values())
+        threshold = kept[-1]
+        keep_at_threshold = kept.count(threshold)
+        pruned = {}
+        for word, count in self.counts.items():
+            if count > threshold or (count == threshold and keep_at_threshold > 0):
+                if count == threshold:
+                    keep_at_threshold -= 1
+                pruned[word] = count
+            else:
+                self.floor = max(self.floor, count)
+        self.counts = pruned
+        self.errors = {word: error for word, error in self.errors.items() if word in pruned}
+
+    def merge(self, counts, errors, floor):
+        """
+        Adds the counts, errors and floor of another TopWords. A word that one side doesn't have is counted with that
+        side's floor, the most it can have been counted there, so merged counts are still never underestimated; their
+        errors, and the floors, add up
+        """
+        own_floor = self.floor
+        if floor:
+            for word in self.counts:
+                if word not in counts:
+                    self.counts[word] += floor
+                    self.errors[word] = self.errors.get(word, 0) + floor
+        for word, count in counts.items():
+            error = errors.get(word, 0)
+            if word in self.counts:
+                self.counts[word] += count
+            else:
+                self.counts[word] = own_floor + count
+                error += own_floor
+            if error:
+                self.errors[word] = self.errors.get(word, 0) + error
+        self.floor = own_floor + floor
+        if self.capacity is not None and len(self.counts) > 2 * self.capacity:
+            self.prune()
+
+    def most_common(self, n):
+        return sorted(self.counts.items(), key=lambda x: x[1], reverse=True)[:n]
+
+
+class SortedUrlFile:
+    """
+    Url lines written to disk as they come and sorted, with duplicate urls removed, when the file is finished. Lines are
+    sorted in runs of run_size lines that are merged at the end, so memory stays the same however many urls are written.
+    The url is everything before the first tab of a line
+    """
+
+    def __init__(self, path, run_size=100000, recent_size=10000):
+        self.path = path
+        self.run_size = run_size
+        self.lines: list = list()
+        self.runs: list = list()
+        # urls written lately, links repeated on consecutive pages are only written once
+        self.recent = OrderedDict()
+        self.recent_size = recent_size
+        self.written = 0
+
+    def add(self, url, line=None):
+        if url in self.recent:
+            self.recent.move_to_end(url)
+            return
+        self.recent[url] = None
+        if len(self.recent) > self.recent_size:
+            self.recent.popitem(last=False)
+        self.lines.append((line if line is not None else url) + "\n")
+        self.written += 1
+        if len(self.lines) >= self.run_size:
+            self.write_run()
+
+    def write_run(self):
+        self.lines.sort()
+        run = tempfile.NamedTemporaryFile("w+", encoding="utf-8", errors="surrogateescape",
+                                          prefix=os.path.basename(self.path) + ".", suffix=".run", delete=False,
+                                          dir=os.path.dirname(os.path.abspath(self.path)))
+        run.writelines(self.lines)
+        run.flush()
+        self.runs.append(run)
+        self.lines = []
+
+    def finish(self):
+        """
+        Merges the sorted runs into the final file, keeping the first line of each url
+        """
+        self.lines.sort()
+        for run in self.runs:
+            run.seek(0)
+        temp_file = self.path + ".tmp"
+        previous = None
+        with open(temp_file, "w", encoding="utf-8", errors="surrogateescape") as f:
+            for line in heapq.merge(self.lines, *self.runs):
+                url = line.split("\t", 1)[0].rstrip("\n")
+                if url != previous:
+                    f.write(line)
+                    previous = url
+        os.replace(temp_file, self.path)
+        for run in self.runs:
+            run.close()
+            os.remove(run.name)
+        self.runs = []
+        self.lines = []
+
+
+class CrawlAnalytics:
+    """
+    Keeps what the analytics report needs as pages are crawled, in memory that doesn't grow with the crawl: the url
+    count per subdomain, the page with the most valid outlinks and the longest page so far, bounded word frequencies
+    and the valid and trap urls, which go straight to disk. With snapshot_interval set a partial analytics.txt is
+    written every snapshot_interval pages while the crawl runs
+
+    Attributes:
+        url_count_per_subdomain: subdomain -> number of valid pages crawled on it
+        most_outlinks: (url, number of valid outlinks) of the page with the most valid outlinks
+        longest_page: (url, word count) of the page with the highest word count
+        top_words: TopWords of the non stop words of all pages
+        pages: number of pages recorded
+        link_graph: link_graph.LinkGraph recording the links between the valid pages, None if the graph isn't kept
+        link_ranks: top pages by PageRank and HITS, computed from the link graph when the crawl finishes
+        search_index: search_index.IndexWriter indexing the text of the valid pages, None if no index is built
+    """
+
+    ANALYTICS_FILE_NAME = "analytics.txt"
+    VALID_URLS_FILE_NAME = "valid_urls.txt"
+    TRAPPED_URLS_FILE_NAME = "trapped_urls.txt"
+    STATE_FILE_NAME = "analytics_state.json"
+
+    def __init__(self, output_dir=".", top_words_capacity=10000, snapshot_interval=None, link_graph=None,
+                 search_index=None):
+        self.output_dir = output_dir
+        self.url_count_per_subdomain: dict = {}
+        self.most_outlinks = None
+        self.longest_page = None
+        self.top_words = TopWords(top_words_capacity)
+        self.valid_urls = SortedUrlFile(self.output_file(self.VALID_URLS_FILE_NAME))
+        self.trap_urls = SortedUrlFile(self.output_file(self.TRAPPED_URLS_FILE_NAME))
+        self.snapshot_interval = snapshot_interval
+        self.pages = 0
+        self.link_graph = link_graph
+        self.link_ranks = None
+        self.search_index = search_index
+
+    def output_file(self, file_name):
+        return os.path.join(self.output_dir, file_name)
+
+    def count_subdomain(self, subdomain):  # 1
+        if subdomain in self.url_count_per_subdomain:
+            self.url_count_per_subdomain[subdomain] += 1
+        else:
+            self.url_count_per_subdomain[subdomain] = 1
+
+    def record_outlinks(self, url, count):  # 2
+        if count and (self.most_outlinks is None or count > self.most_outlinks[1]):
+            self.most_outlinks = (url, count)
+
+    def record_traps(self, trap_urls):  # 3
+        for url, reason in trap_urls.items():
+            self.trap_urls.add(url, "{}\t{}".format(url, reason))
+
+    def record_word_count(self, url, word_count):  # 4
+        if self.longest_page is None or word_count > self.longest_page[1]:
+            self.longest_page = (url, word_count)
+
+    def record_page(self, page):
+        """
+        Records a crawler.PageResult
+        """
+        # a near duplicate page counts as downloaded, but its outlinks and words were already counted on the original
+        duplicate = page.duplicate_of is not None
+        self.record_traps(page.trap_urls)
+        if not duplicate:
+            self.record_outlinks(page.url, len(page.outlinks))
+        if page.is_valid:
+            self.valid_urls.add(page.url)
+            if not duplicate:
+                self.record_word_count(page.url, page.word_count)
+                self.top_words.update(page.word_frequencies)  # 5
+                if self.link_graph is not None:
+                    self.link_graph.add_page(page.url, page.frontier_links)
+                if self.search_index is not None and page.tokens is not None:
+                    self.search_index.add_document(page.url, page.tokens)
+            self.count_subdomain(page.subdomain)
+        self.pages += 1
+        if self.snapshot_interval and self.pages % self.snapshot_interval == 0:
+            self.write_report()
+            logger.info("Wrote analytics snapshot after %s pages", self.pages)
+
+    def write_report(self):
+        """
+        Writes analytics.txt from what has been recorded so far, under a temporary name that is then renamed so a reader
+        never sees a half written report. Raises ValueError if no page has been recorded
+        """
+        if self.most_outlinks is None or self.longest_page is None:
+            raise ValueError("no pages recorded")
+        analytics_file_name = self.output_file(self.ANALYTICS_FILE_NAME)
+        with open(analytics_file_name + ".tmp", 'w') as analytics_file:
+            analytics_file.write("(1) number of urls processed for all visited subdomains:\n\n")
+            for k, v in self.url_count_per_subdomain.items():
+                analytics_file.write("{}: {}\n".format(str(k), str(v)))
+
+            analytics_file.write("\n(2) page with most valid outlinks:\n\n")
+            analytics_file.write("{} has {} valid outlinks\n".format(str(self.most_outlinks[0]),
+                                                                     str(self.most_outlinks[1])))
+            if self.link_ranks is not None:
+                for name, title in (("pagerank", "PageRank"), ("authorities", "HITS authority"),
+                                    ("hubs", "HITS hub score")):
+                    analytics_file.write("\npages with the highest {}:\n\n".format(title))
+                    for url, score in self.link_ranks[name]:
+                        analytics_file.write("{} {:.6f}\n".format(url, score))
+
+            analytics_file.write("\n(3) list of downloaded URLs and identified traps:\n\n")
+            analytics_file.write("see trapped URLs in trapped_urls.txt and valid URLs in valid_urls.txt\n")
+
+            analytics_file.write("\n(4) page with highest word count:\n\n")
+            analytics_file.write("{} has {} words\n".format(str(self.longest_page[0]), str(self.longest_page[1])))
+
+            analytics_file.write("\n(5) top 50 common words across all pages\n\n")
+            if self.top_words.floor:
+                analytics_file.write("approximate counts: more distinct words were seen than --top-words-capacity "
+                                     "keeps, a count may be up to {} too high\n".format(self.top_words.floor))
+            for i, s in enumerate(self.top_words.most_common(50)):
+                error = self.top_words.errors.get(s[0])
+                analytics_file.write('{}: {}{}\n'.format(str(i + 1), str(s),
+                                                         " up to {} too high".format(error) if error else ""))
+        os.replace(analytics_file_name + ".tmp", analytics_file_name)
+
+    def write_state(self):
+        """
+        Writes the report counters to analytics_state.json, so the analytics of several crawls (the shards of a sharded
+        crawl) can be merged with merge_output
+        """
+        state = {"url_count_per_subdomain": self.url_count_per_subdomain, "most_outlinks": self.most_outlinks,
+                 "longest_page": self.longest_page, "top_words": self.top_words.counts,
+                 "top_words_errors": self.top_words.errors, "top_words_floor": self.top_words.floor,
+                 "pages": self.pages}
+        state_file_name = self.output_file(self.STATE_FILE_NAME)
+        with open(state_file_name + ".tmp", "w", encoding="utf-8", errors="surrogateescape") as state_file:
+            json.dump(state, state_file)
+        os.replace(state_file_name + ".tmp", state_file_name)
+
+    def merge_output(self, output_dir):
+        """
+        Adds the analytics another crawl wrote to output_dir with write_state and finish
+        """
+        with open(os.path.join(output_dir, self.STATE_FILE_NAME), encoding="utf-8", errors="surrogateescape") as f:
+            state = json.load(f)
+        for subdomain, count in state["url_count_per_subdomain"].items():
+            self.url_count_per_subdomain[subdomain] = self.url_count_per_subdomain.get(subdomain, 0) + count
+        if state["most_outlinks"] is not None:
+            self.record_outlinks(*state["most_outlinks"])
+        if state["longest_page"] is not None:
+            self.record_word_count(*state["longest_page"])
+        self.top_words.merge(state["top_words"], state["top_words_errors"], state["top_words_floor"])
+        self.pages += state["pages"]
+        for url_file, file_name in ((self.valid_urls, self.VALID_URLS_FILE_NAME),
+                                    (self.trap_urls, self.TRAPPED_URLS_FILE_NAME)):
+            with open(os.path.join(output_dir, file_name), encoding="utf-8", errors="surrogateescape") as f:
+                for line in f:
+                    line = line.rstrip("\n")
+                    url_file.add(line.split("\t", 1)[0], line)
+
+    def finish(self):
+        """
+        Sorts the valid and trap url files and writes the final report
+        """
+        self.valid_urls.finish()
+        self.trap_urls.finish()
+        if self.link_graph is not None:
+            self.link_ranks = self.link_graph.rank()
+            self.link_graph.close()
+        if self.search_index is not None:
+            self.search_index.close()
+        self.write_report()
+
+# ================
+# sources:
+# https://www.cse.ust.hk/~raywong/comp5331/References/EfficientComputationOfFrequentAndTop-kElementsInDataStreams.pdf
+# https://en.wikipedia.org/wiki/External_sorting
+# https://docs.python.org/3/library/heapq.html#heapq.merge
@@ -0,0 +1,547 @@
+import argparse
+import json
+import math
+import os
+import platform
+import re
+import shutil
+import statistics
+import string
+import sys
+import tempfile
+import time
+
+from corpus import Corpus
+from PartA import tokenize, tokenize_file
+
+
+def load_sample_pages(corpus_dir, sample_size):
+    """
+    Returns the html contents of up to sample_size corpus files, taken in file name order so runs are comparable
+    """
+    corpus = Corpus(corpus_dir)
+    pages = []
+    for file_name in sorted(os.listdir(corpus.corpus_base_dir)):
+        if len(pages) >= sample_size:
+            break
+        url_data = corpus.read_file(file_name, os.path.join(corpus.corpus_base_dir, file_name))
+        if url_data['content'] and 'text/html' in str(url_data['content_type']):
+            pages.append(url_data['content'])
+    return pages
+
+
+def time_per_page(function, pages, repeat):
+    """
+    Runs function over every page, repeat times, and returns the best pages/sec
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for content in pages:
+            function(content)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(pages) / best if best else float("inf")
+
+
+def bench_page_analysis(args):
+    """
+    Compares the single pass page analysis with the previous BeautifulSoup pipeline, which built a tree for the links
+    and then extracted and tokenized the text twice (longest page and most common words)
+    """
+    from bs4 import BeautifulSoup
+    from page_analysis import analyze_html
+
+    stop_words = sorted(set(tokenize_file('stop_words.txt')))
+    pages = load_sample_pages(args.corpus_dir, args.sample)
+    if not pages:
+        print("no html pages found in", args.corpus_dir)
+        return
+
+    def soup_pipeline(content):
+        soup = BeautifulSoup(content, "lxml")
+        hrefs = [link.get('href') for link in soup.find_all('a')]
+        word_count = len(tokenize(soup.get_text()))
+        word_frequencies = {}
+        for word in tokenize(soup.get_text()):
+            if word.isalpha() and word.lower() not in stop_words:
+                word_frequencies[word] = word_frequencies.get(word, 0) + 1
+        return hrefs, word_count, word_frequencies
+
+    stop_word_set = frozenset(stop_words)
+
+    def single_pass(content):
+        analysis = analyze_html(content, stop_word_set)
+        return analysis.hrefs, analysis.word_count, analysis.word_frequencies
+
+    mismatches = sum(1 for content in pages if soup_pipeline(content) != single_pass(content))
+    before = time_per_page(soup_pipeline, pages, args.repeat)
+    after = time_per_page(single_pass, pages, args.repeat)
+    print("pages: {}, mismatching results: {}".format(len(pages), mismatches))
+    print("beautifulsoup, 2 text passes: {:10.1f} pages/sec".format(before))
+    print("single pass analysis:         {:10.1f} pages/sec".format(after))
+    print("speedup: {:.2f}x".format(after / before))
+
+
+def legacy_tokenize(text):
+    """
+    PartA.tokenize as it was before the single findall, the reference for the tokenizer benchmark
+    """
+    tokens = []
+    for token in text.split():
+        splitNonAlphaNum = list(filter(None, re.split(r'[^0-9a-zA-Z]+', token)))
+        if splitNonAlphaNum:
+            for word in splitNonAlphaNum:
+                tokens.append(word)
+    return tokens
+
+
+def bench_tokenize(args):
+    """
+    Compares the tokenizer and stop word filter with the previous per token re.split loop and sorted stop word list, on
+    the text of real corpus pages
+    """
+    from page_analysis import page_text
+    from PartA import count_words
+
+    stop_word_list = sorted(set(tokenize_file('stop_words.txt')) | set(string.ascii_letters))
+    stop_word_set = frozenset(stop_word_list)
+    texts = [page_text(content) for content in load_sample_pages(args.corpus_dir, args.sample)]
+    if not texts:
+        print("no html pages found in", args.corpus_dir)
+        return
+
+    def legacy(text):
+        frequencies = {}
+        for word in legacy_tokenize(text):
+            if str(word).isalpha():
+                if str(word).lower() not in stop_word_list:
+                    frequencies[word] = frequencies.get(word, 0) + 1
+        return frequencies
+
+    def current(text):
+        return count_words(tokenize(text), stop_word_set)
+
+    token_mismatches = sum(1 for text in texts if legacy_tokenize(text) != tokenize(text))
+    count_mismatches = sum(1 for text in texts if list(legacy(text).items()) != list(current(text).items()))
+    megabytes = sum(len(text) for text in texts) / (1 << 20)
+    before = time_per_page(legacy, texts, args.repeat)
+    after = time_per_page(current, texts, args.repeat)
+    print("pages: {}, text: {:.1f} MiB, mismatching tokens: {}, mismatching counts: {}".format(
+        len(texts), megabytes, token_mismatches, count_mismatches))
+    print("re.split per token, stop word list: {:10.1f} pages/sec".format(before))
+    print("findall, Counter, stop word set:    {:10.1f} pages/sec".format(after))
+    print("speedup: {:.2f}x".format(after / before))
+
+
+def bench_seen_set(args):
+    """
+    Compares the seen set backends of the frontier: insert and lookup speed, memory and measured false positive rate
+    """
+    from seen_set import SEEN_BACKENDS, make_seen_set, measure_false_positive_rate, seen_set_memory
+
+    print("{:>10} {:>12} {:>12} {:>12} {:>14} {:>10}".format("urls", "backend", "adds/sec", "lookups/sec",
+                                                          "memory MiB", "fp rate"))
+    for size in (int(s) for s in args.sizes.split(",")):
+        urls = ["http://www.ics.uci.edu/dir{}/page{}.html".format(i % 1000, i) for i in range(size)]
+        probes = urls[::10] + ["http://www.ics.uci.edu/missing/{}".format(i) for i in range(0, size, 10)]
+        for backend in SEEN_BACKENDS:
+            seen = make_seen_set(backend)
+            start = time.perf_counter()
+            for url in urls:
+                seen.add(url)
+            adds = size / (time.perf_counter() - start)
+            start = time.perf_counter()
+            for url in probes:
+                url in seen
+            lookups = len(probes) / (time.perf_counter() - start)
+            memory = seen_set_memory(seen) / (1 << 20)
+            fp_rate = measure_false_positive_rate(seen, args.fp_samples)
+            print("{:>10} {:>12} {:>12.0f} {:>12.0f} {:>14.1f} {:>10.2e}".format(size, backend, adds, lookups,
+                                                                              memory, fp_rate))
+            del seen
+        del urls, probes
+
+
+def clear_caches():
+    """
+    Empties the memos the whole process shares (url parsing and canonicalization, SimHash token hashes) and collects
+    garbage, so a timed run doesn't find them warm from the benchmarks and runs before it
+    """
+    import gc
+    from near_duplicates import token_hash
+    from url_canonical import canonical_url, parse_url
+
+    parse_url.cache_clear()
+    canonical_url.cache_clear()
+    token_hash.cache_clear()
+    gc.collect()
+
+
+def measure(runs, repeat, min_time):
+    """
+    Times every run in name -> run, a function returning the seconds it took itself so it can leave its setup out,
+    from cleared caches every time. A measurement calls a run as many times as a first untimed call says it takes to last
+    min_time seconds, the same number for every measurement. The measurements go round robin, one of every run per
+    round, so a machine that gets slower or faster during the suite shows in the spread of every run rather than as a
+    difference between runs. Returns name -> (median seconds per call of repeat measurements, their spread, the
+    standard deviation of a measurement relative to the median)
+    """
+    calls = {}
+    for name, run in runs.items():
+        clear_caches()
+        calls[name] = max(1, math.ceil(min_time / max(run(), 1e-9)))
+    seconds = {name: [] for name in runs}
+    for _ in range(repeat):
+        for name, run in runs.items():
+            elapsed = 0.0
+            for _ in range(calls[name]):
+                clear_caches()
+                elapsed += run()
+            seconds[name].append(elapsed / calls[name])
+    measured = {}
+    for name, values in seconds.items():
+        median = statistics.median(values)
+        measured[name] = (median, statistics.stdev(values) / median)
+    return measured
+
+
+def corpus_urls(corpus_dir):
+    """
+    The url of every corpus file, read from the files themselves, in file name order
+    """
+    from cbor_record import CborRecord, CborError
+
+    urls = []
+    for entry in sorted(os.scandir(corpus_dir), key=lambda entry: entry.name):
+        try:
+            with open(entry.path, "rb") as f:
+                url = CborRecord(f.read()).value(b'url')
+        except (CborError, IndexError, OSError):
+            continue
+        if url:
+            urls.append(url.decode("utf-8", errors="surrogateescape") if isinstance(url, bytes) else url)
+    return urls
+
+
+def cold_start(corpus_dir):
+    """
+    Seconds a new interpreter takes to import the crawler, set it up and process the seed page, what every worker
+    process and short re-crawl pays before crawling. The first run also builds the corpus index and crawler tables
+    caches in the current directory
+    """
+    import subprocess
+
+    code = ("import sys; from corpus import Corpus; from crawler import Crawler; from frontier import Frontier; "
+            "Crawler(None, Corpus(sys.argv[1])).process_url(Frontier.SEED_URL)")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        path for path in (os.path.dirname(os.path.abspath(__file__)), os.environ.get("PYTHONPATH")) if path))
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code, corpus_dir], env=env, check=True)
+    return time.perf_counter() - start
+
+
+def bench_http(args):
+    """
+    Fetches corpus urls with HttpFetcher from a stub_server serving the corpus on this machine: pages/sec, connection
+    reuse, and whether the fetcher kept to its per host rate and its connection limit. The exit status is 1 if it
+    didn't or if a page came back different from its corpus record
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from fetcher import HttpFetcher
+    from stub_server import StubServer
+
+    corpus = Corpus(args.corpus_dir)
+    urls = corpus_urls(corpus.corpus_base_dir)[:args.pages]
+    if not urls:
+        print("no corpus files found in", args.corpus_dir)
+        return
+    robots_txt = None
+    if args.robots is not None:
+        with open(args.robots, encoding="utf-8") as f:
+            robots_txt = f.read()
+    stub = StubServer(corpus, latency=args.latency, robots_txt=robots_txt).start()
+    fetcher = HttpFetcher(rate=args.rate, burst=args.burst, max_connections=args.max_connections, proxy=stub.address)
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.threads) as executor:
+            pages = list(executor.map(lambda url: fetcher.fetch_url(url, html_only=True), urls))
+        elapsed = time.perf_counter() - start
+    finally:
+        fetcher.close()
+        stub.close()
+
+    fields = ("http_code", "content_type", "content")
+    mismatches = 0
+    for url, url_data in zip(urls, pages):
+        if url_data["content"] is None and url_data["http_code"] is None:
+            # disallowed by robots.txt, never requested
+            continue
+        expected = corpus.fetch_url(url, html_only=True)
+        mismatches += any(url_data[field] != expected[field] for field in fields)
+    hosts = len(stub.stats()["hosts"])
+    violations = stub.rate_violations(args.rate, args.burst)
+    print("urls: {}, hosts: {}, mismatching pages: {}".format(len(urls), hosts, mismatches))
+    print("fetched: {:10.1f} pages/sec, at most {:.1f} with --rate {} per host".format(
+        len(urls) / elapsed, hosts * args.rate, args.rate))
+    print("fetcher:", fetcher.stats())
+    print("most requests in flight: {} (limit {})".format(stub.max_in_flight, args.max_connections))
+    print("hosts over the rate limit:", violations or "none")
+    if mismatches or violations or stub.max_in_flight > args.max_connections:
+        sys.exit(1)
+
+
+def suite_results(corpus_dir, repeat, min_time):
+    """
+    Runs every suite benchmark against corpus_dir and returns name -> {"value", "unit", "spread"}, value being the median
+    of repeat measurements of at least min_time seconds each (see measure). Frontier state and crawl output go to the
+    current directory
+    """
+    from analytics import CrawlAnalytics
+    from crawler import Crawler
+    from frontier import Frontier
+    from page_analysis import analyze_html, page_text
+    from PartA import count_words
+    from search_index import IndexWriter
+    from url_filter import UrlFilter
+    from urllib.parse import urljoin
+
+    corpus = Corpus(corpus_dir)
+    urls = corpus_urls(corpus.corpus_base_dir)
+    stop_words = frozenset(tokenize_file('stop_words.txt')) | frozenset(string.ascii_letters)
+    html_pages = [(url, url_data['content']) for url, url_data in ((url, corpus.fetch_url(url, html_only=True))
+                                                                   for url in urls) if url_data['content']]
+    pages = [content for _, content in html_pages]
+    texts = [page_text(content) for content in pages]
+    links = [urljoin(url, href) for url, content in html_pages for href in analyze_html(content, stop_words).hrefs
+             if href is not None]
+    # name -> (run, number of items a run processes, unit)
+    benchmarks = {}
+
+    def record(name, run, count, unit):
+        benchmarks[name] = (run, count, unit)
+
+    def timed(function, items):
+        def run():
+            start = time.perf_counter()
+            for item in items:
+                function(item)
+            return time.perf_counter() - start
+        return run
+
+    def read():
+        # a new Corpus, the url digests it memoizes would be warm otherwise
+        fresh_corpus = Corpus(corpus_dir)
+        return timed(lambda url: fresh_corpus.fetch_url(url, html_only=True), urls)()
+    record("read", read, lambda: len(urls), "pages/sec")
+    record("parse", timed(page_text, pages), lambda: len(pages), "pages/sec")
+    record("tokenize", timed(lambda text: count_words(tokenize(text), stop_words), texts), lambda: len(texts),
+           "pages/sec")
+
+    def filter_links():
+        url_filter = UrlFilter()
+        start = time.perf_counter()
+        url_filter.filter_links(links)
+        return time.perf_counter() - start
+    record("filter", filter_links, lambda: len(links), "urls/sec")
+
+    def frontier_ops():
+        shutil.rmtree("frontier_bench", ignore_errors=True)
+        frontier = Frontier("frontier_bench")
+        frontier.open_journal()
+        start = time.perf_counter()
+        for link in links:
+            frontier.add_url(link)
+        while frontier.has_next_url():
+            frontier.mark_fetched(frontier.get_next_url())
+        elapsed = time.perf_counter() - start
+        frontier.close()
+        return elapsed
+    record("frontier_ops", frontier_ops, lambda: len(links) + len(set(links)), "ops/sec")
+
+    def persistence():
+        shutil.rmtree("frontier_bench", ignore_errors=True)
+        frontier = Frontier("frontier_bench")
+        frontier.open_journal()
+        for link in links:
+            frontier.add_url(link)
+        start = time.perf_counter()
+        frontier.compact()
+        frontier.close()
+        Frontier("frontier_bench").load_frontier()
+        return time.perf_counter() - start
+    record("persistence", persistence, lambda: len(set(links)), "urls/sec")
+
+    fetched = []
+
+    def crawl(search_index=False):
+        shutil.rmtree("frontier_bench", ignore_errors=True)
+        frontier = Frontier("frontier_bench")
+        frontier.load_frontier()
+        index_writer = IndexWriter("search_index_bench") if search_index else None
+        crawler = Crawler(frontier, corpus, analytics=CrawlAnalytics(output_dir=".", search_index=index_writer))
+        start = time.perf_counter()
+        crawler.start_crawling()
+        elapsed = time.perf_counter() - start
+        fetched.append(frontier.fetched)
+        frontier.close()
+        if index_writer is not None:
+            index_writer.close()
+        return elapsed
+    record("crawl", crawl, lambda: fetched[0], "pages/sec")
+    # the index built after the crawl is left out, only what indexing costs the crawl itself counts
+    record("crawl_indexed", lambda: crawl(search_index=True), lambda: fetched[0], "pages/sec")
+    record("cold_start", lambda: cold_start(corpus.corpus_base_dir), lambda: 1, "starts/sec")
+    measured = measure({name: run for name, (run, _, _) in benchmarks.items()}, repeat, min_time)
+    shutil.rmtree("frontier_bench", ignore_errors=True)
+    shutil.rmtree("search_index_bench", ignore_errors=True)
+    results = {}
+    for name, (_, count, unit) in benchmarks.items():
+        seconds, spread = measured[name]
+        results[name] = {"value": round(count() / seconds, 1), "unit": unit, "spread": round(spread, 4)}
+    return results
+
+
+def compare_with_baseline(report, baseline, noise, min_tolerance):
+    """
+    Prints every result of report next to its baseline and returns the names of the results slower than timer noise
+    explains: by more than noise standard errors of the difference of the two medians, taking the larger spread of the
+    baseline and the result, and by at least min_tolerance
+    """
+    results = report["results"]
+    # the standard error of the median of n measurements is about 1.25 / sqrt(n) standard deviations
+    standard_errors = 1.25 * math.sqrt(1 / report["repeat"] + 1 / baseline["repeat"])
+    regressions = []
+    print("{:>14} {:>14} {:>14} {:>8} {:>8}".format("benchmark", "baseline", "current", "ratio", "limit"))
+    for name, result in results.items():
+        base = baseline["results"].get(name)
+        if base is None or not base["value"]:
+            print("{:>14} {:>14} {:>14.1f} {:>8} {:>8}  {}".format(name, "-", result["value"], "-", "-",
+                                                                   result["unit"]))
+            continue
+        ratio = result["value"] / base["value"]
+        # a baseline written before spreads were kept only has the spread of this run
+        tolerance = max(min_tolerance, noise * standard_errors * max(base.get("spread", 0.0), result["spread"]))
+        flag = ""
+        if ratio < 1 - tolerance:
+            regressions.append(name)
+            flag = "REGRESSION"
+        print("{:>14} {:>14.1f} {:>14.1f} {:>8.2f} {:>8.2f}  {} {}".format(name, base["value"], result["value"], ratio,
+                                                                          1 - tolerance, result["unit"], flag))
+    return regressions
+
+
+def bench_suite(args):
+    """
+    Generates a synthetic corpus (or uses --corpus-dir) and runs the end to end crawl and the per component benchmarks
+    against it. The results are written as json with the corpus parameters and compared with the baseline file, and the
+    exit status is 1 if any benchmark is slower than its baseline by more than its noise (see compare_with_baseline)
+    """
+    from synthetic_corpus import generate_corpus
+
+    stop_words_file = os.path.abspath('stop_words.txt')
+    baseline_file = os.path.abspath(args.baseline)
+    output_file = os.path.abspath(args.output) if args.output else None
+    corpus_dir = os.path.abspath(args.corpus_dir) if args.corpus_dir else None
+    previous_dir = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="crawler-bench-") as work_dir:
+        # the crawl writes its corpus index, frontier state and analytics to the current directory
+        os.chdir(work_dir)
+        try:
+            shutil.copy(stop_words_file, "stop_words.txt")
+            parameters = {"pages": args.pages, "fan_out": args.fan_out, "trap_rate": args.trap_rate,
+                          "page_words": args.page_words, "seed": args.seed}
+            if corpus_dir is None:
+                corpus_dir = os.path.join(work_dir, "corpus")
+                start = time.perf_counter()
+                parameters = generate_corpus(corpus_dir, **parameters)
+                print("generated {files} files, {bytes} bytes".format(**parameters),
+                      "in {:.1f}s".format(time.perf_counter() - start))
+            else:
+                parameters = {"corpus_dir": corpus_dir}
+            results = suite_results(corpus_dir, args.repeat, args.min_time)
+        finally:
+            os.chdir(previous_dir)
+    report = {"parameters": parameters, "repeat": args.repeat, "min_time": args.min_time,
+              "python": platform.python_version(), "machine": platform.machine(), "results": results}
+    if output_file:
+        with open(output_file, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline or not os.path.exists(baseline_file):
+        with open(baseline_file, "w") as f:
+            json.dump(report, f, indent=2)
+        for name, result in results.items():
+            print("{:>14} {:>14.1f}  {}, spread {:.1%}".format(name, result["value"], result["unit"],
+                                                                result["spread"]))
+        print("baseline written to", baseline_file)
+        return
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+    if baseline.get("parameters") != parameters:
+        print("warning: the baseline was measured on a different corpus:", baseline.get("parameters"))
+    regressions = compare_with_baseline(report, baseline, args.noise, args.min_tolerance)
+    if regressions:
+        print("regressions:", ", ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks of the crawler components")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    page_analysis = subparsers.add_parser("page_analysis", help="html parsing, link extraction and tokenization")
+    page_analysis.add_argument("corpus_dir", help="directory of the corpus files")
+    page_analysis.add_argument("--sample", type=int, default=500, help="number of corpus files to use")
+    page_analysis.add_argument("--repeat", type=int, default=3, help="runs per pipeline, the best one is reported")
+    page_analysis.set_defaults(run=bench_page_analysis)
+
+    tokenizer = subparsers.add_parser("tokenize", help="tokenizer and stop word filter on corpus page texts")
+    tokenizer.add_argument("corpus_dir", help="directory of the corpus files")
+    tokenizer.add_argument("--sample", type=int, default=500, help="number of corpus files to use")
+    tokenizer.add_argument("--repeat", type=int, default=3, help="runs per tokenizer, the best one is reported")
+    tokenizer.set_defaults(run=bench_tokenize)
+
+    seen_set = subparsers.add_parser("seen_set", help="memory and speed of the frontier seen set backends")
+    seen_set.add_argument("--sizes", default="1000000,10000000", help="comma separated numbers of urls")
+    seen_set.add_argument("--fp-samples", type=int, default=100000,
+                          help="never added urls looked up to measure the false positive rate")
+    seen_set.set_defaults(run=bench_seen_set)
+
+    http = subparsers.add_parser("http", help="throughput and politeness of the HTTP fetcher against a local stub "
+                                              "server of the corpus")
+    http.add_argument("corpus_dir", help="directory of the corpus files")
+    http.add_argument("--pages", type=int, default=1000, help="number of corpus urls to fetch")
+    http.add_argument("--rate", type=float, default=20.0, help="requests per second to a host")
+    http.add_argument("--burst", type=int, default=2, help="requests a host may get at once")
+    http.add_argument("--max-connections", type=int, default=8, help="most requests in flight at once")
+    http.add_argument("--threads", type=int, default=16, help="threads fetching urls")
+    http.add_argument("--latency", type=float, default=0.01, help="seconds the stub server takes per response")
+    http.add_argument("--robots", default=None, help="robots.txt the stub server serves for every host")
+    http.set_defaults(run=bench_http)
+
+    suite = subparsers.add_parser("suite", help="end to end and per component benchmarks on a synthetic corpus, "
+                                                "compared with a baseline")
+    suite.add_argument("--corpus-dir", default=None, help="benchmark this corpus instead of generating one")
+    suite.add_argument("--pages", type=int, default=2000, help="pages of the synthetic corpus")
+    suite.add_argument("--fan-out", type=int, default=10, help="links per synthetic page")
+    suite.add_argument("--trap-rate", type=float, default=0.05, help="probability of a link leading into a trap")
+    suite.add_argument("--page-words", type=int, default=400, help="words per synthetic page")
+    suite.add_argument("--seed", type=int, default=0, help="seed of the synthetic corpus")
+    suite.add_argument("--repeat", type=int, default=5, help="measurements per benchmark, the median is reported")
+    suite.add_argument("--min-time", type=float, default=1.0, metavar="SECONDS",
+                       help="a measurement runs its benchmark again until it took this long (default: %(default)s)")
+    suite.add_argument("--baseline", default="benchmark_baseline.json",
+                       help="results to compare with, written by the first run or with --save-baseline")
+    suite.add_argument("--save-baseline", action="store_true", help="replace the baseline with this run's results")
+    suite.add_argument("--output", default=None, help="also write this run's results to this json file")
+    suite.add_argument("--noise", type=float, default=3.0,
+                       help="a benchmark is flagged when it is slower than its baseline by more than this many "
+                            "standard errors of the measurements (default: %(default)s)")
+    suite.add_argument("--min-tolerance", type=float, default=0.05,
+                       help="fraction a benchmark may always be slower than its baseline (default: %(default)s)")
+    suite.set_defaults(run=bench_suite)
+
+    args = parser.parse_args()
+    if args.benchmark == "suite" and args.repeat < 2:
+        parser.error("suite needs --repeat 2 or more to measure the spread")
+    args.run(args)
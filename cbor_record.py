@@ -0,0 +1,223 @@
+import struct
+
+
+class CborError(ValueError):
+    pass
+
+
+# major types, see RFC 8949 section 3.1
+UNSIGNED, NEGATIVE, BYTES, TEXT, ARRAY, MAP, TAG, SIMPLE = range(8)
+BREAK = 0xff
+SIMPLE_VALUES = {20: False, 21: True, 22: None, 23: None}
+FLOAT_FORMATS = {25: ">e", 26: ">f", 27: ">d"}
+
+
+def _read_head(buf, pos):
+    """
+    Reads the head of the data item at pos. Returns its major type, its additional information, its argument (None for
+    indefinite lengths) and the position right after the head
+    """
+    try:
+        initial = buf[pos]
+    except IndexError:
+        raise CborError("unexpected end of data at {}".format(pos))
+    major = initial >> 5
+    info = initial & 0x1f
+    pos += 1
+    if info < 24:
+        return major, info, info, pos
+    if info == 31:
+        if major in (UNSIGNED, NEGATIVE, TAG):
+            raise CborError("indefinite length on major type {}".format(major))
+        return major, info, None, pos
+    if info > 27:
+        raise CborError("reserved additional information {}".format(info))
+    size = 1 << (info - 24)
+    if pos + size > len(buf):
+        raise CborError("unexpected end of data at {}".format(pos))
+    return major, info, int.from_bytes(buf[pos:pos + size], "big"), pos + size
+
+
+def skip(buf, pos):
+    """
+    Returns the position right after the data item starting at pos, without decoding it
+    """
+    major, info, arg, pos = _read_head(buf, pos)
+    if major in (BYTES, TEXT):
+        if arg is None:
+            while buf[pos] != BREAK:
+                pos = skip(buf, pos)
+            return pos + 1
+        if pos + arg > len(buf):
+            raise CborError("string runs past the end of data at {}".format(pos))
+        return pos + arg
+    if major in (ARRAY, MAP):
+        if arg is None:
+            while buf[pos] != BREAK:
+                pos = skip(buf, pos)
+            return pos + 1
+        for _ in range(arg * 2 if major == MAP else arg):
+            pos = skip(buf, pos)
+        return pos
+    if major == TAG:
+        return skip(buf, pos)
+    return pos
+
+
+def string_span(buf, pos):
+    """
+    Returns the start and end of the payload of the definite length byte or text string at pos, so it can be sliced out
+    of buf without decoding it. Returns None for other data items
+    """
+    major, info, arg, start = _read_head(buf, pos)
+    if major not in (BYTES, TEXT) or arg is None:
+        return None
+    return start, start + arg
+
+
+def decode(buf, pos):
+    """
+    Decodes the data item at pos. Returns the value and the position right after the item
+    """
+    major, info, arg, pos = _read_head(buf, pos)
+    if major == UNSIGNED:
+        return arg, pos
+    if major == NEGATIVE:
+        return -1 - arg, pos
+    if major in (BYTES, TEXT):
+        if arg is None:
+            chunks = []
+            while buf[pos] != BREAK:
+                chunk, pos = decode(buf, pos)
+                chunks.append(chunk)
+            value, pos = (b"" if major == BYTES else "").join(chunks), pos + 1
+        else:
+            if pos + arg > len(buf):
+                raise CborError("string runs past the end of data at {}".format(pos))
+            value, pos = bytes(buf[pos:pos + arg]), pos + arg
+            if major == TEXT:
+                value = value.decode("utf-8", errors="surrogateescape")
+        return value, pos
+    if major == ARRAY:
+        items = []
+        while (len(items) < arg) if arg is not None else (buf[pos] != BREAK):
+            item, pos = decode(buf, pos)
+            items.append(item)
+        return items, pos if arg is not None else pos + 1
+    if major == MAP:
+        items = {}
+        count = 0
+        while (count < arg) if arg is not None else (buf[pos] != BREAK):
+            key, pos = decode(buf, pos)
+            items[key if not isinstance(key, list) else tuple(key)], pos = decode(buf, pos)
+            count += 1
+        return items, pos if arg is not None else pos + 1
+    if major == TAG:
+        return decode(buf, pos)
+    # simple values and floats, for floats the argument holds the bits
+    if info in FLOAT_FORMATS:
+        return struct.unpack(FLOAT_FORMATS[info], arg.to_bytes(1 << (info - 24), "big"))[0], pos
+    return SIMPLE_VALUES.get(arg, arg), pos
+
+
+def _head(major, arg):
+    if arg < 24:
+        return bytes([major << 5 | arg])
+    for info, size in ((24, 1), (25, 2), (26, 4), (27, 8)):
+        if arg < 1 << (8 * size):
+            return bytes([major << 5 | info]) + arg.to_bytes(size, "big")
+    raise CborError("integer {} too large".format(arg))
+
+
+def encode(value) -> bytes:
+    """
+    Encodes None, booleans, integers, floats, bytes, str, lists, tuples and dicts into definite length cbor, the inverse
+    of decode. Used to write synthetic corpus records
+    """
+    if value is None:
+        return b"\xf6"
+    if value is True:
+        return b"\xf5"
+    if value is False:
+        return b"\xf4"
+    if isinstance(value, int):
+        return _head(UNSIGNED, value) if value >= 0 else _head(NEGATIVE, -1 - value)
+    if isinstance(value, float):
+        return b"\xfb" + struct.pack(">d", value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return _head(BYTES, len(value)) + bytes(value)
+    if isinstance(value, str):
+        data = value.encode("utf-8", errors="surrogateescape")
+        return _head(TEXT, len(data)) + data
+    if isinstance(value, (list, tuple)):
+        return _head(ARRAY, len(value)) + b"".join(encode(item) for item in value)
+    if isinstance(value, dict):
+        return _head(MAP, len(value)) + b"".join(encode(k) + encode(v) for k, v in value.items())
+    raise CborError("can't encode {}".format(type(value).__name__))
+
+
+class CborRecord:
+    """
+    Lazy view of a corpus record, a cbor map of field name -> {b'value': ...}. Creating the record only walks the top
+    level map to find where each field starts; a field is decoded when it is asked for, and the payload of a string field
+    can be sliced straight out of the underlying buffer (bytes, mmap or memoryview)
+    """
+
+    def __init__(self, buf):
+        self.buf = buf
+        self.fields = {}
+        major, info, count, pos = _read_head(buf, 0)
+        if major != MAP:
+            raise CborError("corpus record is not a map")
+        index = 0
+        while (index < count) if count is not None else (buf[pos] != BREAK):
+            key, pos = decode(buf, pos)
+            self.fields[key] = pos
+            pos = skip(buf, pos)
+            index += 1
+
+    def __contains__(self, field):
+        return field in self.fields
+
+    def _value_position(self, field):
+        """
+        Position of the b'value' entry of the field map, None if the field or its value is missing
+        """
+        pos = self.fields.get(field)
+        if pos is None:
+            return None
+        major, info, count, pos = _read_head(self.buf, pos)
+        if major != MAP:
+            return None
+        index = 0
+        while (index < count) if count is not None else (self.buf[pos] != BREAK):
+            key, pos = decode(self.buf, pos)
+            if key == b'value':
+                return pos
+            pos = skip(self.buf, pos)
+            index += 1
+        return None
+
+    def value(self, field, default=None):
+        """
+        Decodes the b'value' entry of a field
+        """
+        pos = self._value_position(field)
+        if pos is None:
+            return default
+        return decode(self.buf, pos)[0]
+
+    def value_span(self, field):
+        """
+        Start and end offsets in the buffer of a string field's b'value' payload, None if it is missing or isn't a
+        definite length string
+        """
+        pos = self._value_position(field)
+        if pos is None:
+            return None
+        return string_span(self.buf, pos)
+
+# ================
+# sources:
+# https://www.rfc-editor.org/rfc/rfc8949.html
+# https://docs.python.org/3/library/mmap.html
@@ -1,25 +1,37 @@
+from functools import lru_cache
 import hashlib
+import logging
+import mmap
 import os
-from urllib.parse import urlparse
 
-from cbor import cbor
+from cbor_record import CborRecord, CborError
+from corpus_index import CorpusIndex
+from fetcher import Fetcher
+from metrics import NULL_CLOCK
+from url_canonical import parse_url
 
+logger = logging.getLogger(__name__)
 
-class Corpus:
+
+class Corpus(Fetcher):
     """
     This class is responsible for handling corpus related functionalities like mapping a url to its local file name
     """
 
-    def __init__(self, corpus_base_dir):
+    def __init__(self, corpus_base_dir, use_index=True, url_cache_size=1 << 16):
         self.corpus_base_dir = os.path.join(corpus_base_dir, "")
+        # digests of the corpus files, so get_file_name doesn't have to stat the corpus directory for every link
+        self.index = CorpusIndex.load_or_build(self.corpus_base_dir) if use_index else None
+        # url -> digest memo, links are repeated across many pages
+        self.url_digest = lru_cache(maxsize=url_cache_size)(self._url_digest)
 
-    def get_file_name(self, url):
+    @staticmethod
+    def _url_digest(url):
         """
-        Given a url, this method looks up for a local file in the corpus and, if existed, returns the file address. Otherwise
-        returns None
+        Returns the sha224 digest of the normalized url (host, path without a trailing slash and query), or None if the
+        url can't be encoded
         """
-
-        pd = urlparse(url)
+        pd = parse_url(url)
         if pd.path:
             path = pd.path[:-1] if pd.path[-1] == "/" else pd.path
         else:
@@ -27,18 +39,34 @@ class Corpus:
         url = pd.netloc + path + (("?" + pd.query) if pd.query else "")
 
         try:
-            hashed_link = hashlib.sha224(url).hexdigest()
-        except (UnicodeEncodeError, TypeError):
-            try:
-                hashed_link = hashlib.sha224(url.encode("utf-8")).hexdigest()
-            except UnicodeEncodeError:
-                hashed_link = str(hash(url))
+            return hashlib.sha224(url.encode("utf-8")).digest()
+        except UnicodeEncodeError:
+            return None
+
+    def get_file_name(self, url):
+        """
+        Given a url, this method looks up for a local file in the corpus and, if existed, returns the file address. Otherwise
+        returns None
+        """
+        digest = self.url_digest(url)
+        if digest is None:
+            hashed_link = str(hash(url))
+        elif self.index is not None:
+            return os.path.join(self.corpus_base_dir, digest.hex()) if digest in self.index else None
+        else:
+            hashed_link = digest.hex()
 
         if os.path.exists(os.path.join(self.corpus_base_dir, hashed_link)):
             return os.path.join(self.corpus_base_dir, hashed_link)
         return None
 
-    def fetch_url(self, url):
+    def can_fetch(self, url):
+        """
+        Whether the corpus has a file for url, only those urls go to the frontier
+        """
+        return self.get_file_name(url) is not None
+
+    def fetch_url(self, url, html_only=False, clock=NULL_CLOCK):
         """
         This method, using the given url, should find the corresponding file in the corpus and return a dictionary representing
         the repsonse to the given url. The dictionary contains the following keys:
@@ -52,45 +80,83 @@ class Corpus:
         final_url: the final url after all of the redirections. None if there was no redirection.
 
         :param url: the url to be fetched
+        :param html_only: if true, content is None for error responses and non html pages and their body is never read
+        :param clock: metrics.StageClock timing the file lookup and the record read
         :return: a dictionary containing the http response for the given url
         """
 
         file_name = self.get_file_name(url)
+        clock.lap("lookup")
         if file_name is None:
-            url_data = {
-                "url": url,
-                "content": None,
-                "http_code": 404,
-                "headers": None,
-                "size": 0,
-                "content_type": None,
-                "is_redirected": False,
-                "final_url": None
-            }
+            url_data = self.missing_url_data(url)
         else:
-            data_dict = cbor.load(open(file_name, "rb"))
-
-            def get_content_type(data):
-                if b'http_headers' not in data: return None
-
-                hlist = data_dict[b"http_headers"][b'value']
-                for header in hlist:
-                    if header[b'k'][b'value'] == b'Content-Type':
-                        return str(header[b'v'][b'value'])
-                return None
-
-            url_data = {
-                "url": url,
-                "content": data_dict[b'raw_content'][b'value'] if b'raw_content' in data_dict and b'value' in data_dict[b'raw_content'] else "",
-                "http_code": int(data_dict[b"http_code"][b'value']),
-                "content_type": get_content_type(data_dict),
-                "size": os.stat(file_name).st_size,
-                "is_redirected": data_dict[b'is_redirected'][b'value'] if b'is_redirected' in data_dict and b'value' in data_dict[b'is_redirected'] else False,
-                "final_url": data_dict[b'final_url'][b'value'] if b'final_url' in data_dict and b'value' in data_dict[b'final_url'] else None
-            }
+            url_data = self.read_file(url, file_name, html_only=html_only)
+        clock.lap("read")
         # if 'rules' in url or 'cite' in url or 'cites' in url:
         #     print(url, file_name.split('/')[-1])
 
         # print(file_name,'==',url)
         # print(url_data)
         return url_data
+
+    @staticmethod
+    def missing_url_data(url):
+        return {
+            "url": url,
+            "content": None,
+            "http_code": 404,
+            "headers": None,
+            "size": 0,
+            "content_type": None,
+            "is_redirected": False,
+            "final_url": None
+        }
+
+    def read_file(self, url, file_name, html_only=False):
+        """
+        Decodes a corpus file into the url_data dictionary described in fetch_url. The file is memory mapped and only the
+        fields in url_data are decoded; the other fields are skipped over, and raw_content is sliced out of the mapping in
+        a single copy, or not at all if html_only is set and the response is an error or not html
+        """
+        with open(file_name, "rb") as f:
+            try:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # empty file, nothing to map
+                return self.missing_url_data(url)
+        with mapped:
+            try:
+                record = CborRecord(mapped)
+                http_code = int(record.value(b'http_code'))
+                content_type = self.get_content_type(record)
+                if html_only and (http_code in range(400, 600) or 'text/html' not in str(content_type)):
+                    content = None
+                else:
+                    span = record.value_span(b'raw_content')
+                    if span is not None:
+                        content = mapped[span[0]:span[1]]
+                    else:
+                        content = record.value(b'raw_content', "")
+                url_data = {
+                    "url": url,
+                    "content": content,
+                    "http_code": http_code,
+                    "content_type": content_type,
+                    "size": len(mapped),
+                    "is_redirected": record.value(b'is_redirected', False),
+                    "final_url": record.value(b'final_url')
+                }
+            except (CborError, IndexError, KeyError, TypeError, ValueError) as e:
+                logger.warning("Could not decode corpus file %s for %s: %s", file_name, url, e)
+                return self.missing_url_data(url)
+        return url_data
+
+    @staticmethod
+    def get_content_type(record):
+        hlist = record.value(b'http_headers')
+        if not hlist:
+            return None
+        for header in hlist:
+            if header[b'k'][b'value'] == b'Content-Type':
+                return str(header[b'v'][b'value'])
+        return None
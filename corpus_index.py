@@ -0,0 +1,121 @@
+import json
+import logging
+import os
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CorpusIndex:
+    """
+    The set of files of a corpus directory, kept as raw sha224 digests (the corpus file names are their hex form) so that
+    checking whether a url exists in the corpus is a set lookup instead of a stat call. The index is saved to disk and
+    reused by later runs and by worker processes until the corpus directory changes
+
+    Attributes:
+        digests: set of the 28 byte digests of the corpus files
+        build_seconds: time spent listing the corpus directory, 0 if the index was loaded from disk
+        load_seconds: time spent loading the saved index, 0 if it was built
+    """
+
+    INDEX_FILE_NAME = os.path.join(".", "corpus_index.bin")
+    MAGIC = b"corpus-index-1\n"
+    DIGEST_SIZE = 28
+
+    def __init__(self, digests):
+        self.digests = digests
+        self.build_seconds = 0.0
+        self.load_seconds = 0.0
+
+    def __contains__(self, digest):
+        return digest in self.digests
+
+    def __len__(self):
+        return len(self.digests)
+
+    @staticmethod
+    def directory_signature(corpus_dir):
+        """
+        Identifies a version of the corpus directory, adding or removing files changes its mtime
+        """
+        return {"corpus_dir": os.path.abspath(corpus_dir), "mtime_ns": os.stat(corpus_dir).st_mtime_ns}
+
+    @classmethod
+    def build(cls, corpus_dir):
+        start = time.perf_counter()
+        digests = set()
+        with os.scandir(corpus_dir) as entries:
+            for entry in entries:
+                if len(entry.name) == 2 * cls.DIGEST_SIZE:
+                    try:
+                        digests.add(bytes.fromhex(entry.name))
+                    except ValueError:
+                        pass
+        index = cls(digests)
+        index.build_seconds = time.perf_counter() - start
+        return index
+
+    def save(self, corpus_dir, index_file=INDEX_FILE_NAME):
+        """
+        Writes the index as a json header line followed by the sorted digests. The file is written under a temporary
+        name of its own and renamed, so readers never see a partial index, also when worker or shard processes save it
+        at the same time
+        """
+        header = dict(self.directory_signature(corpus_dir), files=len(self.digests))
+        fd, temp_file = tempfile.mkstemp(prefix=os.path.basename(index_file) + ".", suffix=".tmp",
+                                         dir=os.path.dirname(index_file) or ".")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.MAGIC)
+                f.write(json.dumps(header).encode() + b"\n")
+                f.write(b"".join(sorted(self.digests)))
+            os.replace(temp_file, index_file)
+        except BaseException:
+            try:
+                os.remove(temp_file)
+            except OSError:
+                pass
+            raise
+
+    @classmethod
+    def load(cls, corpus_dir, index_file=INDEX_FILE_NAME):
+        """
+        Loads a saved index, returns None if there is none or it was built for another version of the corpus directory
+        """
+        start = time.perf_counter()
+        try:
+            with open(index_file, "rb") as f:
+                if f.readline() != cls.MAGIC:
+                    return None
+                header = json.loads(f.readline())
+                data = f.read()
+        except (OSError, ValueError):
+            return None
+        signature = cls.directory_signature(corpus_dir)
+        if any(header.get(k) != v for k, v in signature.items()) or len(data) != header["files"] * cls.DIGEST_SIZE:
+            return None
+        size = cls.DIGEST_SIZE
+        index = cls({data[i:i + size] for i in range(0, len(data), size)})
+        index.load_seconds = time.perf_counter() - start
+        return index
+
+    @classmethod
+    def load_or_build(cls, corpus_dir, index_file=INDEX_FILE_NAME):
+        index = cls.load(corpus_dir, index_file)
+        if index is not None:
+            logger.info("Loaded corpus index of %s files in %.3fs", len(index), index.load_seconds)
+            return index
+        index = cls.build(corpus_dir)
+        logger.info("Built corpus index of %s files in %.3fs", len(index), index.build_seconds)
+        try:
+            index.save(corpus_dir, index_file)
+        except OSError as e:
+            logger.warning("Could not save the corpus index: %s", e)
+        return index
+
+# ================
+# sources:
+# https://docs.python.org/3/library/os.html#os.scandir
+# https://docs.python.org/3/library/os.html#os.replace
+# https://docs.python.org/3/library/tempfile.html#tempfile.mkstemp
@@ -1,100 +1,124 @@
+import json
 import logging
-import re
-from urllib.parse import urlparse, parse_qs
-from bs4 import BeautifulSoup
 from urllib.parse import urljoin
-import tldextract
-import string
-from collections import defaultdict
+from collections import Counter
 
-from PartA import tokenize, tokenize_file, compute_word_frequencies
+from analytics import CrawlAnalytics
+from corpus import Corpus
+from crawler_tables import CrawlerTables
+from near_duplicates import simhash
+from metrics import NULL_CLOCK, NULL_METRICS, StageClock
+from page_analysis import analyze_html
+from prefetch import Prefetcher
+from public_suffix import PublicSuffixList
+from url_filter import DEFAULT_RULES, UrlFilter
 
 logger = logging.getLogger(__name__)
 
 
+class PageResult:
+    """
+    The outcome of fetching and parsing a single page. It is produced by Crawler.process_url, possibly inside a worker
+    process, and folded into the crawler analytics by Crawler.merge_page_result
+
+    Attributes:
+        url: the fetched url
+        is_valid: whether the page itself passed is_valid and counts as a downloaded page
+        outlinks: absolute outlinks of the page that passed is_valid
+        frontier_links: the outlinks that also exist in the corpus, to be added to the frontier
+        word_count: number of tokens in the page text
+        word_frequencies: non stop word frequencies of the page text
+        subdomain: subdomain of the url as computed by public_suffix, the way tldextract computes it
+        trap_urls: urls rejected by is_valid while parsing the page, mapped to the reason they were rejected
+        simhash: SimHash fingerprint of the page text, None unless the crawler looks for near duplicates
+        duplicate_of: url of an earlier page this page is a near duplicate of, None if it isn't one
+        timings: stage -> seconds spent on the page (see metrics.STAGES), None unless the crawler measures stages
+        tokens: every token of the page text, None unless the crawler indexes pages
+        file_signature: (size, mtime_ns, digest) of the corpus file of the page when the crawler's page store has to be
+            updated with the page, None otherwise
+        from_store: whether the page analysis was taken from the page store instead of parsing the page
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.is_valid = False
+        self.outlinks: list = list()
+        self.frontier_links: list = list()
+        self.word_count = 0
+        self.word_frequencies: dict = {}
+        self.subdomain = None
+        self.trap_urls: dict = {}
+        self.simhash = None
+        self.duplicate_of = None
+        self.timings = None
+        self.tokens = None
+        self.file_signature = None
+        self.from_store = False
+
+
 class Crawler:
     """
     This class is responsible for scraping urls from the next available link in frontier and adding the scraped links to
     the frontier
     """
 
-    def __init__(self, frontier, corpus):
+    # how many urls are handed to the worker pool per batch (times the number of workers) and per task
+    WORKER_BATCH_FACTOR = 32
+    WORKER_CHUNK_SIZE = 8
+    # pages with fewer tokens are too short to be told apart by their fingerprint and are never near duplicates
+    MIN_FINGERPRINT_TOKENS = 30
+
+    def __init__(self, frontier, corpus, workers=1, analytics=None, near_duplicates=None, fingerprint_pages=False,
+                 trap_detector=None, prefetch_depth=0, prefetch_threads=4, metrics=None, measure_stages=False,
+                 index_pages=False, page_store=None):
         self.frontier = frontier
+        # fetcher.Fetcher the pages come from, the local corpus or a fetcher.HttpFetcher
         self.corpus = corpus
-        # subdomains that it visited, how many different URLs it has
-        # processed from each of those subdomains.
-        self.url_count_per_subdomain = defaultdict(int)
-        self.valid_outlink_page_count = defaultdict(int)
-        self.valid_urls: list = list()
-        self.trap_urls: set = set()
-        self.page_word_counts = defaultdict(int)
-        # a single url_data dict of the previous link visited
-        self.url_data_buffer: dict = {}
-
-        self.stop_words = tokenize_file('stop_words.txt')
-        self.stop_words.extend(list(string.ascii_letters))
-        self.stop_words = sorted(set(self.stop_words))
-        self.top_fifty_frequency_words = defaultdict(int)
-
-        self.common_web_file_exts: list = [
-            "html", "htm", "css",'rss',"js","jsx","less","scss","wasm",
-            "php",'shtml','xhtml','asp','asx'
-          ]
+        # number of processes fetching and parsing pages, 1 crawls in this process
+        self.workers = workers
+        # NearDuplicateIndex of the pages crawled so far, near duplicate pages are counted as downloaded but their words
+        # and outlinks are skipped
+        self.near_duplicates = near_duplicates
+        self.fingerprint_pages = fingerprint_pages or near_duplicates is not None
+        # TrapDetector deciding on new frontier urls from what was crawled so far, on top of the fixed url_filter rules
+        self.trap_detector = trap_detector
+        # with a serial crawl, number of frontier urls whose corpus records are read ahead by prefetch_threads threads
+        self.prefetch_depth = prefetch_depth
+        self.prefetch_threads = prefetch_threads
+        # metrics.Metrics fed with every merged page, pages are only timed stage by stage when there is one
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+        self.measure_stages = measure_stages or self.metrics.enabled
+        # subdomains visited, page with most outlinks, longest page, valid and trap urls and word frequencies
+        self.analytics = analytics if analytics is not None else CrawlAnalytics()
+        # valid pages keep their tokens for the analytics' search index
+        self.index_pages = index_pages or self.analytics.search_index is not None
+
+        # stop words and public suffix rules, loaded from a cache that is rebuilt when stop_words.txt changes
+        tables = CrawlerTables.load_or_build('stop_words.txt')
+        self.stop_words = tables.stop_words
+        self.suffixes = PublicSuffixList(tables.suffix_rules)
+
+        # the rules is_valid applies, url_filter.DEFAULT_RULES
+        self.url_filter = UrlFilter()
+
+        # page_store.PageStore of the previous crawls, pages whose corpus file didn't change aren't parsed again
+        self.page_store = page_store
+        if page_store is not None:
+            page_store.check_settings(self.page_store_settings())
 
     def get_subdomain(self, url):  # 1
-        sub = tldextract.extract(url)
-        if sub.subdomain in self.url_count_per_subdomain:
-            self.url_count_per_subdomain[sub.subdomain] += 1
-        else:
-            self.url_count_per_subdomain[sub.subdomain] = 1
-
-    def mostCommonWords(self, soup):  # 5
-        words = tokenize(soup.get_text())
-        for word in words:
-            if str(word).isalpha():
-                if str(word).lower() not in self.stop_words:
-                    self.top_fifty_frequency_words[word] += 1
-
-    def findLongestPage(self, url, soup):  # 4
-        num_words = len(tokenize(soup.get_text()))
-        self.page_word_counts[url] += num_words
+        self.analytics.count_subdomain(self.subdomain_of(url))
+
+    def subdomain_of(self, url):
+        return self.suffixes.subdomain(url)
 
     def write_analytics(self):
         try:
             print("writing analytics...")
-            self.valid_urls = sorted(self.valid_urls)
-            self.trap_urls = sorted(self.trap_urls)
-            with open('valid_urls.txt', 'w') as valid_file:
-                for c in self.valid_urls:
-                    valid_file.write("{}\n".format(c))
-            with open('trapped_urls.txt', 'w') as trap_file:
-                for t in self.trap_urls:
-                    trap_file.write("{}\n".format(t))            
-
-            analytics_file = open('analytics.txt', 'w')
-            analytics_file.write("(1) number of urls processed for all visited subdomains:\n\n")
-            for k, v in self.url_count_per_subdomain.items():
-                analytics_file.write("{}: {}\n".format(str(k), str(v)))
-
-            analytics_file.write("\n(2) page with most valid outlinks:\n\n")
-            max_links = max(self.valid_outlink_page_count, key=self.valid_outlink_page_count.get)
-            analytics_file.write(
-                "{} has {} valid outlinks\n".format(str(max_links), str(self.valid_outlink_page_count[max_links])))
-
-            analytics_file.write("\n(3) list of downloaded URLs and identified traps:\n\n")
-            analytics_file.write("see trapped URLs in trapped_urls.txt and valid URLs in valid_urls.txt\n")
-
-            analytics_file.write("\n(4) page with highest word count:\n\n")
-            longest_page = max(self.page_word_counts, key=self.page_word_counts.get)
-            analytics_file.write(
-                "{} has {} words\n".format(str(longest_page), str(self.page_word_counts[longest_page])))
-
-            analytics_file.write("\n(5) top 50 common words across all pages\n\n")
-            sorted_top50 = sorted(self.top_fifty_frequency_words.items(), key=lambda x: x[1], reverse=True)[:50]
-            for i, s in enumerate(sorted_top50):
-                analytics_file.write('{}: {}\n'.format(str(i + 1), str(s)))
-
-            analytics_file.close()
+            if self.near_duplicates is not None:
+                self.near_duplicates.write_report(
+                    self.analytics.output_file(self.near_duplicates.NEAR_DUPLICATES_FILE_NAME))
+            self.analytics.finish()
             print('\nanalytics written')
         except ValueError:
             print('possibly empty corpus')
@@ -104,15 +128,148 @@ class Crawler:
         This method starts the crawling process which is scraping urls from the next available link in frontier and adding
         the scraped links to the frontier
         """
+        if self.workers > 1:
+            self.crawl_in_parallel()
+            return
+        if self.prefetch_depth > 0:
+            self.crawl_with_prefetch()
+            return
         while self.frontier.has_next_url():
             url = self.frontier.get_next_url()
             # logger.info("Fetching URL %s ... Fetched: %s, Queue size: %s", url, self.frontier.fetched, len(self.frontier))
-            url_data = self.corpus.fetch_url(url)
+            self.merge_page_result(self.process_url(url))
+
+    def crawl_with_prefetch(self):
+        """
+        Crawls in this process while a Prefetcher reads the corpus records of the next frontier urls on threads. Links
+        are added to the tail of the frontier, so with the fifo scheduler pages are visited exactly like without prefetch
+        """
+        prefetcher = Prefetcher(lambda url: self.corpus.fetch_url(url, html_only=True), self.prefetch_depth,
+                                self.prefetch_threads)
+        for url, url_data in prefetcher.records(self.frontier):
+            self.merge_page_result(self.process_url(url, url_data))
+        logger.info("Prefetch: %s", prefetcher.stats())
+
+    def crawl_in_parallel(self):
+        """
+        Crawls with a pool of worker processes. Workers fetch and parse pages (process_url) while this process keeps
+        owning the frontier and the analytics. Urls are handed out in batches taken from the head of the frontier and the
+        results are merged back in frontier order, so the crawl visits and counts pages exactly like a serial run would
+        """
+        import multiprocessing
+
+        batch_size = self.workers * self.WORKER_BATCH_FACTOR
+        with multiprocessing.Pool(self.workers, initializer=_init_worker,
+                                  initargs=(self.corpus.corpus_base_dir, self.worker_options())) as pool:
+            while self.frontier.has_next_url():
+                batch = []
+                while self.frontier.has_next_url() and len(batch) < batch_size:
+                    batch.append(self.frontier.get_next_url())
+                for page in pool.imap(_process_url, batch, chunksize=self.WORKER_CHUNK_SIZE):
+                    self.merge_page_result(page)
+            logger.info("Parallel crawl finished. Fetched: %s", self.frontier.fetched)
+
+    def worker_options(self):
+        """
+        Crawler arguments for the crawlers of the worker processes, which only fetch and analyze pages
+        """
+        return {"fingerprint_pages": self.fingerprint_pages, "measure_stages": self.measure_stages,
+                "index_pages": self.index_pages, "page_store": self.page_store}
+
+    def new_clock(self):
+        return StageClock() if self.measure_stages else NULL_CLOCK
+
+    def process_url(self, url, url_data=None):
+        """
+        Fetches a single url, unless its url_data was already fetched, and analyzes it without touching the frontier or
+        the crawler wide analytics, which makes it safe to run inside a worker process. With a page store, a page whose
+        corpus file didn't change since it was stored is taken from the store instead. Returns a PageResult, see
+        merge_page_result
+        """
+        clock = self.new_clock()
+        page = None
+        file_signature = None
+        if self.page_store is not None:
+            state, file_signature = self.page_store.lookup(url, self.corpus.get_file_name(url))
+            clock.lap("store")
+            if state is not None:
+                page = PageResult(url)
+                page.__dict__.update(state)
+                page.from_store = True
+        if page is None:
+            if url_data is None:
+                url_data = self.corpus.fetch_url(url, html_only=True, clock=clock)
+            page = self.analyze_page(url_data, clock)
+        page.file_signature = file_signature
+        # links are checked against the corpus of this crawl, a refreshed corpus may have gained or lost their files
+        for next_link in page.outlinks:
+            if self.corpus.can_fetch(next_link):
+                page.frontier_links.append(next_link)
+        clock.lap("exists")
+        page.timings = clock.timings
+        return page
+
+    def page_store_settings(self):
+        """
+        Everything the analysis of a page depends on besides the page, the page store is emptied when it changes
+        """
+        return json.dumps({"rules": DEFAULT_RULES, "stop_words": sorted(self.stop_words),
+                           "fingerprint_pages": self.fingerprint_pages,
+                           "min_fingerprint_tokens": self.MIN_FINGERPRINT_TOKENS, "index_pages": self.index_pages},
+                          sort_keys=True)
 
-            for next_link in self.extract_next_links(url_data):
-                if self.is_valid(next_link):
-                    if self.corpus.get_file_name(next_link) is not None:
-                        self.frontier.add_url(next_link)
+    @staticmethod
+    def stored_state(page):
+        """
+        The attributes of a PageResult that the page store keeps, the ones that only depend on the page and its file
+        """
+        return dict(vars(page), frontier_links=[], duplicate_of=None, timings=None, file_signature=None,
+                    from_store=False)
+
+    def merge_page_result(self, page):
+        """
+        Folds a PageResult into the analytics and adds its links to the frontier
+        """
+        clock = self.metrics.clock()
+        self.record_page(page)
+        if self.page_store is not None:
+            self.page_store.record(page, self.stored_state(page))
+        for trap_url in page.trap_urls:
+            self.frontier.record_trap(trap_url)
+        if page.duplicate_of is None:
+            self.add_links(page.frontier_links)
+        self.frontier.mark_fetched(page.url)
+        clock.lap("merge")
+        self.metrics.record_page(page, clock)
+
+    def add_links(self, urls):
+        """
+        Adds the links found on a page to the frontier, minus the ones the trap detector rejects
+        """
+        if self.trap_detector is None:
+            for next_link in urls:
+                self.frontier.add_url(next_link)
+            return
+        detected_traps = {}
+        for next_link in urls:
+            if self.frontier.is_duplicate(next_link):
+                continue
+            reason = self.trap_detector.check(next_link)
+            if reason is None:
+                self.frontier.add_url(next_link)
+            else:
+                detected_traps[next_link] = reason
+                self.frontier.record_trap(next_link)
+                # a rejected url is seen, it isn't offered again by every page that links to it
+                self.frontier.add_rejected(next_link)
+        self.analytics.record_traps(detected_traps)
+
+    def record_page(self, page):
+        if self.near_duplicates is not None and page.simhash is not None:
+            page.duplicate_of = self.near_duplicates.find_or_add(page.simhash, page.url)
+        if self.trap_detector is not None:
+            self.trap_detector.record_page(page)
+        self.analytics.record_page(page)
 
     def extract_next_links(self, url_data) -> list:
         """
@@ -124,27 +281,37 @@ class Crawler:
 
         Suggested library: lxml
         """
-        outputLinks = list()
+        page = self.analyze_page(url_data)
+        self.record_page(page)
+        return page.outlinks
+
+    def analyze_page(self, url_data, clock=NULL_CLOCK):
+        """
+        Parses a fetched page into a PageResult holding its valid outlinks, word statistics and the trap urls seen on it
+        """
+        url = url_data['url']
+        page = PageResult(url)
         if not ((url_data['content'] is None) or (url_data['size'] == 0) or (url_data['http_code'] in range(400, 600))
                 or 'text/html' not in str(url_data['content_type']) or 'index of' in str(url_data['content'].lower()) ):
             #or 'iso' in str(url_data['content_type']).lower()):
             # or (not url_data['is_redirected'] and url == url_data['final_url']) ):
-            url = url_data['url']
-            soup = BeautifulSoup(url_data['content'], "lxml")
-            for link in soup.findAll('a'):
-                if url_data['is_redirected']:
-                    outputLink = urljoin(url_data['final_url'], link.get('href'))
-                else:
-                    outputLink = urljoin(url_data['url'], link.get('href'))
-                if self.is_valid(outputLink):
-                    outputLinks.append(outputLink)
-                    self.valid_outlink_page_count[url] += 1
-            if self.is_valid(url):
-                self.valid_urls.append(url)
-                self.findLongestPage(url, soup=soup)  # 4
-                self.mostCommonWords(soup=soup)  # 5
-                self.get_subdomain(url)
-        return outputLinks
+            # a single pass over the document gives the anchors, the word count and the word frequencies
+            analysis = analyze_html(url_data['content'], self.stop_words, clock)
+            base_url = url_data['final_url'] if url_data['is_redirected'] else url
+            page.outlinks, rejected = self.url_filter.filter_links([urljoin(base_url, href) for href in analysis.hrefs])
+            page.trap_urls.update(rejected)
+            clock.lap("filter")
+            if self.check_url(url, page.trap_urls):
+                page.is_valid = True
+                page.word_count = analysis.word_count  # 4
+                page.word_frequencies = analysis.word_frequencies  # 5
+                page.subdomain = self.subdomain_of(url)  # 1
+                if self.index_pages:
+                    page.tokens = analysis.tokens
+                if self.fingerprint_pages and len(analysis.tokens) >= self.MIN_FINGERPRINT_TOKENS:
+                    page.simhash = simhash(Counter(token.lower() for token in analysis.tokens))
+                    clock.lap("simhash")
+        return page
 
     def is_valid(self, url):
         """
@@ -152,55 +319,35 @@ class Crawler:
         filter out crawler traps. Duplicated urls will be taken care of by frontier. You don't need to check for duplication
         in this method
         """
-        parsed = urlparse(url)
-        if parsed.scheme not in set(["http", "https"]):
-            self.trap_urls.add(url)
-            return False
-        try:
-            if len(url) > 100:
-                self.trap_urls.add(url)
-                return False
-
-            # various directory and query arguments filtered for multiple reasons, such as:
-            # pound sign indicating elements/positions all on the same page
-            if '#' in url:
-                self.trap_urls.add(url)
-                return False
-
-            if '/pix/' in url:  # or ('/cite/' in url) or ('/cites/' in url) or ('/rules/' in url) ):
-                self.trap_urls.add(url)
-                return False
-
-            if str(parsed.hostname).split('.')[-3:] != ['ics', 'uci', 'edu']:
-                self.trap_urls.add(url)
-                return False
-
-            if ('=login' in url) or ('action=' in url):  # or ('do=' in url)):
-                self.trap_urls.add(url)
-                return False
-
-            # repeating patterns
-            pattern = re.compile(r"(.)(/{2,})(.*)")  # repeating patterns
-            match = pattern.search(parsed.path)
-            if match:
-                self.trap_urls.add(url)
-                return False
-
-            # if (re.match(".*\.(css|js|bmp|gif|jpe?g|ico" + "|png|tiff?|mid|mp2|mp3|mp4" \
-            #                         + "|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf" \
-            #                         + "|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso|epub|dll|cnf|tgz|sha1" \
-            #                         + "|thmx|mso|arff|rtf|jar|csv" \
-            #                         + "|rm|smil|wmv|swf|wma|zip|rar|gz" \
-            #                         + "|bam|ply|mexw|bw|motif|pickle|mexmaci|svg|sh)$", parsed.path.lower())):
-            # return False
-            if (re.match('.*\.('+'|'.join(self.common_web_file_exts)+')$', parsed.path.lower())) or '.' not in parsed.path.lower():
-                return True
-            else:
-                self.trap_urls.add(url)
-                return False
-        except TypeError:
-            print("TypeError for ", parsed)
-            return False
+        trap_urls = {}
+        valid = self.check_url(url, trap_urls)
+        self.analytics.record_traps(trap_urls)
+        return valid
+
+    def check_url(self, url, trap_urls):
+        """
+        is_valid, recording a rejected url and the reason it was rejected into the given trap_urls dict. The trap rules
+        (fragments, /pix/, login and action pages, repeated slashes, off domain hosts, long urls and non web file
+        extensions) live in url_filter.DEFAULT_RULES
+        """
+        reason = self.url_filter.verdict(url)
+        if reason is None:
+            return True
+        trap_urls[url] = reason
+        return False
+
+
+# state of a worker process in the parallel crawl, see Crawler.crawl_in_parallel
+_worker_crawler = None
+
+
+def _init_worker(corpus_base_dir, options):
+    global _worker_crawler
+    _worker_crawler = Crawler(None, Corpus(corpus_base_dir), **options)
+
+
+def _process_url(url):
+    return _worker_crawler.process_url(url)
 
 # ================
 # sources:
@@ -231,4 +378,5 @@ class Crawler:
 # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Content-Type
 # https://stackoverflow.com/questions/30997420/what-are-fragment-urls-and-why-to-use-them#:~:text=A%20fragment%20is%20an%20internal,name%20attribute%20matching%20the%20fragment.
 # https://github.com/dyne/file-extension-list/blob/master/pub/categories.json
-# https://www.freecodecamp.org/news/python-list-to-string-join-example/
\ No newline at end of file
+# https://www.freecodecamp.org/news/python-list-to-string-join-example/
+# https://docs.python.org/3/library/multiprocessing.html#module-multiprocessing.pool
\ No newline at end of file
@@ -0,0 +1,112 @@
+import logging
+import os
+import pickle
+import string
+import tempfile
+import time
+
+from PartA import tokenize_file
+import public_suffix
+
+logger = logging.getLogger(__name__)
+
+
+class CrawlerTables:
+    """
+    The lookup tables every crawler process starts with: the stop words (stop_words.txt plus the single letters) and the
+    public suffix rules get_subdomain splits hosts with. They are built from their source files once and saved as a
+    pickle that later runs and worker processes load instead, until a source file changes
+
+    Attributes:
+        stop_words: frozenset of lowercase stop words
+        suffix_rules: public suffix trie, see public_suffix.parse_rules
+        load_seconds: time spent loading or building the tables
+        loaded: whether the tables came from the saved file
+    """
+
+    TABLES_FILE_NAME = os.path.join(".", "crawler_tables.pickle")
+    VERSION = 1
+
+    def __init__(self, stop_words, suffix_rules):
+        self.stop_words = stop_words
+        self.suffix_rules = suffix_rules
+        self.load_seconds = 0.0
+        self.loaded = False
+
+    @staticmethod
+    def sources_signature(stop_words_file, suffix_list_file):
+        """
+        Identifies the versions of the source files, None if one of them is missing
+        """
+        signature = {"version": CrawlerTables.VERSION}
+        for name, path in (("stop_words", stop_words_file), ("suffix_list", suffix_list_file)):
+            try:
+                stat = os.stat(path)
+            except (OSError, TypeError):
+                return None
+            signature[name] = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        return signature
+
+    @classmethod
+    def build(cls, stop_words_file, suffix_list_file):
+        stop_words = frozenset(tokenize_file(stop_words_file)) | frozenset(string.ascii_letters)
+        with open(suffix_list_file, encoding="utf-8") as f:
+            return cls(stop_words, public_suffix.parse_rules(f.read()))
+
+    def save(self, signature, tables_file=TABLES_FILE_NAME):
+        """
+        Pickles the tables to a temporary file of their own and renames it, so worker and shard processes saving them at
+        the same time never see or rename each other's partial files
+        """
+        fd, temp_file = tempfile.mkstemp(prefix=os.path.basename(tables_file) + ".", suffix=".tmp",
+                                         dir=os.path.dirname(tables_file) or ".")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump((signature, self.stop_words, self.suffix_rules), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_file, tables_file)
+        except BaseException:
+            try:
+                os.remove(temp_file)
+            except OSError:
+                pass
+            raise
+
+    @classmethod
+    def load(cls, signature, tables_file=TABLES_FILE_NAME):
+        """
+        Loads the saved tables, None if there are none or they were built from other versions of the source files
+        """
+        try:
+            with open(tables_file, "rb") as f:
+                saved_signature, stop_words, suffix_rules = pickle.load(f)
+        except (OSError, ValueError, EOFError, pickle.UnpicklingError):
+            return None
+        if saved_signature != signature:
+            return None
+        tables = cls(stop_words, suffix_rules)
+        tables.loaded = True
+        return tables
+
+    @classmethod
+    def load_or_build(cls, stop_words_file="stop_words.txt", suffix_list_file=public_suffix.SUFFIX_LIST_FILE_NAME,
+                      tables_file=TABLES_FILE_NAME):
+        start = time.perf_counter()
+        signature = cls.sources_signature(stop_words_file, suffix_list_file)
+        # a missing stop words or public suffix list file ends the crawl while building, like it always has
+        tables = cls.load(signature, tables_file) if signature is not None else None
+        if tables is None:
+            tables = cls.build(stop_words_file, suffix_list_file)
+            if signature is not None:
+                try:
+                    tables.save(signature, tables_file)
+                except OSError as e:
+                    logger.warning("Could not save the crawler tables: %s", e)
+        tables.load_seconds = time.perf_counter() - start
+        logger.debug("%s crawler tables in %.3fs", "Loaded" if tables.loaded else "Built", tables.load_seconds)
+        return tables
+
+# ================
+# sources:
+# https://docs.python.org/3/library/pickle.html
+# https://docs.python.org/3/library/os.html#os.stat_result.st_mtime_ns
+# https://docs.python.org/3/library/tempfile.html#tempfile.mkstemp
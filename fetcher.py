@@ -0,0 +1,368 @@
+from collections import OrderedDict
+import logging
+import math
+import threading
+import time
+from urllib.parse import quote, urljoin
+
+from metrics import NULL_CLOCK
+from url_canonical import parse_url
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "IR UW23 crawler"
+REDIRECT_CODES = frozenset([301, 302, 303, 307, 308])
+# printable ascii, the request target keeps its existing escapes and only spaces and non ascii characters are quoted
+TARGET_SAFE_CHARS = "".join(chr(c) for c in range(0x21, 0x7f))
+# an unwanted body up to this size is read and dropped to keep the connection alive, a bigger one closes it
+DRAIN_BYTES = 64 * 1024
+
+
+class Fetcher:
+    """
+    Where the crawler gets pages from. corpus.Corpus reads them from the offline corpus, HttpFetcher downloads them
+
+    fetch_url returns the url_data dict documented on Corpus.fetch_url; can_fetch tells whether a link may go to the
+    frontier at all (it is in the corpus, or robots.txt allows it)
+    """
+
+    def fetch_url(self, url, html_only=False, clock=NULL_CLOCK):
+        raise NotImplementedError
+
+    def can_fetch(self, url):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+def crawl_delay(lines, user_agent):
+    """
+    Crawl-delay in seconds of the robots.txt group that applies to user_agent, picked like RobotFileParser picks the
+    group of its rules, None if the group has none. Unlike RobotFileParser.crawl_delay it takes fractional delays
+    """
+    agent = user_agent.split("/")[0].lower()
+    delays = {}
+    group_agents = []
+    in_rules = False
+    for line in lines:
+        key, _, value = line.split("#", 1)[0].partition(":")
+        key = key.strip().lower()
+        value = value.strip()
+        if key == "user-agent":
+            if in_rules:
+                group_agents = []
+                in_rules = False
+            group_agents.append(value.lower())
+        elif key:
+            in_rules = True
+            if key != "crawl-delay":
+                continue
+            try:
+                delay = float(value)
+            except ValueError:
+                delay = None
+            if delay is None or not math.isfinite(delay) or delay < 0:
+                logger.info("Ignoring the Crawl-delay %r for %s", value, ", ".join(group_agents))
+                continue
+            for group_agent in group_agents:
+                delays.setdefault(group_agent, delay)
+    for group_agent, delay in delays.items():
+        if group_agent != "*" and group_agent in agent:
+            return delay
+    return delays.get("*")
+
+
+class TokenBucket:
+    """
+    Allows rate requests per second on average and bursts of up to burst requests. A request that finds the bucket empty
+    reserves the next token and sleeps until it is due, so waiting requests go in the order they came
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def set_rate(self, rate):
+        with self.lock:
+            self.rate = rate
+
+    def acquire(self):
+        """
+        Takes a token, returns the seconds spent waiting for it
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class ConnectionPool:
+    """
+    Idle keep-alive connections per (scheme, host), at most max_idle of them per host
+    """
+
+    def __init__(self, max_idle=4, timeout=10.0):
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.idle: dict = {}
+        self.lock = threading.Lock()
+        self.opened = 0
+
+    def get(self, scheme, netloc):
+        """
+        Returns an idle connection and True, or a new one and False
+        """
+        import http.client
+
+        with self.lock:
+            connections = self.idle.get((scheme, netloc))
+            if connections:
+                return connections.pop(), True
+            self.opened += 1
+        connection_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return connection_class(netloc, timeout=self.timeout), False
+
+    def put(self, scheme, netloc, connection):
+        with self.lock:
+            connections = self.idle.setdefault((scheme, netloc), [])
+            if len(connections) < self.max_idle:
+                connections.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        with self.lock:
+            for connections in self.idle.values():
+                for connection in connections:
+                    connection.close()
+            self.idle = {}
+
+
+class HostState:
+    """
+    Politeness state of a host: its token bucket and its robots.txt rules, fetched on first use
+    """
+
+    def __init__(self, rate, burst):
+        self.bucket = TokenBucket(rate, burst)
+        self.robots = None
+        self.lock = threading.Lock()
+
+
+class HttpFetcher(Fetcher):
+    """
+    Downloads pages over HTTP/1.1 and returns them as the same url_data dict the corpus gives, so a Crawler can crawl
+    live sites. It is polite and safe to call from several threads (the Prefetcher's):
+
+    - requests to a host are paced by a token bucket of rate requests per second and bursts of burst requests, slowed
+      down further to the host's robots.txt Crawl-delay
+    - robots.txt is fetched once per host and kept for the max_hosts hosts used last; disallowed urls are never
+      requested and can_fetch keeps them out of the frontier. A robots.txt that is missing (4xx) allows everything, one
+      that is forbidden (401, 403) or can't be fetched (5xx, network error) allows nothing
+    - at most max_connections requests are in flight at once, and connections are kept alive and reused per host
+
+    With proxy ("host:port") every request goes to that HTTP proxy with the absolute url as its target, which is how
+    stub_server serves the corpus over HTTP
+
+    Attributes:
+        requests: requests sent, robots.txt included
+        reused: requests sent on a kept alive connection
+        disallowed: links and urls that robots.txt disallowed
+        wait_time: seconds spent waiting for the host token buckets
+    """
+
+    def __init__(self, rate=1.0, burst=1, max_connections=8, max_hosts=10000, timeout=10.0, user_agent=USER_AGENT,
+                 max_redirects=5, max_bytes=10 * 1024 * 1024, proxy=None):
+        self.rate = rate
+        self.burst = burst
+        self.max_hosts = max_hosts
+        self.user_agent = user_agent
+        self.max_redirects = max_redirects
+        self.max_bytes = max_bytes
+        self.proxy = proxy
+        self.pool = ConnectionPool(max_idle=max(1, max_connections), timeout=timeout)
+        self.slots = threading.BoundedSemaphore(max_connections)
+        self.hosts = OrderedDict()
+        self.hosts_lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.requests = 0
+        self.reused = 0
+        self.disallowed = 0
+        self.wait_time = 0.0
+
+    def host_state(self, scheme, netloc):
+        key = (scheme, netloc.lower())
+        with self.hosts_lock:
+            state = self.hosts.get(key)
+            if state is None:
+                state = self.hosts[key] = HostState(self.rate, self.burst)
+                if len(self.hosts) > self.max_hosts:
+                    self.hosts.popitem(last=False)
+            else:
+                self.hosts.move_to_end(key)
+        return state
+
+    def robots(self, scheme, netloc, state):
+        with state.lock:
+            if state.robots is None:
+                state.robots = self.fetch_robots(scheme, netloc, state)
+        return state.robots
+
+    def fetch_robots(self, scheme, netloc, state):
+        # http.client and urllib.robotparser (urllib.request) are only imported by crawls that download pages
+        import http.client
+        from urllib.robotparser import RobotFileParser
+
+        robots_url = "{}://{}/robots.txt".format(scheme, netloc)
+        robots = RobotFileParser(robots_url)
+        try:
+            status, headers, body = self.request(robots_url, state)
+        except (OSError, http.client.HTTPException) as e:
+            logger.info("Could not fetch %s, not crawling the host: %s", robots_url, e)
+            robots.disallow_all = True
+            return robots
+        if status in (401, 403) or status >= 500:
+            robots.disallow_all = True
+        elif status >= 400:
+            robots.allow_all = True
+        else:
+            lines = (body or b"").decode("utf-8", errors="replace").splitlines()
+            robots.parse(lines)
+            delay = crawl_delay(lines, self.user_agent)
+            if delay:
+                state.bucket.set_rate(min(self.rate, 1.0 / delay))
+        return robots
+
+    def can_fetch(self, url):
+        """
+        Whether url is an http(s) url that robots.txt allows
+        """
+        try:
+            parsed = parse_url(url)
+        except ValueError:
+            return False
+        if parsed.scheme not in ("http", "https") or not parsed.netloc:
+            return False
+        state = self.host_state(parsed.scheme, parsed.netloc)
+        if self.robots(parsed.scheme, parsed.netloc, state).can_fetch(self.user_agent, url):
+            return True
+        with self.stats_lock:
+            self.disallowed += 1
+        return False
+
+    def request(self, url, state, read_body=lambda status, headers: True):
+        """
+        GETs url once, after waiting for a token of the host and a free connection slot. Returns the status, the
+        headers and the body, None if read_body(status, headers) says it isn't needed. A kept alive connection that
+        the server closed in the meantime is replaced and the request sent again
+        """
+        import http.client
+
+        parsed = parse_url(url)
+        if self.proxy is not None:
+            scheme, netloc, target = "http", self.proxy, url.partition("#")[0]
+        else:
+            scheme, netloc = parsed.scheme, parsed.netloc
+            target = (parsed.path or "/") + ("?" + parsed.query if parsed.query else "")
+        target = quote(target, safe=TARGET_SAFE_CHARS)
+        headers = {"Host": parsed.netloc, "User-Agent": self.user_agent, "Connection": "keep-alive"}
+        waited = state.bucket.acquire()
+        with self.slots:
+            for attempt in range(2):
+                connection, reused = self.pool.get(scheme, netloc)
+                try:
+                    connection.request("GET", target, headers=headers)
+                    response = connection.getresponse()
+                except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                    connection.close()
+                    if reused and attempt == 0:
+                        continue
+                    raise
+                except BaseException:
+                    connection.close()
+                    raise
+                break
+            with self.stats_lock:
+                self.requests += 1
+                self.reused += reused
+                self.wait_time += waited
+            try:
+                body = None
+                if read_body(response.status, response.headers):
+                    body = response.read(self.max_bytes)
+                elif response.length is not None and response.length <= DRAIN_BYTES:
+                    response.read()
+                if response.isclosed() and not response.will_close:
+                    self.pool.put(scheme, netloc, connection)
+                else:
+                    # the rest of the body wasn't read, or the server closes the connection
+                    connection.close()
+            except BaseException:
+                connection.close()
+                raise
+        return response.status, response.headers, body
+
+    def fetch_url(self, url, html_only=False, clock=NULL_CLOCK):
+        """
+        Downloads url, following redirects, into the url_data dict described in Corpus.fetch_url. http_code is None if
+        no response came back, content is None for a url robots.txt disallows. With html_only the body of error
+        responses and non html pages isn't downloaded
+        """
+        import http.client
+
+        url_data = {"url": url, "content": None, "http_code": None, "content_type": None, "size": 0,
+                    "is_redirected": False, "final_url": None}
+        clock.lap("lookup")
+
+        def read_body(status, headers):
+            if status in REDIRECT_CODES and headers.get("Location"):
+                return False
+            return not html_only or (status < 400 and "text/html" in str(headers.get("Content-Type")))
+
+        current = url
+        try:
+            for _ in range(self.max_redirects + 1):
+                if not self.can_fetch(current):
+                    return url_data
+                parsed = parse_url(current)
+                status, headers, body = self.request(current, self.host_state(parsed.scheme, parsed.netloc),
+                                                     read_body)
+                location = headers.get("Location")
+                if status in REDIRECT_CODES and location:
+                    current = urljoin(current, location)
+                    url_data["is_redirected"] = True
+                    url_data["final_url"] = current
+                    continue
+                url_data["http_code"] = status
+                url_data["content_type"] = headers.get("Content-Type")
+                url_data["content"] = body
+                url_data["size"] = len(body) if body is not None else int(headers.get("Content-Length") or 0)
+                break
+        except (OSError, ValueError, http.client.HTTPException) as e:
+            logger.info("Could not fetch %s: %s", current, e)
+        clock.lap("read")
+        return url_data
+
+    def stats(self):
+        return {"requests": self.requests, "reused_connections": self.reused, "opened_connections": self.pool.opened,
+                "disallowed": self.disallowed, "wait_seconds": round(self.wait_time, 3), "hosts": len(self.hosts)}
+
+    def close(self):
+        self.pool.close()
+
+# ================
+# sources:
+# https://docs.python.org/3/library/http.client.html
+# https://docs.python.org/3/library/urllib.robotparser.html
+# https://en.wikipedia.org/wiki/Token_bucket
+# https://www.rfc-editor.org/rfc/rfc9309
+# https://www.rfc-editor.org/rfc/rfc9110#section-7.1
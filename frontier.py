@@ -1,7 +1,14 @@
+from array import array
+import json
 import logging
 import os
-from collections import deque
+from collections import defaultdict, deque
 import pickle
+import sys
+
+from scheduler import HostQueues, host_of
+from seen_set import FingerprintSet, make_seen_set, seen_set_memory
+from url_canonical import canonical_url
 
 logger = logging.getLogger(__name__)
 
@@ -11,35 +18,121 @@ class Frontier:
     check if the frontier has any more urls. Additionally, it has methods to save the current state of the frontier and
     load existing state
 
+    The state is kept as a snapshot plus an append-only journal of the urls added to and taken from the frontier since
+    the snapshot. Every change is appended to the journal, save_frontier makes the journal durable and compacts it into a
+    new snapshot once it grows past the snapshot size, and load_frontier replays the journal on top of the snapshot. A
+    url is journaled once when it is taken and once when mark_fetched says its page was merged; urls that were taken
+    but not merged before a crash (handed to workers or the prefetcher) are queued again, ahead of the others
+
     Attributes:
-        urls_queue: A queue of urls to be download by crawlers
-        urls_set: A set of urls to avoid duplicated urls
+        urls_queue: A queue of urls to be download by crawlers. A deque, or with the "host" scheduler a
+            scheduler.HostQueues that takes urls from the hosts in turn
+        urls_set: A set of urls to avoid duplicated urls. Either a Python set or, to save memory on large crawls, a
+            seen_set.FingerprintSet that only keeps 64 bit fingerprints of the urls (see seen_set.SEEN_BACKENDS). With
+            canonicalize it holds the canonical keys of the urls (url_canonical.canonical_url), so two spellings of the
+            same url are only queued once; the queue keeps the url as it was first added
         fetched: the number of fetched urls so far
+        taken: the urls taken from the queue whose pages aren't merged yet, in the order they were taken
     """
 
     # File names to be used when loading and saving the frontier state
     FRONTIER_DIR_NAME = "frontier_state"
+    SNAPSHOT_FILE_NAME = "snapshot"
+    JOURNAL_FILE_NAME = "journal.{}.log"
+    # pickle files written by earlier versions, still loaded if there is no snapshot
     URL_QUEUE_FILE_NAME = os.path.join(".", FRONTIER_DIR_NAME, "url_queue.pkl")
     URL_SET_FILE_NAME = os.path.join(".", FRONTIER_DIR_NAME, "url_set.pkl")
     FETCHED_FILE_NAME = os.path.join(".", FRONTIER_DIR_NAME, "fetched.pkl")
 
+    # journal records between automatic checkpoints
+    CHECKPOINT_INTERVAL = 10000
+    # the journal is compacted into a new snapshot once it has this many times more records than the snapshot has urls
+    COMPACTION_RATIO = 1.0
+    MIN_COMPACTION_RECORDS = 10000
 
-    def __init__(self):
-        self.urls_queue = deque()
-        self.urls_set = set()
+    SEED_URL = "http://www.ics.uci.edu/"
+
+    def __init__(self, state_dir=FRONTIER_DIR_NAME, seen_backend="set", scheduler="fifo", url_score="fifo",
+                 max_urls_per_host=None, canonicalize=True):
+        self.scheduler = scheduler
+        self.url_score = url_score
+        self.max_urls_per_host = max_urls_per_host
+        self.urls_queue = self.new_queue()
+        self.urls_set = make_seen_set(seen_backend)
+        self.canonicalize = canonicalize
+        # urls not added because another spelling of the same url was, counted since the frontier was loaded. Only the
+        # spellings that aren't canonical cost memory: the fingerprints of the spellings seen other than the canonical
+        # ones of urls first added as canonical, and of the keys of urls first added with another spelling
+        self.canonical_merges = 0
+        self.spellings = FingerprintSet() if canonicalize else None
+        self.respelled_keys = FingerprintSet() if canonicalize else None
         self.fetched = 0
+        self.taken = {}
+        self.state_dir = state_dir
+        # journal of the changes since the snapshot of the current generation, opened by load_frontier
+        self.generation = 0
+        self.journal = None
+        self.journal_records = 0
+        self.records_since_checkpoint = 0
+        self.snapshot_size = 0
 
     def add_url(self, url):
         """
         Adds a url to the urls queue
         :param url: the url to be added
         """
-        if not self.is_duplicate(url):
+        key = self.url_key(url)
+        if key not in self.urls_set:
             self.urls_queue.append(url)
-            self.urls_set.add(url)
+            self.urls_set.add(key)
+            self.write_journal("+", url, key)
+            if self.spellings is not None and url != key:
+                self.spellings.add(url)
+                self.respelled_keys.add(key)
+        elif self.spellings is not None and (url != key or key in self.respelled_keys) and url not in self.spellings:
+            self.spellings.add(url)
+            self.canonical_merges += 1
+
+    def add_rejected(self, url):
+        """
+        Marks a url rejected as a trap as seen without queueing it, so it is judged only once and never let in later
+        """
+        key = self.url_key(url)
+        if key not in self.urls_set:
+            self.urls_set.add(key)
+            self.write_journal("!", url, key)
+
+    def url_key(self, url):
+        return canonical_url(url) if self.canonicalize else url
 
     def is_duplicate(self, url):
-        return url in self.urls_set
+        return self.url_key(url) in self.urls_set
+
+    def new_queue(self):
+        if self.scheduler == "fifo":
+            return deque()
+        if self.scheduler == "host":
+            return HostQueues(self.url_score, self.max_urls_per_host)
+        raise ValueError("unknown frontier scheduler {}".format(self.scheduler))
+
+    def record_trap(self, url):
+        """
+        Tells the scheduler about a url rejected as a trap, the host scheduler gives hosts with many traps fewer turns
+        """
+        if isinstance(self.urls_queue, HostQueues):
+            self.urls_queue.record_trap(url)
+            self.write_journal("#", url)
+
+    def queue_depths(self):
+        """
+        Returns host -> number of queued urls
+        """
+        if isinstance(self.urls_queue, HostQueues):
+            return self.urls_queue.depths()
+        depths = defaultdict(int)
+        for url in self.urls_queue:
+            depths[host_of(url)] += 1
+        return dict(sorted(depths.items(), key=lambda x: x[1], reverse=True))
 
     def get_next_url(self):
         """
@@ -47,7 +140,17 @@ class Frontier:
         """
         if self.has_next_url():
             self.fetched += 1
-            return self.urls_queue.popleft()
+            url = self.urls_queue.popleft()
+            self.taken[url] = None
+            self.write_journal("-", url)
+            return url
+
+    def mark_fetched(self, url):
+        """
+        Records that the page of a url taken with get_next_url was merged, after a crash it won't be taken again
+        """
+        if self.taken.pop(url, False) is None:
+            self.write_journal("=", url)
 
     def has_next_url(self):
         """
@@ -55,38 +158,355 @@ class Frontier:
         """
         return len(self.urls_queue) != 0
 
+    def state_file(self, file_name):
+        return os.path.join(self.state_dir, file_name)
+
+    def write_journal(self, operation, url, key=None):
+        """
+        Appends a record to the journal. The seen set key of an added or rejected url follows it in a "~" record (empty
+        if the url is its own key), so replaying the journal doesn't canonicalize the url again
+        """
+        if self.journal is None:
+            return
+        record = operation + url + "\n"
+        records = 1
+        if key is not None and self.canonicalize:
+            record += "~" + (key if key != url else "") + "\n"
+            records = 2
+        self.journal.write(record.encode("utf-8", errors="surrogateescape"))
+        self.journal_records += records
+        self.records_since_checkpoint += records
+        if self.records_since_checkpoint >= self.CHECKPOINT_INTERVAL:
+            self.save_frontier()
+
     def save_frontier(self):
         """
-        saves the current state of the frontier in two files using pickle
+        checkpoints the current state of the frontier: flushes the journal to disk and, once the journal has outgrown the
+        snapshot, compacts it into a new snapshot. Cost is proportional to the changes since the last checkpoint, except
+        for the occasional compaction
         """
-        if not os.path.exists(self.FRONTIER_DIR_NAME):
-            os.makedirs(self.FRONTIER_DIR_NAME)
+        if self.journal is None:
+            # nothing was journaled, the snapshot has to hold everything
+            self.compact()
+            return
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+        self.records_since_checkpoint = 0
+        if isinstance(self.urls_queue, HostQueues):
+            logger.info("Queued urls per host: %s", list(self.urls_queue.depths().items())[:10])
+        if self.journal_records >= max(self.MIN_COMPACTION_RECORDS, self.COMPACTION_RATIO * self.snapshot_size):
+            self.compact()
+
+    def compact(self):
+        """
+        Writes the whole frontier into the snapshot of the next generation and starts an empty journal for it. The
+        snapshot is written under a temporary name and renamed, and the journal of a generation is only read together
+        with the snapshot of the same generation, so a crash at any point leaves a consistent state behind
+        """
+        if not os.path.exists(self.state_dir):
+            os.makedirs(self.state_dir)
+        generation = self.generation + 1
+        # taken urls whose pages weren't merged yet are saved as queued, ahead of the queue
+        queued_urls = list(self.taken)
+        queued_urls.extend(self.urls_queue)
+        header = {"generation": generation, "fetched": self.fetched - len(self.taken), "queued": len(queued_urls),
+                  "taken": len(self.taken), "canonical": self.canonicalize}
+        if isinstance(self.urls_set, FingerprintSet):
+            # the queued urls followed by the raw fingerprints of every seen url
+            fingerprints = self.urls_set.fingerprints()
+            header.update(seen_format="fingerprints", seen=len(fingerprints), byteorder=sys.byteorder)
+            seen_keys = ()
+        else:
+            # the queued urls followed by the keys of every seen url, which load_snapshot takes as they are
+            seen_keys = self.urls_set
+            header.update(seen_format="keys", seen=len(seen_keys))
+            fingerprints = None
+        if isinstance(self.urls_queue, HostQueues):
+            header["scheduler"] = self.urls_queue.state()
+        snapshot_file = self.state_file(self.SNAPSHOT_FILE_NAME)
+        temp_file = snapshot_file + ".tmp"
+        with open(temp_file, "wb") as f:
+            f.write(json.dumps(header).encode() + b"\n")
+            for urls in (queued_urls, seen_keys):
+                for url in urls:
+                    f.write(url.encode("utf-8", errors="surrogateescape") + b"\n")
+            if fingerprints is not None:
+                fingerprints.tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, snapshot_file)
+
+        old_journal = self.state_file(self.JOURNAL_FILE_NAME.format(self.generation))
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        self.generation = generation
+        self.snapshot_size = len(self.urls_set)
+        self.open_journal()
+        if os.path.exists(old_journal):
+            os.remove(old_journal)
+        logger.info("Compacted frontier state into generation %s. Fetched: %s, Queue size: %s", generation, self.fetched,
+                    len(self.urls_queue))
+
+    def open_journal(self):
+        if not os.path.exists(self.state_dir):
+            os.makedirs(self.state_dir)
+        self.journal = open(self.state_file(self.JOURNAL_FILE_NAME.format(self.generation)), "ab")
+        self.journal_records = 0
 
-        url_queue_file = open(self.URL_QUEUE_FILE_NAME, "wb")
-        url_set_file = open(self.URL_SET_FILE_NAME, "wb")
-        fetched_file = open(self.FETCHED_FILE_NAME, "wb")
-        pickle.dump(self.urls_queue, url_queue_file)
-        pickle.dump(self.urls_set, url_set_file)
-        pickle.dump(self.fetched, fetched_file)
+    def close(self):
+        if self.journal is not None:
+            self.save_frontier()
+            self.journal.close()
+            self.journal = None
 
     def load_frontier(self):
         """
-        loads the previous state of the frontier into memory, if exists
+        loads the previous state of the frontier into memory, if exists, and starts journaling changes to it
+        """
+        snapshot_file = self.state_file(self.SNAPSHOT_FILE_NAME)
+        if os.path.isfile(snapshot_file) or os.path.isfile(self.state_file(self.JOURNAL_FILE_NAME.format(0))):
+            self.load_snapshot(snapshot_file)
+            self.replay_journal()
+            logger.info("Loaded previous frontier state into memory. Fetched: %s, Queue size: %s", self.fetched,
+                        len(self.urls_queue))
+        elif self.load_pickles():
+            # move the old pickled state into a snapshot right away
+            self.compact()
+        else:
+            logger.info("No previous frontier state found. Starting from the seed URL ...")
+            self.open_journal()
+            self.add_url(self.SEED_URL)
+
+    def load_snapshot(self, snapshot_file):
+        if not os.path.isfile(snapshot_file):
+            return
+        with open(snapshot_file, "rb") as f:
+            header = json.loads(f.readline())
+            queued = header["queued"]
+            if header.get("seen_format", "urls") == "fingerprints":
+                if not isinstance(self.urls_set, FingerprintSet):
+                    raise ValueError("the frontier state in {} keeps url fingerprints, load it with a fingerprint seen "
+                                     "set backend".format(self.state_dir))
+                lines = [f.readline()[:-1].decode("utf-8", errors="surrogateescape") for _ in range(queued)]
+                fingerprints = array("Q")
+                fingerprints.frombytes(f.read())
+                if header.get("byteorder", sys.byteorder) != sys.byteorder:
+                    fingerprints.byteswap()
+                if header.get("canonical", False) != self.canonicalize:
+                    logger.warning("The seen url fingerprints in %s were not taken with the same url canonicalization, "
+                                   "some seen urls may be crawled again", self.state_dir)
+            else:
+                lines = f.read().decode("utf-8", errors="surrogateescape").split("\n")
+                fingerprints = None
+        self.generation = header["generation"]
+        self.fetched = header["fetched"]
+        # the first queued urls were taken but not merged, replay_journal queues them again unless they were merged
+        taken = header.get("taken", 0)
+        self.taken = dict.fromkeys(lines[:taken])
+        self.urls_queue = self.new_queue()
+        if isinstance(self.urls_queue, HostQueues):
+            self.urls_queue.load_state(header.get("scheduler", {}))
+            self.urls_queue.restore_all(lines[taken:queued])
+        else:
+            self.urls_queue.extend(lines[taken:queued])
+        if fingerprints is not None:
+            self.urls_set = FingerprintSet(capacity=len(fingerprints), use_bloom=self.urls_set.use_bloom)
+            for fingerprint in fingerprints:
+                self.urls_set.add_fingerprint(fingerprint)
+        else:
+            if header.get("seen_format") == "keys" and header.get("canonical", False) == self.canonicalize:
+                keys = lines[queued:queued + header["seen"]]
+            else:
+                # the seen urls that are no longer queued, as spelled by earlier versions or keyed without the current
+                # canonicalization
+                keys = map(self.url_key, lines[:queued + header["seen"]])
+            if isinstance(self.urls_set, FingerprintSet):
+                self.urls_set.update(keys)
+            else:
+                self.urls_set = set(keys)
+        self.snapshot_size = len(self.urls_set)
+
+    def replay_journal(self):
+        """
+        Applies the journal of the current generation to the loaded snapshot. An incomplete last record, left by a crash
+        in the middle of a write, is dropped and cut off the journal before new records are appended
+        """
+        journal_file = self.state_file(self.JOURNAL_FILE_NAME.format(self.generation))
+        records = []
+        if os.path.isfile(journal_file):
+            with open(journal_file, "rb") as f:
+                data = f.read()
+            complete = data.rfind(b"\n") + 1
+            if complete != len(data):
+                logger.warning("Dropping an incomplete record at the end of %s", journal_file)
+                with open(journal_file, "r+b") as f:
+                    f.truncate(complete)
+            records = data[:complete].decode("utf-8", errors="surrogateescape").split("\n")[:-1]
+
+        entries = list(self.journal_entries(records))
+        if isinstance(self.urls_queue, HostQueues):
+            done = self.replay_in_order(entries)
+            if done is None:
+                logger.warning("The host scheduler state in %s doesn't match its journal, the crawl order after the "
+                               "restart may differ", self.state_dir)
+                # the queue was changed before the mismatch showed, start over from the snapshot
+                self.urls_queue = self.new_queue()
+                self.taken = {}
+                self.load_snapshot(self.state_file(self.SNAPSHOT_FILE_NAME))
+                done = self.replay_changes(entries)
+        else:
+            done = self.replay_changes(entries)
+        self.fetched += len(done)
+        # urls taken but not merged before the crash, in a worker or the prefetcher, are crawled again first
+        requeued = [url for url in self.taken if url not in done]
+        self.taken = {}
+        if requeued:
+            logger.info("Queueing again %s urls that were taken but not crawled", len(requeued))
+            if isinstance(self.urls_queue, HostQueues):
+                for url in reversed(requeued):
+                    self.urls_queue.requeue(url)
+            else:
+                self.urls_queue.extendleft(reversed(requeued))
+        self.open_journal()
+        self.journal_records = len(records)
+
+    def journal_entries(self, records):
+        """
+        Yields (operation, url, key) for the journal records, key being the seen set key of an added or rejected url
+        (None for the other operations). Records written before keys were journaled have their keys computed again
+        """
+        pending = None
+        for record in records:
+            operation, url = record[0], record[1:]
+            if operation == "~":
+                if pending is not None:
+                    yield pending[0], pending[1], url or pending[1]
+                    pending = None
+                continue
+            if pending is not None:
+                yield pending[0], pending[1], self.url_key(pending[1])
+                pending = None
+            if operation == "+" or operation == "!":
+                pending = operation, url
+            else:
+                yield operation, url, None
+        if pending is not None:
+            yield pending[0], pending[1], self.url_key(pending[1])
+
+    def replay_in_order(self, entries):
+        """
+        Applies the journal entries one by one to the host scheduler loaded from the snapshot, which then hands out urls
+        in the same order as before the restart. Returns the urls whose pages were merged, None if a taken url isn't the
+        one the scheduler hands out, in which case the queue is left half replayed but the seen set and the taken urls
+        are unchanged
+        """
+        queue = self.urls_queue
+        taken = dict(self.taken)
+        done = set()
+        keys = []
+        for operation, url, key in entries:
+            if operation == "+":
+                queue.append(url)
+                keys.append(key)
+            elif operation == "-":
+                if not len(queue) or queue.popleft() != url:
+                    return None
+                taken[url] = None
+            elif operation == "=":
+                done.add(url)
+            elif operation == "#":
+                queue.record_trap(url)
+            else:
+                keys.append(key)
+        self.urls_set.update(keys)
+        self.taken = taken
+        return done
+
+    def replay_changes(self, entries):
+        """
+        Applies the journal entries as a whole: the added urls are queued and the taken ones removed from the queue.
+        Returns the urls whose pages were merged
+        """
+        added = []
+        keys = []
+        traps = []
+        taken = {}
+        done = set()
+        for operation, url, key in entries:
+            if operation == "+":
+                added.append(url)
+                keys.append(key)
+            elif operation == "!":
+                keys.append(key)
+            elif operation == "-":
+                taken[url] = None
+            elif operation == "#":
+                traps.append(url)
+            else:
+                done.add(url)
+        self.urls_set.update(keys)
+        # a url taken before the snapshot and merged after it is queued in the snapshot and only has its "=" record
+        removed = done.union(taken)
+        if isinstance(self.urls_queue, HostQueues):
+            # replayed in journal order, so urls over a host's cap are dropped again like they were the first time
+            queue = self.new_queue()
+            queue.load_state(self.urls_queue.state())
+            for url in self.urls_queue:
+                if url not in removed:
+                    queue.restore(url)
+            for url in added:
+                if url in removed:
+                    queue.note_enqueued(url)
+                else:
+                    queue.append(url)
+            for url in taken:
+                queue.fetched[host_of(url)] += 1
+            for url in traps:
+                queue.record_trap(url)
+            self.urls_queue = queue
+        elif added or removed:
+            self.urls_queue = deque(url for urls in (self.urls_queue, added) for url in urls if url not in removed)
+        self.taken.update(taken)
+        return done
+
+    def load_pickles(self):
+        """
+        loads a frontier state saved by earlier versions with pickle, returns true if there was one
         """
         if os.path.isfile(self.URL_QUEUE_FILE_NAME) and os.path.isfile(self.URL_SET_FILE_NAME) and\
                 os.path.isfile(self.FETCHED_FILE_NAME):
             try:
-                self.urls_queue = pickle.load(open(self.URL_QUEUE_FILE_NAME, "rb"))
-                self.urls_set = pickle.load(open(self.URL_SET_FILE_NAME, "rb"))
-                self.fetched = pickle.load(open(self.FETCHED_FILE_NAME, "rb"))
-                logger.info("Loaded previous frontier state into memory. Fetched: %s, Queue size: %s", self.fetched,
+                with open(self.URL_QUEUE_FILE_NAME, "rb") as f:
+                    for url in pickle.load(f):
+                        self.urls_queue.append(url)
+                with open(self.URL_SET_FILE_NAME, "rb") as f:
+                    if isinstance(self.urls_set, FingerprintSet):
+                        self.urls_set.update(map(self.url_key, pickle.load(f)))
+                    else:
+                        self.urls_set = set(map(self.url_key, pickle.load(f)))
+                with open(self.FETCHED_FILE_NAME, "rb") as f:
+                    self.fetched = pickle.load(f)
+                logger.info("Loaded pickled frontier state into memory. Fetched: %s, Queue size: %s", self.fetched,
                             len(self.urls_queue))
-            except:
+                return True
+            except (OSError, pickle.UnpicklingError, EOFError):
                 pass
-        else:
-            logger.info("No previous frontier state found. Starting from the seed URL ...")
-            self.add_url("http://www.ics.uci.edu/")
+        return False
+
+    def seen_memory(self):
+        """
+        Approximate memory used by the seen urls in bytes
+        """
+        memory = seen_set_memory(self.urls_set)
+        if self.spellings is not None:
+            memory += self.spellings.memory_bytes() + self.respelled_keys.memory_bytes()
+        return memory
 
     def __len__(self):
         return len(self.urls_queue)
 
+# ================
+# sources:
+# https://docs.python.org/3/library/os.html#os.replace
+# https://docs.python.org/3/library/os.html#os.fsync
@@ -0,0 +1,28 @@
+import importlib.util
+import sys
+
+
+def lazy_import(name):
+    """
+    The module name, not executed until one of its attributes is used, so a module that is only needed by some runs
+    doesn't slow down the start of every process. None if the module isn't installed, like a failed optional import
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    try:
+        spec = importlib.util.find_spec(name)
+    except ImportError:
+        return None
+    if spec is None:
+        return None
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+# ================
+# sources:
+# https://docs.python.org/3/library/importlib.html#implementing-lazy-imports
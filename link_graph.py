@@ -0,0 +1,155 @@
+from array import array
+import logging
+import os
+import sys
+
+from lazy_import import lazy_import
+from url_canonical import canonical_url
+
+# None if it isn't installed, the graph is still recorded, only the ranking needs numpy
+numpy = lazy_import("numpy")
+
+logger = logging.getLogger(__name__)
+
+
+class LinkGraph:
+    """
+    Link graph of the crawled pages. Every url gets an integer node id in the order it is first seen (its canonical
+    form is the node, see url_canonical) and the urls are appended to the nodes file as they are numbered; the edges are
+    appended to the edge log as pairs of little endian uint32 node ids. rank() reads the log back into compressed
+    sparse row arrays and runs PageRank and HITS on them
+
+    Attributes:
+        node_ids: canonical url -> node id
+        edges: number of edges logged
+    """
+
+    NODES_FILE_NAME = "link_graph.nodes"
+    EDGE_LOG_FILE_NAME = "link_graph.edges"
+    FLUSH_EDGES = 1 << 16
+
+    def __init__(self, output_dir="."):
+        self.output_dir = output_dir
+        self.node_ids: dict = {}
+        self.edges = 0
+        self.pending = array("I")
+        if array("I").itemsize != 4:
+            raise ValueError("the edge log needs 4 byte unsigned ints")
+        self.nodes_file = open(os.path.join(output_dir, self.NODES_FILE_NAME), "w", encoding="utf-8",
+                               errors="surrogateescape")
+        self.edge_log = open(os.path.join(output_dir, self.EDGE_LOG_FILE_NAME), "wb")
+
+    def node_id(self, url):
+        key = canonical_url(url)
+        node = self.node_ids.get(key)
+        if node is None:
+            node = self.node_ids[key] = len(self.node_ids)
+            self.nodes_file.write(url + "\n")
+        return node
+
+    def add_page(self, url, links):
+        """
+        Logs an edge from the page to each distinct page it links to, self links left out
+        """
+        source = self.node_id(url)
+        targets = {self.node_id(link) for link in links}
+        targets.discard(source)
+        for target in targets:
+            self.pending.append(source)
+            self.pending.append(target)
+        self.edges += len(targets)
+        if len(self.pending) >= 2 * self.FLUSH_EDGES:
+            self.flush()
+
+    def flush(self):
+        if sys.byteorder == "big":
+            self.pending.byteswap()
+        self.pending.tofile(self.edge_log)
+        self.pending = array("I")
+        self.edge_log.flush()
+        self.nodes_file.flush()
+
+    def close(self):
+        self.flush()
+        self.edge_log.close()
+        self.nodes_file.close()
+
+    def csr(self):
+        """
+        The graph as compressed sparse row arrays: the targets of node i are indices[indptr[i]:indptr[i + 1]]
+        """
+        self.flush()
+        edges = numpy.fromfile(os.path.join(self.output_dir, self.EDGE_LOG_FILE_NAME), dtype="<u4").reshape(-1, 2)
+        sources = edges[:, 0]
+        order = numpy.argsort(sources, kind="stable")
+        indptr = numpy.zeros(len(self.node_ids) + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(sources, minlength=len(self.node_ids)), out=indptr[1:])
+        return indptr, edges[order, 1].astype(numpy.int64)
+
+    def rank(self, top=10):
+        """
+        Returns the top pages by PageRank, HITS authority and HITS hub score as lists of (url, score), None without
+        numpy or without edges
+        """
+        if numpy is None:
+            logger.warning("numpy is not installed, the link graph is not ranked")
+            return None
+        if not self.edges:
+            return None
+        indptr, indices = self.csr()
+        page_rank = pagerank(indptr, indices)
+        authorities, hubs = hits(indptr, indices)
+        urls = self.urls()
+        return {name: [(urls[node], float(scores[node])) for node in numpy.argsort(-scores, kind="stable")[:top]]
+                for name, scores in (("pagerank", page_rank), ("authorities", authorities), ("hubs", hubs))}
+
+    def urls(self):
+        self.nodes_file.flush()
+        with open(os.path.join(self.output_dir, self.NODES_FILE_NAME), encoding="utf-8", errors="surrogateescape") as f:
+            return [line[:-1] for line in f]
+
+
+def pagerank(indptr, indices, damping=0.85, tolerance=1e-10, max_iterations=100):
+    """
+    PageRank by power iteration over a CSR graph. The rank of pages without outlinks is spread over all pages
+    """
+    n = len(indptr) - 1
+    out_degree = numpy.diff(indptr)
+    sources = numpy.repeat(numpy.arange(n), out_degree)
+    dangling = out_degree == 0
+    rank = numpy.full(n, 1.0 / n)
+    for _ in range(max_iterations):
+        share = rank / numpy.maximum(out_degree, 1)
+        new_rank = numpy.bincount(indices, weights=share[sources], minlength=n)
+        new_rank = damping * (new_rank + rank[dangling].sum() / n) + (1.0 - damping) / n
+        converged = numpy.abs(new_rank - rank).sum() < tolerance
+        rank = new_rank
+        if converged:
+            break
+    return rank
+
+
+def hits(indptr, indices, tolerance=1e-10, max_iterations=100):
+    """
+    HITS authority and hub scores by power iteration over a CSR graph, each normalized to unit length
+    """
+    n = len(indptr) - 1
+    sources = numpy.repeat(numpy.arange(n), numpy.diff(indptr))
+    hubs = numpy.full(n, 1.0 / numpy.sqrt(n))
+    authorities = hubs
+    for _ in range(max_iterations):
+        authorities = numpy.bincount(indices, weights=hubs[sources], minlength=n)
+        authorities /= numpy.linalg.norm(authorities) or 1.0
+        new_hubs = numpy.bincount(sources, weights=authorities[indices], minlength=n)
+        new_hubs /= numpy.linalg.norm(new_hubs) or 1.0
+        converged = numpy.abs(new_hubs - hubs).sum() < tolerance
+        hubs = new_hubs
+        if converged:
+            break
+    return authorities, hubs
+
+# ================
+# sources:
+# http://ilpubs.stanford.edu:8090/422/1/1999-66.pdf
+# https://www.cs.cornell.edu/home/kleinber/auth.pdf
+# https://en.wikipedia.org/wiki/Sparse_matrix#Compressed_sparse_row_(CSR,_CRS_or_Yale_format)
@@ -1,29 +1,182 @@
+import argparse
 import atexit
 import logging
+import shutil
 
-import sys
-
+from analytics import CrawlAnalytics
 from corpus import Corpus
 from crawler import Crawler
+from fetcher import USER_AGENT, HttpFetcher
 from frontier import Frontier
+from link_graph import LinkGraph
+from metrics import Metrics, SamplingProfiler
+from near_duplicates import FINGERPRINT_BITS, NearDuplicateIndex
+from page_store import PAGE_STORE_FILE_NAME, PageStore
+from scheduler import SCHEDULERS, URL_SCORES
+from search_index import IndexWriter
+from seen_set import SEEN_BACKENDS
+from sharding import SHARD_DIR_NAME, crawl_sharded
+from trap_detector import TrapDetector
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crawls the urls of a local web corpus")
+    parser.add_argument("corpus_dir", nargs="?", default=None,
+                        help="directory of the corpus files, not needed with --http")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes fetching and parsing pages (default: 1, crawl in this process)")
+    parser.add_argument("--seen-set", choices=SEEN_BACKENDS, default="set",
+                        help="how the frontier remembers seen urls: full urls (set), 64 bit fingerprints (fingerprint) or "
+                             "fingerprints behind a Bloom filter (bloom)")
+    parser.add_argument("--scheduler", choices=SCHEDULERS, default="fifo",
+                        help="fifo: one queue for all urls, host: a queue per host, hosts take turns")
+    parser.add_argument("--host-score", choices=sorted(URL_SCORES), default="fifo",
+                        help="order of the urls of a host with the host scheduler")
+    parser.add_argument("--max-urls-per-host", type=int, default=None,
+                        help="with the host scheduler, urls of a host past this many are dropped")
+    parser.add_argument("--analytics-interval", type=int, default=None,
+                        help="write a partial analytics.txt every this many pages while crawling")
+    parser.add_argument("--top-words-capacity", type=int, default=10000, metavar="N",
+                        help="word counts are exact until 2*N distinct words were seen, then only the N most common "
+                             "are kept and the top 50 in analytics.txt say how far off they may be; 0 keeps every word "
+                             "(default: %(default)s)")
+    parser.add_argument("--near-duplicates", type=int, default=None, metavar="BITS",
+                        help="skip the words and outlinks of pages whose SimHash is within BITS bits of an earlier page")
+    parser.add_argument("--trap-detector", action="store_true",
+                        help="throttle and blacklist url templates and hosts that look like traps from crawl statistics")
+    parser.add_argument("--prefetch", type=int, default=0, metavar="DEPTH",
+                        help="with a single worker, read the corpus records of the next DEPTH frontier urls ahead on "
+                             "threads while pages are parsed (default: 0, no prefetch)")
+    parser.add_argument("--prefetch-threads", type=int, default=4,
+                        help="number of threads reading corpus records with --prefetch")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="split the crawl by host into this many shards, each with its own frontier (default: 1)")
+    parser.add_argument("--shard-id", type=int, default=None,
+                        help="with --shards, crawl only this shard, for shards spread over several machines")
+    parser.add_argument("--coordinate", action="store_true",
+                        help="with --shards, only wait for the shards started elsewhere and merge their analytics")
+    parser.add_argument("--shard-dir", default=SHARD_DIR_NAME,
+                        help="directory the shards exchange links through and write their analytics to, shared by "
+                             "all machines of a sharded crawl (default: %(default)s)")
+    parser.add_argument("--metrics-interval", type=float, default=None, metavar="SECONDS",
+                        help="time every page stage by stage and append throughput, stage p50/p99, frontier size and "
+                             "RSS to metrics.jsonl every SECONDS seconds (default: off)")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="with --metrics-interval, also serve the latest metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--profile", action="store_true",
+                        help="sample the crawl loop's stack and write the samples to profile.folded for a flame graph")
+    parser.add_argument("--no-canonical-urls", dest="canonical_urls", action="store_false",
+                        help="tell frontier urls apart by their exact spelling instead of their canonical form")
+    parser.add_argument("--link-graph", action="store_true",
+                        help="record the links between crawled pages and add the top pages by PageRank and HITS to "
+                             "analytics.txt (needs numpy)")
+    parser.add_argument("--search-index", action="store_true",
+                        help="build a positional inverted index of the crawled pages in search_index/, searched with "
+                             "search_index.py")
+    parser.add_argument("--index-overhead", type=float, default=0.1, metavar="FRACTION",
+                        help="with --search-index, pages are only indexed during the crawl while indexing takes at most "
+                             "this fraction of the crawl time, the rest are indexed after it (default: %(default)s)")
+    parser.add_argument("--recrawl", action="store_true",
+                        help="crawl again from the seed url after the corpus was refreshed, reusing the analysis of "
+                             "the pages whose corpus file didn't change from " + PAGE_STORE_FILE_NAME)
+    parser.add_argument("--http", action="store_true",
+                        help="download the pages over HTTP instead of reading them from the corpus, politely: robots.txt "
+                             "is obeyed and every host is rate limited")
+    parser.add_argument("--proxy", default=None, metavar="HOST:PORT",
+                        help="with --http, send every request through this HTTP proxy, e.g. stub_server.py")
+    parser.add_argument("--rate", type=float, default=1.0,
+                        help="with --http, requests per second to a host (default: %(default)s)")
+    parser.add_argument("--burst", type=int, default=1,
+                        help="with --http, requests a host may get at once before --rate applies (default: %(default)s)")
+    parser.add_argument("--max-connections", type=int, default=8,
+                        help="with --http, most requests in flight at once, over all hosts (default: %(default)s)")
+    parser.add_argument("--user-agent", default=USER_AGENT,
+                        help="with --http, User-Agent of the requests and of the robots.txt rules (default: %(default)s)")
+    args = parser.parse_args()
+    if args.metrics_port is not None and args.metrics_interval is None:
+        parser.error("--metrics-port needs --metrics-interval")
+    if args.top_words_capacity < 0:
+        parser.error("--top-words-capacity must not be negative")
+    if args.near_duplicates is not None and not 0 <= args.near_duplicates < FINGERPRINT_BITS:
+        parser.error("--near-duplicates BITS must be between 0 and {}".format(FINGERPRINT_BITS - 1))
+    if args.recrawl and args.shards > 1:
+        parser.error("--recrawl does not support --shards")
+    if args.shards > 1:
+        unsupported = [flag for flag, value in (("--workers", args.workers > 1), ("--prefetch", args.prefetch > 0),
+                                                ("--analytics-interval", args.analytics_interval is not None),
+                                                ("--metrics-interval", args.metrics_interval is not None),
+                                                ("--metrics-port", args.metrics_port is not None),
+                                                ("--profile", args.profile), ("--link-graph", args.link_graph),
+                                                ("--search-index", args.search_index)) if value]
+        if unsupported:
+            parser.error("--shards does not support {}".format(", ".join(unsupported)))
+    if args.http and (args.workers > 1 or args.shards > 1 or args.recrawl):
+        parser.error("--http does not support --workers, --shards or --recrawl, use --prefetch to fetch pages "
+                     "concurrently")
+    if not args.http and args.corpus_dir is None:
+        parser.error("the corpus_dir argument is required without --http")
+
     # Configures basic logging
     logging.basicConfig(format='%(asctime)s (%(name)s) %(levelname)s %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p',
                         level=logging.INFO)
 
-    # Instantiates frontier and loads the last state if exists
-    frontier = Frontier()
-    frontier.load_frontier()
+    if args.shards > 1:
+        # Every shard crawls the hosts the hash ring gives it with its own frontier, the analytics are merged at the end
+        frontier_options = {"seen_backend": args.seen_set, "scheduler": args.scheduler, "url_score": args.host_score,
+                            "max_urls_per_host": args.max_urls_per_host, "canonicalize": args.canonical_urls}
+        crawl_sharded(args.corpus_dir, args.shards, shard_id=args.shard_id, coordinate_only=args.coordinate,
+                      spool_dir=args.shard_dir, frontier_options=frontier_options,
+                      near_duplicates=args.near_duplicates, trap_detector=args.trap_detector,
+                      top_words_capacity=args.top_words_capacity or None)
+    else:
+        # Instantiates frontier and loads the last state if exists
+        frontier = Frontier(seen_backend=args.seen_set, scheduler=args.scheduler, url_score=args.host_score,
+                            max_urls_per_host=args.max_urls_per_host, canonicalize=args.canonical_urls)
+        page_store = None
+        if args.recrawl:
+            # a re-crawl starts over, the analytics are folded again from the stored and the changed pages
+            shutil.rmtree(frontier.state_dir, ignore_errors=True)
+            page_store = PageStore()
+        frontier.load_frontier()
 
-    # Instantiates corpus object with the given cmd arg
-    corpus = Corpus(sys.argv[1])
+        # Instantiates corpus object with the given cmd arg, or downloads the pages
+        if args.http:
+            corpus = HttpFetcher(rate=args.rate, burst=args.burst, max_connections=args.max_connections,
+                                 user_agent=args.user_agent, proxy=args.proxy)
+        else:
+            corpus = Corpus(args.corpus_dir)
 
-    # Registers a shutdown hook to save frontier state upon unexpected shutdown
-    # atexit.register(frontier.save_frontier)
+        # Registers a shutdown hook to save frontier state upon unexpected shutdown
+        atexit.register(frontier.close)
 
-    # Instantiates a crawler object and starts crawling
-    crawler = Crawler(frontier, corpus)
-    crawler.start_crawling()
+        # Instantiates a crawler object and starts crawling
+        analytics = CrawlAnalytics(top_words_capacity=args.top_words_capacity or None,
+                                   snapshot_interval=args.analytics_interval,
+                                   link_graph=LinkGraph() if args.link_graph else None,
+                                   search_index=IndexWriter(max_overhead=args.index_overhead) if args.search_index
+                                   else None)
+        near_duplicates = NearDuplicateIndex(args.near_duplicates) if args.near_duplicates is not None else None
+        trap_detector = TrapDetector() if args.trap_detector else None
+        metrics = None
+        if args.metrics_interval is not None:
+            metrics = Metrics(frontier, interval=args.metrics_interval, http_port=args.metrics_port)
+        crawler = Crawler(frontier, corpus, workers=args.workers, analytics=analytics, near_duplicates=near_duplicates,
+                          trap_detector=trap_detector, prefetch_depth=args.prefetch, prefetch_threads=args.prefetch_threads,
+                          metrics=metrics, page_store=page_store)
+        profiler = SamplingProfiler().start() if args.profile else None
+        crawler.start_crawling()
+        if profiler is not None:
+            profiler.stop()
+        if metrics is not None:
+            metrics.close()
+        if trap_detector is not None:
+            logging.info("Trap detector: %s", trap_detector.stats())
+        if args.http:
+            logging.info("HTTP fetcher: %s", corpus.stats())
+            corpus.close()
+        if page_store is not None:
+            logging.info("Page store: %s", page_store.stats())
+            page_store.close()
+        logging.info("Seen urls: %s, using about %s bytes, urls merged with another spelling: %s", len(frontier.urls_set),
+                     frontier.seen_memory(), frontier.canonical_merges)
 
-    crawler.write_analytics()
\ No newline at end of file
+        crawler.write_analytics()
@@ -0,0 +1,271 @@
+from collections import Counter
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# stages of a page timed by StageClock, in the order they run
+STAGES = ("store", "lookup", "read", "parse", "tokenize", "filter", "simhash", "exists", "merge")
+
+
+class StageClock:
+    """
+    Times the consecutive stages of a single page: every lap adds the time since the previous lap to a stage
+    """
+
+    def __init__(self):
+        self.timings: dict = {}
+        self.last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.timings[stage] = self.timings.get(stage, 0.0) + now - self.last
+        self.last = now
+
+
+class NullClock:
+    """
+    StageClock used when metrics are off, it doesn't even read the time
+    """
+
+    timings = None
+
+    def lap(self, stage):
+        pass
+
+
+NULL_CLOCK = NullClock()
+
+
+class Histogram:
+    """
+    Durations in logarithmic buckets, each bucket BASE times as wide as the one before, so quantiles are within about
+    10% of the exact value whatever the range of the durations, in a few dozen buckets
+    """
+
+    BASE = 2 ** 0.125
+
+    def __init__(self):
+        self.buckets = Counter()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.buckets[math.floor(math.log(seconds, self.BASE)) if seconds > 0 else None] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """
+        Upper bound of the bucket holding the q quantile
+        """
+        rank = q * self.count
+        seen = self.buckets.get(None, 0)
+        if seen >= rank:
+            return 0.0
+        for bucket in sorted(bucket for bucket in self.buckets if bucket is not None):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(self.BASE ** (bucket + 1), self.max)
+        return self.max
+
+    def summary(self):
+        return {"count": self.count, "total": round(self.total, 6), "p50": round(self.quantile(0.5), 9),
+                "p99": round(self.quantile(0.99), 9), "max": round(self.max, 9)}
+
+
+def rss_bytes():
+    """
+    Resident set size of this process, the peak size where /proc isn't available
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        try:
+            import resource
+        except ImportError:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Metrics:
+    """
+    Crawl throughput and per stage timings. The crawler hands every merged PageResult to record_page; every interval
+    seconds a snapshot (pages/sec and links/sec since the previous snapshot and overall, frontier size, RSS, and count,
+    total, p50 and p99 of each stage) is appended as a JSON line to path and, with http_port, served as JSON at
+    http://127.0.0.1:<http_port>/metrics
+    """
+
+    METRICS_FILE_NAME = "metrics.jsonl"
+
+    enabled = True
+
+    def __init__(self, frontier=None, path=METRICS_FILE_NAME, interval=10.0, http_port=None):
+        self.frontier = frontier
+        self.path = path
+        self.interval = interval
+        self.stages: dict = {}
+        self.pages = 0
+        self.links = 0
+        self.start = self.last_dump = time.monotonic()
+        self.last_pages = 0
+        self.last_links = 0
+        self.latest = None
+        self.file = open(path, "a")
+        self.server = self.start_server(http_port) if http_port is not None else None
+
+    def clock(self):
+        return StageClock()
+
+    def record_page(self, page, clock):
+        self.pages += 1
+        self.links += len(page.frontier_links)
+        for timings in (page.timings, clock.timings):
+            for stage, seconds in (timings or {}).items():
+                histogram = self.stages.get(stage)
+                if histogram is None:
+                    histogram = self.stages[stage] = Histogram()
+                histogram.add(seconds)
+        if time.monotonic() - self.last_dump >= self.interval:
+            self.dump()
+
+    def snapshot(self):
+        now = time.monotonic()
+        since_dump = max(now - self.last_dump, 1e-9)
+        elapsed = max(now - self.start, 1e-9)
+        order = {stage: i for i, stage in enumerate(STAGES)}
+        return {
+            "time": time.time(),
+            "elapsed": round(elapsed, 3),
+            "pages": self.pages,
+            "links": self.links,
+            "pages_per_sec": round((self.pages - self.last_pages) / since_dump, 2),
+            "links_per_sec": round((self.links - self.last_links) / since_dump, 2),
+            "overall_pages_per_sec": round(self.pages / elapsed, 2),
+            "frontier": len(self.frontier) if self.frontier is not None else None,
+            "rss_bytes": rss_bytes(),
+            "stages": {stage: self.stages[stage].summary()
+                       for stage in sorted(self.stages, key=lambda stage: order.get(stage, len(order)))},
+        }
+
+    def dump(self):
+        self.latest = self.snapshot()
+        self.file.write(json.dumps(self.latest) + "\n")
+        self.file.flush()
+        self.last_dump = time.monotonic()
+        self.last_pages = self.pages
+        self.last_links = self.links
+
+    def start_server(self, port):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") != "/metrics":
+                    self.send_error(404)
+                    return
+                body = json.dumps(metrics.latest if metrics.latest is not None else metrics.snapshot()).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format, *args)
+
+        server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        logger.info("Serving metrics on http://127.0.0.1:%s/metrics", server.server_address[1])
+        return server
+
+    def close(self):
+        self.dump()
+        self.file.close()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+class NullMetrics:
+    """
+    Metrics used when they are off, every call is a no-op
+    """
+
+    enabled = False
+
+    def clock(self):
+        return NULL_CLOCK
+
+    def record_page(self, page, clock):
+        pass
+
+    def close(self):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of a thread (the thread that creates the profiler by default) every interval seconds from a
+    background thread and writes the sample counts of every distinct stack to path in the folded format flame graph
+    tools read ("outer;inner;leaf count"). Only that thread is sampled; with worker processes it's the coordinator.
+    The sampler needs the GIL to take a sample, so while it runs the interpreter switches threads ten times per interval
+    seconds, otherwise samples would mostly land where the sampled thread waits on I/O
+    """
+
+    PROFILE_FILE_NAME = "profile.folded"
+
+    def __init__(self, path=PROFILE_FILE_NAME, interval=0.005, thread_id=None):
+        self.path = path
+        self.interval = interval
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.samples = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="sampling-profiler", daemon=True)
+        self.switch_interval = None
+
+    def start(self):
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self.switch_interval, self.interval / 10))
+        self.thread.start()
+        return self
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append("{}:{}".format(os.path.basename(code.co_filename), code.co_name))
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        sys.setswitchinterval(self.switch_interval)
+        with open(self.path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write("{} {}\n".format(stack, count))
+        logger.info("Wrote %s profile samples to %s", sum(self.samples.values()), self.path)
+
+# ================
+# sources:
+# https://www.brendangregg.com/flamegraphs.html
+# https://docs.python.org/3/library/sys.html#sys._current_frames
+# https://docs.python.org/3/library/http.server.html
@@ -0,0 +1,118 @@
+from functools import lru_cache
+import hashlib
+import logging
+
+from lazy_import import lazy_import
+
+# None if it isn't installed, simhash falls back to plain Python
+numpy = lazy_import("numpy")
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_BITS = 64
+
+
+@lru_cache(maxsize=1 << 16)
+def token_hash(token):
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8", errors="surrogateescape"), digest_size=8).digest(),
+                          "little")
+
+
+def simhash(frequencies) -> int:
+    """
+    64 bit SimHash of a page from its token -> count frequencies. Every bit is the sign of the sum of the token weights,
+    added where the token hash has the bit set and subtracted where it doesn't, so pages sharing most of their words get
+    fingerprints that differ in few bits
+    """
+    if not frequencies:
+        return 0
+    hashes = [token_hash(token) for token in frequencies]
+    weights = list(frequencies.values())
+    if numpy is not None:
+        bits = numpy.unpackbits(numpy.array(hashes, dtype="<u8").view(numpy.uint8)[:, None], axis=1, bitorder="little")
+        bits = bits.reshape(len(hashes), FINGERPRINT_BITS).astype(numpy.int64)
+        totals = numpy.array(weights, dtype=numpy.int64) @ (2 * bits - 1)
+        positive = numpy.packbits(totals > 0, bitorder="little")
+        return int.from_bytes(positive.tobytes(), "little")
+    fingerprint = 0
+    for bit in range(FINGERPRINT_BITS):
+        total = 0
+        mask = 1 << bit
+        for h, weight in zip(hashes, weights):
+            total += weight if h & mask else -weight
+        if total > 0:
+            fingerprint |= mask
+    return fingerprint
+
+
+class NearDuplicateIndex:
+    """
+    Banded LSH index of page SimHash fingerprints. The 64 bits are split into max_distance + 1 bands and a page is filed
+    under each of its band values; two fingerprints within max_distance bits of each other agree on at least one whole
+    band, so a lookup only compares against the pages sharing a band with it instead of every page
+
+    Attributes:
+        bands: for every band, band value -> list of (fingerprint, url) of the pages filed under it
+        clusters: url of the first page of a cluster -> urls of its near duplicates
+        pages: number of fingerprints indexed
+    """
+
+    NEAR_DUPLICATES_FILE_NAME = "near_duplicates.txt"
+
+    def __init__(self, max_distance=3):
+        if not 0 <= max_distance < FINGERPRINT_BITS:
+            raise ValueError("max_distance must be between 0 and {}".format(FINGERPRINT_BITS - 1))
+        self.max_distance = max_distance
+        num_bands = max_distance + 1
+        self.band_width = FINGERPRINT_BITS // num_bands
+        self.band_mask = (1 << self.band_width) - 1
+        self.bands: list = [dict() for _ in range(num_bands)]
+        self.clusters: dict = {}
+        self.pages = 0
+        self.duplicates = 0
+
+    def band_values(self, fingerprint):
+        for i in range(len(self.bands)):
+            yield (fingerprint >> (i * self.band_width)) & self.band_mask
+
+    def find(self, fingerprint):
+        """
+        Returns the url of an indexed page within max_distance bits of the fingerprint, None if there is none
+        """
+        for band, value in zip(self.bands, self.band_values(fingerprint)):
+            for candidate, url in band.get(value, ()):
+                if bin(candidate ^ fingerprint).count("1") <= self.max_distance:
+                    return url
+        return None
+
+    def find_or_add(self, fingerprint, url):
+        """
+        Returns the url of the page the given page is a near duplicate of, or indexes the page and returns None
+        """
+        original = self.find(fingerprint)
+        if original is not None:
+            self.clusters.setdefault(original, []).append(url)
+            self.duplicates += 1
+            return original
+        for band, value in zip(self.bands, self.band_values(fingerprint)):
+            band.setdefault(value, []).append((fingerprint, url))
+        self.pages += 1
+        return None
+
+    def write_report(self, path=NEAR_DUPLICATES_FILE_NAME):
+        """
+        Writes every cluster as the url of its first page followed by its near duplicates, indented by a tab
+        """
+        with open(path, "w") as f:
+            f.write("{} near duplicate pages in {} clusters, {} distinct pages\n\n".format(
+                self.duplicates, len(self.clusters), self.pages))
+            for original in sorted(self.clusters):
+                f.write("{}\n".format(original))
+                for duplicate in self.clusters[original]:
+                    f.write("\t{}\n".format(duplicate))
+
+# ================
+# sources:
+# https://www.cs.princeton.edu/courses/archive/spring04/cos598B/bib/CharikarEstim.pdf
+# https://research.google/pubs/detecting-near-duplicates-for-web-crawling/
+# https://numpy.org/doc/stable/reference/generated/numpy.unpackbits.html
@@ -0,0 +1,119 @@
+import logging
+
+from lazy_import import lazy_import
+from metrics import NULL_CLOCK
+from PartA import count_words, tokenize
+
+logger = logging.getLogger(__name__)
+
+# loaded by the first page parsed, a coordinator whose workers parse the pages never needs it
+etree = lazy_import("lxml.etree")
+
+# elements whose text is not part of the page text, BeautifulSoup's get_text() leaves them out as well
+NON_TEXT_TAGS = frozenset(["script", "style", "template"])
+# a page starting with one of these says its own encoding, lxml reads it
+BYTE_ORDER_MARKS = (b"\xef\xbb\xbf", b"\xff\xfe", b"\xfe\xff")
+# how far into a page a charset declaration is looked for, the same window BeautifulSoup searches
+DECLARED_ENCODING_WINDOW = 2048
+
+
+class PageAnalysis:
+    """
+    Everything the crawler needs from the html of a single page, gathered in one pass over the document
+
+    Attributes:
+        hrefs: href attribute of every <a> element in document order, None for anchors without one
+        word_count: number of tokens in the page text
+        word_frequencies: frequencies of the alphabetic, non stop word tokens of the page text
+        tokens: every token of the page text
+    """
+
+    def __init__(self):
+        self.hrefs: list = list()
+        self.word_count = 0
+        self.word_frequencies: dict = {}
+        self.tokens: list = list()
+
+
+class _PageTarget:
+    """
+    lxml parser target receiving the parse events of a page. It keeps the anchors and the text and never builds a tree
+    """
+
+    def __init__(self):
+        self.hrefs: list = list()
+        self.text: list = list()
+        self.skip_depth = 0
+
+    def start(self, tag, attrib):
+        if tag == "a":
+            self.hrefs.append(attrib.get("href"))
+        elif tag in NON_TEXT_TAGS:
+            self.skip_depth += 1
+
+    def end(self, tag):
+        if tag in NON_TEXT_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+
+    def data(self, data):
+        if not self.skip_depth:
+            self.text.append(data)
+
+    def close(self):
+        return self
+
+
+def page_text(content) -> str:
+    """
+    The text of an html page, the concatenation of its text nodes like BeautifulSoup's get_text()
+    """
+    return "".join(_parse(content).text)
+
+
+def _encoding(content):
+    """
+    utf-8 for a page of bytes that is valid utf-8 but neither starts with a byte order mark nor declares a charset, like
+    BeautifulSoup detects it, None to let lxml pick the declared encoding or fall back to latin-1
+    """
+    if not isinstance(content, bytes) or content.isascii() or content.startswith(BYTE_ORDER_MARKS):
+        return None
+    if b"charset" in content[:DECLARED_ENCODING_WINDOW].lower():
+        return None
+    try:
+        content.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+    return "utf-8"
+
+
+def _parse(content) -> _PageTarget:
+    target = _PageTarget()
+    parser = etree.HTMLParser(target=target, encoding=_encoding(content))
+    try:
+        parser.feed(content)
+        parser.close()
+    except etree.LxmlError as e:
+        # keep whatever was parsed before the error, same as a lenient tree builder would
+        logger.debug("html parse error: %s", e)
+    return target
+
+
+def analyze_html(content, stop_words, clock=NULL_CLOCK) -> PageAnalysis:
+    """
+    Parses the html content of a page once and returns its anchors, word count and word frequencies. The page text is
+    tokenized exactly once. stop_words should be a set, clock a metrics.StageClock timing the parse and the tokenizing
+    """
+    target = _parse(content)
+    clock.lap("parse")
+    analysis = PageAnalysis()
+    analysis.hrefs = target.hrefs
+    words = analysis.tokens = tokenize("".join(target.text))
+    analysis.word_count = len(words)
+    analysis.word_frequencies = count_words(words, stop_words)
+    clock.lap("tokenize")
+    return analysis
+
+# ================
+# sources:
+# https://lxml.de/parsing.html#the-target-parser-interface
+# https://lxml.de/parsing.html#the-feed-parser-interface
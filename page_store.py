@@ -0,0 +1,131 @@
+import hashlib
+import logging
+import os
+import pickle
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+PAGE_STORE_FILE_NAME = "page_store.sqlite"
+
+
+def file_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.blake2b(f.read(), digest_size=16).digest()
+
+
+class PageStore:
+    """
+    What a crawl learned about every page, kept for the next crawl of a refreshed corpus: per url the size, mtime and
+    digest of its corpus file and the analysis of the page (the state of its crawler.PageResult). A later crawl reuses
+    the analysis of a page whose file has the same size and mtime, or else the same digest, without reading or parsing
+    the page again. The analysis depends on the crawler settings (url rules, stop words, what pages keep), so the store
+    is emptied when they change
+
+    Worker processes get a read only copy, only the crawling process writes
+
+    Attributes:
+        reused: pages served from the store
+        processed: pages analyzed because they were new or their file changed
+    """
+
+    COMMIT_INTERVAL = 1000
+
+    def __init__(self, path=PAGE_STORE_FILE_NAME, read_only=False):
+        self.path = path
+        self.read_only = read_only
+        if read_only:
+            self.connection = sqlite3.connect("file:{}?mode=ro".format(path), uri=True, check_same_thread=False)
+        else:
+            self.connection = sqlite3.connect(path, check_same_thread=False)
+            # readers (the worker processes) don't block the writer and see its committed pages
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS pages (url BLOB PRIMARY KEY, size INTEGER, "
+                                    "mtime_ns INTEGER, digest BLOB, page BLOB)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self.connection.commit()
+        self.pending = 0
+        self.reused = 0
+        self.processed = 0
+
+    def __reduce__(self):
+        # a worker process opens its own read only connection
+        return PageStore, (self.path, True)
+
+    def check_settings(self, settings):
+        """
+        Empties the store if it was written with other crawler settings than settings, a string
+        """
+        if self.read_only:
+            return
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'settings'").fetchone()
+        if row is not None and row[0] == settings:
+            return
+        if row is not None:
+            logger.info("Crawler settings changed, every page will be analyzed again")
+        self.connection.execute("DELETE FROM pages")
+        self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('settings', ?)", (settings,))
+        self.connection.commit()
+
+    @staticmethod
+    def key(url):
+        return url.encode("utf-8", errors="surrogateescape")
+
+    def lookup(self, url, file_name):
+        """
+        Returns the stored page state of url if its corpus file is unchanged, else None, and the (size, mtime_ns,
+        digest) of the file when the store has to be updated with it, None when it doesn't. Without a corpus file there
+        is nothing to store
+        """
+        if file_name is None:
+            return None, None
+        try:
+            stat = os.stat(file_name)
+        except OSError:
+            return None, None
+        row = self.connection.execute("SELECT size, mtime_ns, digest, page FROM pages WHERE url = ?",
+                                      (self.key(url),)).fetchone()
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return pickle.loads(row[3]), None
+        digest = file_digest(file_name)
+        signature = (stat.st_size, stat.st_mtime_ns, digest)
+        if row is not None and row[2] == digest:
+            # touched but not changed, only the mtime has to be updated
+            return pickle.loads(row[3]), signature
+        return None, signature
+
+    def record(self, page, state):
+        """
+        Counts a merged page and stores its state if its file_signature says the store is out of date
+        """
+        if page.from_store:
+            self.reused += 1
+        elif page.file_signature is not None:
+            self.processed += 1
+        if page.file_signature is None or self.read_only:
+            return
+        size, mtime_ns, digest = page.file_signature
+        self.connection.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)",
+                                (self.key(page.url), size, mtime_ns, digest,
+                                 pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)))
+        self.pending += 1
+        if self.pending >= self.COMMIT_INTERVAL:
+            self.commit()
+
+    def commit(self):
+        self.connection.commit()
+        self.pending = 0
+
+    def stats(self):
+        return {"reused": self.reused, "processed": self.processed}
+
+    def close(self):
+        if not self.read_only:
+            self.commit()
+        self.connection.close()
+
+# ================
+# sources:
+# https://docs.python.org/3/library/sqlite3.html
+# https://www.sqlite.org/wal.html
+# https://www.sqlite.org/uri.html
@@ -0,0 +1,129 @@
+from functools import lru_cache
+import ipaddress
+import os
+import re
+
+# a copy of the public suffix list kept with the code, the same list tldextract ships as its snapshot. It is never
+# refreshed over the network, replace the file to update it
+SUFFIX_LIST_FILE_NAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "public_suffix_list.dat")
+PRIVATE_DOMAINS_MARKER = "// ===BEGIN PRIVATE DOMAINS==="
+RULE_PATTERN = re.compile(r"^(?P<rule>[.*!]*\w\S*)", re.UNICODE | re.MULTILINE)
+IPV4_PATTERN = re.compile(r"^(?:(?:[0-9]|[1-9][0-9]|1[0-9]{2}|2[0-4][0-9]|25[0-5])\.){3}"
+                          r"(?:[0-9]|[1-9][0-9]|1[0-9]{2}|2[0-4][0-9]|25[0-5])$", re.ASCII)
+SCHEME_CHARS = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789+-.")
+# key of the trie nodes that end a rule, host labels are strings so it never collides with one
+END = None
+
+
+def parse_rules(text):
+    """
+    Trie of the ICANN rules of a public suffix list, private domains left out like tldextract does by default. Every
+    node is a dict of label -> child node, the labels of a rule reversed; a node that ends a rule has the END key
+    """
+    root: dict = {}
+    for match in RULE_PATTERN.finditer(text.partition(PRIVATE_DOMAINS_MARKER)[0]):
+        node = root
+        for label in reversed(match.group("rule").split(".")):
+            node = node.setdefault(label, {})
+        node[END] = True
+    return root
+
+
+def host_of(url):
+    """
+    The host of a url as tldextract reads it: scheme, user info, port and trailing dots removed, case kept
+    """
+    double_slash = url.find("//")
+    if double_slash == 0:
+        url = url[2:]
+    elif double_slash >= 2 and url[double_slash - 1] == ":" and not set(url[:double_slash - 1]) - SCHEME_CHARS:
+        url = url[double_slash + 2:]
+    authority = url.partition("/")[0].partition("?")[0].partition("#")[0]
+    host = authority.rpartition("@")[2]
+    if host and host[0] == "[":
+        bracketed = host.partition("]")
+        if bracketed[1]:
+            return bracketed[0] + "]"
+    return host.partition(":")[0].strip().rstrip(".。．｡")
+
+
+def _decode_label(label):
+    label = label.lower()
+    if label.startswith("xn--"):
+        try:
+            return label.encode("ascii").decode("idna")
+        except (UnicodeError, IndexError):
+            pass
+    return label
+
+
+class PublicSuffixList:
+    """
+    Splits hosts into subdomain, registered domain and public suffix with the rules of a public suffix list, giving the
+    same answers as tldextract.extract without its import time or network access. Splits are memoized per url
+    """
+
+    def __init__(self, rules, cache_size=1 << 16):
+        self.rules = rules
+        self.split = lru_cache(maxsize=cache_size)(self._split)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls(parse_rules(f.read()))
+
+    def suffix_index(self, labels):
+        """
+        Index of the first label of the public suffix of a host's labels, None if no rule matches
+        """
+        node = self.rules
+        suffix_index = index = len(labels)
+        for label in reversed(labels):
+            label = _decode_label(label)
+            child = node.get(label)
+            if child is not None:
+                index -= 1
+                node = child
+                if END in node:
+                    suffix_index = index
+                continue
+            if "*" in node:
+                return index if "!" + label in node else index - 1
+            break
+        return suffix_index if suffix_index < len(labels) else None
+
+    def _split(self, url):
+        """
+        (subdomain, domain, suffix) of a url
+        """
+        host = host_of(url).replace("。", ".").replace("．", ".").replace("｡", ".")
+        if len(host) >= 4 and host[0] == "[" and host[-1] == "]":
+            try:
+                ipaddress.IPv6Address(host[1:-1])
+                return "", host, ""
+            except ValueError:
+                pass
+        labels = host.split(".")
+        index = self.suffix_index(labels)
+        if index is None:
+            if len(labels) == 4 and host[:1].isdecimal() and IPV4_PATTERN.match(host):
+                return "", host, ""
+            return ".".join(labels[:-1]), labels[-1], ""
+        return (".".join(labels[:index - 1]) if index >= 2 else "", labels[index - 1] if index > 0 else "",
+                ".".join(labels[index:]))
+
+    def subdomain(self, url):
+        return self.split(url)[0]
+
+    def registered_domain(self, url):
+        """
+        Domain and suffix, empty if either is missing
+        """
+        _, domain, suffix = self.split(url)
+        return domain + "." + suffix if domain and suffix else ""
+
+# ================
+# sources:
+# https://publicsuffix.org/list/
+# https://github.com/publicsuffix/list/wiki/Format#algorithm
+# https://github.com/john-kurkowski/tldextract
@@ -0,0 +1,210 @@
+from collections import defaultdict
+import heapq
+
+from url_canonical import parse_url
+
+# frontier schedulers: one fifo queue for all urls, or a queue per host
+SCHEDULERS = ("fifo", "host")
+
+
+def depth_score(url):
+    """
+    Number of path segments plus one for a query, shallow pages first
+    """
+    parsed = parse_url(url)
+    return len([segment for segment in parsed.path.split("/") if segment]) + (1 if parsed.query else 0)
+
+
+# how the urls of a single host are ordered, lowest score first (ties in the order they were added)
+URL_SCORES = {
+    "fifo": lambda url: 0,
+    "depth": depth_score,
+    "length": len,
+}
+
+
+def host_of(url):
+    try:
+        return parse_url(url).hostname or ""
+    except ValueError:
+        return ""
+
+
+class HostQueues:
+    """
+    A queue of urls per host, used by the frontier in place of its single deque (it supports the append / popleft /
+    len / iteration the frontier uses). Hosts take turns by stride scheduling: each host has a pass value that advances
+    by 1 / weight every time one of its urls is handed out and the host with the lowest pass goes next, so every host
+    with queued urls gets its share no matter how many urls the biggest host has. A host's weight drops with its trap
+    rate, the fraction of urls seen on it that were rejected as traps. Each host is also capped at max_urls_per_host
+    enqueued urls, urls past the cap are dropped
+
+    Attributes:
+        queues: host -> heap of (score, sequence number, url)
+        enqueued: host -> number of urls ever enqueued for the host, counted against max_urls_per_host
+        fetched: host -> number of urls handed out
+        traps: host -> number of trap urls reported with record_trap
+        dropped: host -> number of urls dropped because the host was over its cap
+    """
+
+    def __init__(self, score="fifo", max_urls_per_host=None, trap_penalty=4.0):
+        self.score_name = score
+        self.score = URL_SCORES[score]
+        self.max_urls_per_host = max_urls_per_host
+        self.trap_penalty = trap_penalty
+        self.queues = {}
+        self.turns = []
+        self.passes = {}
+        self.current_pass = 0.0
+        self.sequence = 0
+        # sequence numbers of requeued urls count down, ahead of every queued url
+        self.front_sequence = 0
+        # host -> (pass, sequence number) of the turns of a saved state, used when the host's urls are restored
+        self.saved_turns = {}
+        # [host, number of queued urls] of a saved state, in the order its urls were saved
+        self.saved_queue_sizes = None
+        self.size = 0
+        self.enqueued = defaultdict(int)
+        self.fetched = defaultdict(int)
+        self.traps = defaultdict(int)
+        self.dropped = defaultdict(int)
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        """
+        Queued urls, host by host in the order each host would hand them out
+        """
+        for queue in self.queues.values():
+            for _, _, url in sorted(queue):
+                yield url
+
+    def weight(self, host):
+        traps = self.traps.get(host, 0)
+        if not traps:
+            return 1.0
+        trap_rate = traps / (traps + self.enqueued.get(host, 0))
+        return 1.0 / (1.0 + self.trap_penalty * trap_rate)
+
+    def append(self, url):
+        """
+        Queues a url unless its host is over the cap, returns whether it was queued
+        """
+        host = host_of(url)
+        if self.max_urls_per_host is not None and self.enqueued[host] >= self.max_urls_per_host:
+            self.dropped[host] += 1
+            return False
+        self.enqueued[host] += 1
+        self.restore(url, host)
+        return True
+
+    def restore(self, url, host=None):
+        """
+        Queues a url without counting it against its host's cap, for urls of a saved frontier state
+        """
+        if host is None:
+            host = host_of(url)
+        heapq.heappush(self.host_queue(host), (self.score(url), self.sequence, url))
+        self.sequence += 1
+        self.size += 1
+
+    def restore_all(self, urls):
+        """
+        Queues the urls of a saved state, saved in iteration order. The queue sizes saved with the state tell the host
+        of every url, so the urls needn't be parsed
+        """
+        sizes = self.saved_queue_sizes
+        self.saved_queue_sizes = None
+        if sizes is None or sum(size for _, size in sizes) != len(urls):
+            for url in urls:
+                self.restore(url)
+            return
+        start = 0
+        for host, size in sizes:
+            for url in urls[start:start + size]:
+                self.restore(url, host)
+            start += size
+
+    def requeue(self, url):
+        """
+        Queues a url that was handed out but never crawled ahead of the urls of its host with the same score, and stops
+        counting it as handed out. Urls requeued later go ahead of the ones requeued before
+        """
+        host = host_of(url)
+        self.front_sequence -= 1
+        heapq.heappush(self.host_queue(host), (self.score(url), self.front_sequence, url))
+        self.size += 1
+        self.fetched[host] -= 1
+
+    def host_queue(self, host):
+        queue = self.queues.get(host)
+        if queue is None:
+            queue = self.queues[host] = []
+            turn = self.saved_turns.pop(host, None)
+            if turn is None:
+                # a host that comes back doesn't get to catch up on the turns it missed
+                turn = (max(self.passes.get(host, 0.0), self.current_pass), self.sequence)
+            heapq.heappush(self.turns, (turn[0], turn[1], host))
+        return queue
+
+    def note_enqueued(self, url):
+        """
+        Counts a url against its host's cap without queueing it, for urls of a saved frontier state that were already
+        handed out
+        """
+        self.enqueued[host_of(url)] += 1
+
+    def popleft(self):
+        if not self.size:
+            raise IndexError("pop from an empty frontier")
+        turn, _, host = heapq.heappop(self.turns)
+        queue = self.queues[host]
+        url = heapq.heappop(queue)[2]
+        self.size -= 1
+        self.fetched[host] += 1
+        self.current_pass = turn
+        next_turn = turn + 1.0 / self.weight(host)
+        if queue:
+            heapq.heappush(self.turns, (next_turn, self.sequence, host))
+            self.sequence += 1
+        else:
+            del self.queues[host]
+            self.passes[host] = next_turn
+        return url
+
+    def record_trap(self, url):
+        self.traps[host_of(url)] += 1
+
+    def depths(self):
+        """
+        host -> number of queued urls, deepest queues first
+        """
+        return dict(sorted(((host, len(queue)) for host, queue in self.queues.items()), key=lambda x: x[1],
+                           reverse=True))
+
+    def state(self):
+        """
+        Per host counters and the stride scheduling state to be saved with the frontier, so a restored frontier hands
+        out urls in the same order, and the number of queued urls of every host in iteration order
+        """
+        return {"enqueued": self.enqueued, "fetched": self.fetched, "traps": self.traps, "dropped": self.dropped,
+                "passes": self.passes, "current_pass": self.current_pass, "sequence": self.sequence,
+                "turns": sorted(self.turns), "queue_sizes": [[host, len(queue)] for host, queue in self.queues.items()]}
+
+    def load_state(self, state):
+        """
+        Loads a saved state into an empty HostQueues, before its queued urls are restored
+        """
+        for name in ("enqueued", "fetched", "traps", "dropped"):
+            getattr(self, name).update(state.get(name, {}))
+        self.passes.update(state.get("passes", {}))
+        self.current_pass = state.get("current_pass", 0.0)
+        self.sequence = state.get("sequence", 0)
+        self.saved_turns = {host: (turn, sequence) for turn, sequence, host in state.get("turns", ())}
+        self.saved_queue_sizes = state.get("queue_sizes")
+
+# ================
+# sources:
+# https://en.wikipedia.org/wiki/Stride_scheduling
+# https://docs.python.org/3/library/heapq.html
@@ -0,0 +1,485 @@
+from array import array
+import heapq
+import json
+import logging
+import math
+import mmap
+import os
+import shutil
+import struct
+import sys
+import time
+
+from PartA import tokenize
+
+logger = logging.getLogger(__name__)
+
+INDEX_DIR_NAME = "search_index"
+META_FILE_NAME = "index.json"
+DOCUMENTS_FILE_NAME = "documents.txt"
+LENGTHS_FILE_NAME = "lengths.bin"
+POSTINGS_FILE_NAME = "postings.bin"
+TERMS_FILE_NAME = "terms.bin"
+LEXICON_FILE_NAME = "lexicon.bin"
+DEFERRED_FILE_NAME = "deferred.txt"
+
+# a lexicon entry: offset and length of the term in terms.bin, document frequency, offset and length of the postings
+LEXICON_ENTRY = struct.Struct("<QIIQQ")
+
+
+def encode_varints(numbers, out):
+    """
+    Appends the numbers to the bytearray out as unsigned LEB128 varints, 7 bits per byte
+    """
+    append = out.append
+    for number in numbers:
+        while number >= 0x80:
+            append((number & 0x7F) | 0x80)
+            number >>= 7
+        append(number)
+
+
+def decode_varint(buffer, position):
+    """
+    Returns the varint at position of buffer and the position after it
+    """
+    result = 0
+    shift = 0
+    while True:
+        byte = buffer[position]
+        position += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, position
+        shift += 7
+
+
+def encode_postings(postings):
+    """
+    Encodes a list of (document id, positions) in increasing document order as varints: for every document the gap from
+    the previous document id (the first one from 0), the number of positions and the gaps between the positions
+    """
+    numbers = []
+    append = numbers.append
+    previous = 0
+    for document, positions in postings:
+        append(document - previous)
+        append(len(positions))
+        last = 0
+        for position in positions:
+            append(position - last)
+            last = position
+        previous = document
+    out = bytearray()
+    if max(numbers) < 0x80:
+        # every gap fits in one byte, the common case for frequent terms
+        out.extend(numbers)
+    else:
+        encode_varints(numbers, out)
+    return out
+
+
+def decode_postings(buffer, count, with_positions=True):
+    """
+    Yields the (document id, positions) of the count documents of encoded postings, positions is the number of positions
+    without with_positions
+    """
+    position = 0
+    document = 0
+    for _ in range(count):
+        gap, position = decode_varint(buffer, position)
+        document += gap
+        frequency, position = decode_varint(buffer, position)
+        if not with_positions:
+            for _ in range(frequency):
+                while buffer[position] & 0x80:
+                    position += 1
+                position += 1
+            yield document, frequency
+            continue
+        positions = []
+        offset = 0
+        for _ in range(frequency):
+            gap, position = decode_varint(buffer, position)
+            offset += gap
+            positions.append(offset)
+        yield document, positions
+
+
+def write_segment_entry(f, term, documents, last_document, postings):
+    header = bytearray()
+    encode_varints((len(term), documents, last_document, len(postings)), header)
+    f.write(header)
+    f.write(term)
+    f.write(postings)
+
+
+def read_segment(path):
+    """
+    Yields the (term, number of documents, last document id, postings) entries of a segment file in term order
+    """
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            position = 0
+            end = len(mapped)
+            while position < end:
+                term_length, position = decode_varint(mapped, position)
+                documents, position = decode_varint(mapped, position)
+                last_document, position = decode_varint(mapped, position)
+                postings_length, position = decode_varint(mapped, position)
+                term = mapped[position:position + term_length]
+                position += term_length
+                yield term, documents, last_document, mapped[position:position + postings_length]
+                position += postings_length
+
+
+def numbered_entries(segment, path):
+    for term, documents, last_document, postings in read_segment(path):
+        yield term, segment, documents, last_document, postings
+
+
+def merge_segments(paths, write_entry):
+    """
+    K-way merge of segment files, calling write_entry(term, number of documents, last document id, postings) once per
+    term in term order. The segments must hold increasing document ranges in the order given, so the postings of a term
+    are concatenated with the first document gap of each segment rebased on the last document of the previous one
+    """
+    entries = heapq.merge(*(numbered_entries(segment, path) for segment, path in enumerate(paths)))
+    current = None
+    parts = []
+    documents = last_document = 0
+    for term, _, segment_documents, segment_last, postings in entries:
+        if term != current:
+            if current is not None:
+                write_entry(current, documents, last_document, b"".join(parts))
+            current = term
+            parts = [postings]
+            documents = segment_documents
+        else:
+            first, position = decode_varint(postings, 0)
+            gap = bytearray()
+            encode_varints((first - last_document,), gap)
+            parts.append(bytes(gap))
+            parts.append(postings[position:])
+            documents += segment_documents
+        last_document = segment_last
+    if current is not None:
+        write_entry(current, documents, last_document, b"".join(parts))
+
+
+class IndexWriter:
+    """
+    Builds a positional inverted index of the crawled pages in index_dir. Documents are inverted into in-memory postings
+    that are written out as a sorted segment file every batch_tokens tokens; close() k-way merges the segments into
+    postings.bin and a term dictionary (terms.bin plus the fixed size entries of lexicon.bin) that SearchIndex memory
+    maps. Terms are lowercased tokens.
+
+    Indexing takes at most max_overhead times the rest of the time since the writer was created, the crawl itself: past
+    that budget documents are only appended, as their token text, to deferred.txt and are inverted by close(), after
+    the crawl
+
+    Attributes:
+        documents: number of documents inverted so far, also the next document id
+        deferred: number of documents deferred to close()
+        spent: seconds spent in add_document
+    """
+
+    BATCH_TOKENS = 1 << 21
+    MERGE_FAN_IN = 64
+
+    def __init__(self, index_dir=INDEX_DIR_NAME, batch_tokens=BATCH_TOKENS, max_overhead=0.1):
+        self.index_dir = index_dir
+        self.batch_tokens = batch_tokens
+        self.max_overhead = max_overhead
+        shutil.rmtree(index_dir, ignore_errors=True)
+        os.makedirs(index_dir)
+        self.batch: dict = {}
+        self.batch_size = 0
+        self.segments: list = list()
+        self.lengths = array("I")
+        self.tokens = 0
+        self.documents = 0
+        self.deferred = 0
+        self.spent = 0.0
+        self.start = self.last = time.perf_counter()
+        self.documents_file = self.open_file(DOCUMENTS_FILE_NAME, "w")
+        self.deferred_file = self.open_file(DEFERRED_FILE_NAME, "w")
+
+    def open_file(self, file_name, mode):
+        if "b" in mode:
+            return open(os.path.join(self.index_dir, file_name), mode)
+        return open(os.path.join(self.index_dir, file_name), mode, encoding="utf-8", errors="surrogateescape")
+
+    def add_document(self, url, tokens):
+        """
+        Indexes the tokens of a page, or defers them if indexing is over its time budget
+        """
+        start = time.perf_counter()
+        # tokens are runs of letters and digits, so the space separated text splits back into the same tokens
+        text = " ".join(tokens).lower()
+        if self.spent > self.max_overhead * (start - self.start - self.spent):
+            self.deferred_file.write("{}\t{}\n".format(url, text))
+            self.deferred += 1
+        else:
+            self.invert(url, text.split())
+        self.last = time.perf_counter()
+        self.spent += self.last - start
+
+    def invert(self, url, terms):
+        document = self.documents
+        self.documents += 1
+        self.documents_file.write(url + "\n")
+        self.lengths.append(len(terms))
+        self.tokens += len(terms)
+        positions: dict = {}
+        for position, term in enumerate(terms):
+            term_positions = positions.get(term)
+            if term_positions is None:
+                positions[term] = [position]
+            else:
+                term_positions.append(position)
+        batch = self.batch
+        for term, term_positions in positions.items():
+            postings = batch.get(term)
+            if postings is None:
+                batch[term] = [(document, term_positions)]
+            else:
+                postings.append((document, term_positions))
+        self.batch_size += len(terms)
+        if self.batch_size >= self.batch_tokens:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the in-memory postings as a segment sorted by term
+        """
+        if not self.batch:
+            return
+        path = os.path.join(self.index_dir, "segment-{:06d}.seg".format(len(self.segments)))
+        with open(path, "wb") as f:
+            for term in sorted(self.batch):
+                postings = self.batch[term]
+                write_segment_entry(f, term.encode("utf-8", errors="surrogateescape"), len(postings), postings[-1][0],
+                                    encode_postings(postings))
+        self.segments.append(path)
+        self.batch = {}
+        self.batch_size = 0
+
+    def close(self):
+        """
+        Inverts the deferred documents, merges the segments and writes the term dictionary, the document urls and
+        lengths and index.json
+        """
+        self.deferred_file.close()
+        with self.open_file(DEFERRED_FILE_NAME, "r") as f:
+            for line in f:
+                url, text = line.rstrip("\n").split("\t", 1)
+                self.invert(url, text.split())
+        os.remove(os.path.join(self.index_dir, DEFERRED_FILE_NAME))
+        self.flush()
+        self.documents_file.close()
+        with self.open_file(LENGTHS_FILE_NAME, "wb") as f:
+            lengths = self.lengths
+            if sys.byteorder == "big":
+                lengths = array("I", lengths)
+                lengths.byteswap()
+            lengths.tofile(f)
+        segments = self.segments
+        while len(segments) > self.MERGE_FAN_IN:
+            segments = self.merge_level(segments)
+        terms = self.write_dictionary(segments)
+        for path in segments:
+            os.remove(path)
+        meta = {"documents": self.documents, "tokens": self.tokens, "terms": terms, "segments": len(self.segments),
+                "deferred": self.deferred}
+        with self.open_file(META_FILE_NAME, "w") as f:
+            json.dump(meta, f)
+        logger.info("Search index: %s", self.stats())
+
+    def merge_level(self, segments):
+        """
+        Merges the segments MERGE_FAN_IN at a time so the final merge doesn't open too many files at once
+        """
+        merged = []
+        for i in range(0, len(segments), self.MERGE_FAN_IN):
+            group = segments[i:i + self.MERGE_FAN_IN]
+            path = group[0] + ".merged"
+            with open(path, "wb") as f:
+                merge_segments(group, lambda *entry: write_segment_entry(f, *entry))
+            for segment in group:
+                os.remove(segment)
+            os.replace(path, group[0])
+            merged.append(group[0])
+        return merged
+
+    def write_dictionary(self, segments):
+        terms = 0
+        with self.open_file(POSTINGS_FILE_NAME, "wb") as postings_file, \
+                self.open_file(TERMS_FILE_NAME, "wb") as terms_file, \
+                self.open_file(LEXICON_FILE_NAME, "wb") as lexicon_file:
+            term_offset = postings_offset = 0
+
+            def write_entry(term, documents, last_document, postings):
+                nonlocal terms, term_offset, postings_offset
+                lexicon_file.write(LEXICON_ENTRY.pack(term_offset, len(term), documents, postings_offset,
+                                                      len(postings)))
+                terms_file.write(term)
+                postings_file.write(postings)
+                term_offset += len(term)
+                postings_offset += len(postings)
+                terms += 1
+
+            merge_segments(segments, write_entry)
+        return terms
+
+    def stats(self):
+        # the crawl time is up to the last document added
+        elapsed = self.last - self.start
+        return {"documents": self.documents, "deferred": self.deferred, "segments": len(self.segments),
+                "seconds": round(self.spent, 3),
+                "overhead": round(self.spent / (elapsed - self.spent), 4) if elapsed > self.spent else 0.0}
+
+
+def _map(path):
+    """
+    Read only memory map of a file, None for an empty file, which can't be mapped
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class SearchIndex:
+    """
+    Queries an index written by IndexWriter. The term dictionary and the postings are memory mapped and a term is found
+    by binary search over the fixed size lexicon entries, so opening the index doesn't read it
+    """
+
+    def __init__(self, index_dir=INDEX_DIR_NAME):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, META_FILE_NAME)) as f:
+            self.meta = json.load(f)
+        with open(os.path.join(index_dir, DOCUMENTS_FILE_NAME), encoding="utf-8", errors="surrogateescape") as f:
+            self.urls = [line.rstrip("\n") for line in f]
+        self.lengths = array("I")
+        with open(os.path.join(index_dir, LENGTHS_FILE_NAME), "rb") as f:
+            self.lengths.frombytes(f.read())
+        if sys.byteorder == "big":
+            self.lengths.byteswap()
+        self.average_length = self.meta["tokens"] / self.meta["documents"] if self.meta["documents"] else 0.0
+        self.lexicon = _map(os.path.join(index_dir, LEXICON_FILE_NAME))
+        self.terms = _map(os.path.join(index_dir, TERMS_FILE_NAME))
+        self.postings_map = _map(os.path.join(index_dir, POSTINGS_FILE_NAME))
+
+    def __len__(self):
+        return self.meta["documents"]
+
+    def term_at(self, entry):
+        term_offset, term_length, documents, postings_offset, postings_length = LEXICON_ENTRY.unpack_from(
+            self.lexicon, entry * LEXICON_ENTRY.size)
+        return self.terms[term_offset:term_offset + term_length], documents, postings_offset, postings_length
+
+    def lookup(self, term):
+        """
+        Returns (document frequency, postings offset, postings length) of a term, None if no document has it
+        """
+        if self.lexicon is None:
+            return None
+        key = term.lower().encode("utf-8", errors="surrogateescape")
+        low, high = 0, len(self.lexicon) // LEXICON_ENTRY.size
+        while low < high:
+            middle = (low + high) // 2
+            if self.term_at(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low * LEXICON_ENTRY.size < len(self.lexicon):
+            found, documents, postings_offset, postings_length = self.term_at(low)
+            if found == key:
+                return documents, postings_offset, postings_length
+        return None
+
+    def postings(self, term, with_positions=True):
+        """
+        Yields the (document id, positions) of the documents that have the term, see decode_postings
+        """
+        entry = self.lookup(term)
+        if entry is None:
+            return iter(())
+        documents, offset, length = entry
+        return decode_postings(self.postings_map[offset:offset + length], documents, with_positions)
+
+    def search(self, query, top=10, phrase=False, k1=1.2, b=0.75):
+        """
+        Returns the (url, score) of the top documents for the tokens of query by BM25. With phrase only documents that
+        have the tokens next to each other in query order are scored
+        """
+        terms = [term.lower() for term in tokenize(query)]
+        if not terms or not len(self):
+            return []
+        scores: dict = {}
+        if phrase:
+            matches = self.phrase_matches(terms)
+            if not matches:
+                return []
+        for term in set(terms):
+            entry = self.lookup(term)
+            if entry is None:
+                continue
+            documents = entry[0]
+            idf = math.log(1.0 + (len(self) - documents + 0.5) / (documents + 0.5))
+            for document, frequency in self.postings(term, with_positions=False):
+                if phrase and document not in matches:
+                    continue
+                norm = k1 * (1.0 - b + b * self.lengths[document] / self.average_length)
+                scores[document] = scores.get(document, 0.0) + idf * frequency * (k1 + 1.0) / (frequency + norm)
+        best = heapq.nlargest(top, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [(self.urls[document], score) for document, score in best]
+
+    def phrase_matches(self, terms):
+        """
+        Ids of the documents where the terms follow each other
+        """
+        # starts: document -> positions where the phrase so far could start
+        starts = None
+        for offset, term in enumerate(terms):
+            next_starts = {}
+            for document, positions in self.postings(term):
+                if starts is None:
+                    next_starts[document] = set(positions)
+                elif document in starts:
+                    shifted = starts[document].intersection(position - offset for position in positions)
+                    if shifted:
+                        next_starts[document] = shifted
+            starts = next_starts
+            if not starts:
+                break
+        return set(starts)
+
+    def close(self):
+        for mapped in (self.lexicon, self.terms, self.postings_map):
+            if mapped is not None:
+                mapped.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Searches the index a crawl with --search-index built")
+    parser.add_argument("query", help="words to search for")
+    parser.add_argument("--index-dir", default=INDEX_DIR_NAME, help="directory of the index (default: %(default)s)")
+    parser.add_argument("--top", type=int, default=10, help="number of results")
+    parser.add_argument("--phrase", action="store_true", help="only match the words next to each other")
+    args = parser.parse_args()
+    index = SearchIndex(args.index_dir)
+    for url, score in index.search(args.query, top=args.top, phrase=args.phrase):
+        print("{:.4f} {}".format(score, url))
+    index.close()
+
+# ================
+# sources:
+# https://nlp.stanford.edu/IR-book/html/htmledition/blocked-sort-based-indexing-1.html
+# https://nlp.stanford.edu/IR-book/html/htmledition/variable-byte-codes-1.html
+# https://nlp.stanford.edu/IR-book/html/htmledition/positional-indexes-1.html
+# https://en.wikipedia.org/wiki/Okapi_BM25
@@ -0,0 +1,194 @@
+from array import array
+import hashlib
+import sys
+
+# seen set backends a Frontier can be created with
+SEEN_BACKENDS = ("set", "fingerprint", "bloom")
+
+
+def url_fingerprint(url):
+    """
+    64 bit fingerprint of a url. 0 marks an empty slot in FingerprintSet, so it is never returned
+    """
+    digest = hashlib.blake2b(url.encode("utf-8", errors="surrogateescape"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") or 1
+
+
+class BloomFilter:
+    """
+    Bit array answering "definitely not added" for most urls that were never added, with k bit positions per
+    fingerprint derived by double hashing
+    """
+
+    def __init__(self, capacity, bits_per_item=10):
+        self.num_bits = max(64, capacity * bits_per_item)
+        # k = ln 2 * bits per item minimizes the false positive rate
+        self.num_hashes = max(1, round(0.693 * bits_per_item))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def add(self, fingerprint):
+        bits = self.bits
+        num_bits = self.num_bits
+        position = fingerprint & 0xffffffff
+        step = (fingerprint >> 32) | 1
+        for _ in range(self.num_hashes):
+            position = (position + step) % num_bits
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, fingerprint):
+        bits = self.bits
+        num_bits = self.num_bits
+        position = fingerprint & 0xffffffff
+        step = (fingerprint >> 32) | 1
+        for _ in range(self.num_hashes):
+            position = (position + step) % num_bits
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def memory_bytes(self):
+        return sys.getsizeof(self.bits)
+
+
+class FingerprintSet:
+    """
+    Set of urls that only stores a 64 bit fingerprint per url, in an open addressing (linear probing) table backed by a
+    flat array, about 8 / MAX_LOAD bytes per url instead of a Python string. Two urls with the same fingerprint are
+    treated as the same url; with 64 bit fingerprints that is expected once in about 2^32 (four billion) urls
+
+    With use_bloom the table is fronted by a Bloom filter, rebuilt from the table whenever the table grows, so most
+    lookups of new urls are answered without probing the table
+
+    Attributes:
+        lookups: number of membership tests
+        bloom_rejects: lookups answered by the Bloom filter alone
+        bloom_false_positives: lookups the Bloom filter passed on that were not in the table
+    """
+
+    MAX_LOAD = 0.6
+    BLOOM_BITS_PER_URL = 10
+
+    def __init__(self, capacity=1024, use_bloom=False):
+        size = 1024
+        while size * self.MAX_LOAD < capacity:
+            size *= 2
+        self.table = array("Q", bytes(8 * size))
+        self.mask = size - 1
+        self.count = 0
+        self.use_bloom = use_bloom
+        self.bloom = BloomFilter(size, self.BLOOM_BITS_PER_URL) if use_bloom else None
+        self.lookups = 0
+        self.bloom_rejects = 0
+        self.bloom_false_positives = 0
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, url):
+        return self.contains_fingerprint(url_fingerprint(url))
+
+    def add(self, url):
+        self.add_fingerprint(url_fingerprint(url))
+
+    def update(self, urls):
+        for url in urls:
+            self.add_fingerprint(url_fingerprint(url))
+
+    def contains_fingerprint(self, fingerprint):
+        self.lookups += 1
+        if self.bloom is not None and fingerprint not in self.bloom:
+            self.bloom_rejects += 1
+            return False
+        table = self.table
+        mask = self.mask
+        i = fingerprint & mask
+        while True:
+            slot = table[i]
+            if slot == fingerprint:
+                return True
+            if slot == 0:
+                if self.bloom is not None:
+                    self.bloom_false_positives += 1
+                return False
+            i = (i + 1) & mask
+
+    def add_fingerprint(self, fingerprint):
+        table = self.table
+        mask = self.mask
+        i = fingerprint & mask
+        while True:
+            slot = table[i]
+            if slot == fingerprint:
+                return
+            if slot == 0:
+                break
+            i = (i + 1) & mask
+        table[i] = fingerprint
+        self.count += 1
+        if self.bloom is not None:
+            self.bloom.add(fingerprint)
+        if self.count > self.MAX_LOAD * len(table):
+            self._grow()
+
+    def _grow(self):
+        old_table = self.table
+        self.table = array("Q", bytes(16 * len(old_table)))
+        self.mask = len(self.table) - 1
+        self.count = 0
+        if self.use_bloom:
+            self.bloom = BloomFilter(len(self.table), self.BLOOM_BITS_PER_URL)
+        for fingerprint in old_table:
+            if fingerprint:
+                self.add_fingerprint(fingerprint)
+
+    def fingerprints(self):
+        """
+        The stored fingerprints as an array, in table order
+        """
+        return array("Q", (fingerprint for fingerprint in self.table if fingerprint))
+
+    def memory_bytes(self):
+        size = sys.getsizeof(self.table)
+        if self.bloom is not None:
+            size += self.bloom.memory_bytes()
+        return size
+
+    def stats(self):
+        return {"urls": self.count, "memory_bytes": self.memory_bytes(), "lookups": self.lookups,
+                "bloom_rejects": self.bloom_rejects, "bloom_false_positives": self.bloom_false_positives}
+
+
+def make_seen_set(backend):
+    if backend == "set":
+        return set()
+    if backend == "fingerprint":
+        return FingerprintSet()
+    if backend == "bloom":
+        return FingerprintSet(use_bloom=True)
+    raise ValueError("unknown seen set backend {}, expected one of {}".format(backend, ", ".join(SEEN_BACKENDS)))
+
+
+def seen_set_memory(seen):
+    """
+    Approximate memory used by a seen set in bytes, counting the url strings of a plain set
+    """
+    if isinstance(seen, FingerprintSet):
+        return seen.memory_bytes()
+    return sys.getsizeof(seen) + sum(sys.getsizeof(url) for url in seen)
+
+
+def measure_false_positive_rate(seen, samples=100000):
+    """
+    Looks up urls that were never added and returns the fraction reported as seen
+    """
+    hits = 0
+    for i in range(samples):
+        if "never-added://{}/{}".format(id(seen), i) in seen:
+            hits += 1
+    return hits / samples if samples else 0.0
+
+# ================
+# sources:
+# https://en.wikipedia.org/wiki/Open_addressing
+# https://en.wikipedia.org/wiki/Bloom_filter#Optimal_number_of_hash_functions
+# https://www.eecs.harvard.edu/~michaelm/postscripts/rsa2008.pdf
@@ -0,0 +1,328 @@
+import bisect
+from collections import defaultdict
+import hashlib
+import json
+import logging
+import os
+import time
+
+from analytics import CrawlAnalytics
+from corpus import Corpus
+from crawler import Crawler
+from frontier import Frontier
+from near_duplicates import NearDuplicateIndex
+from trap_detector import TrapDetector
+
+logger = logging.getLogger(__name__)
+
+SHARD_DIR_NAME = "shards"
+
+
+def shard_key(url, suffixes):
+    """
+    The subdomain and registered domain of a url, as the public_suffix.PublicSuffixList suffixes splits them. All urls
+    of a host go to the same shard
+    """
+    return ".".join(part for part in (suffixes.subdomain(url), suffixes.registered_domain(url)) if part)
+
+
+def ring_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8", errors="surrogateescape"), digest_size=8).digest(),
+                          "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring of the shards. Every shard is placed at replicas points of the ring and a url belongs to the
+    shard of the first point at or after the hash of its shard_key, so adding a shard only moves the hosts that land
+    on the new shard's points
+    """
+
+    def __init__(self, shards, replicas=64):
+        self.shards = shards
+        points = sorted((ring_hash("{}-{}".format(shard, replica)), shard)
+                        for shard in range(shards) for replica in range(replicas))
+        self.points = [point for point, _ in points]
+        self.owners = [shard for _, shard in points]
+
+    def shard_of(self, key):
+        """
+        The shard of a shard_key
+        """
+        return self.owners[bisect.bisect_left(self.points, ring_hash(key)) % len(self.points)]
+
+
+class Spool:
+    """
+    Local transport between shards through a shared directory (a local disk, or a network mount for shards on several
+    machines). A batch of urls for a shard is written to a temporary file and renamed into the shard's inbox, so a
+    reader only ever sees whole batches. Each shard also keeps a status file that the coordinator reads to detect the
+    end of the crawl, and the coordinator creates a DONE file when it has ended
+    """
+
+    DONE_FILE_NAME = "DONE"
+
+    def __init__(self, spool_dir, shard_id):
+        self.spool_dir = spool_dir
+        self.shard_id = shard_id
+        self.sequence = 0
+        self.version = 0
+        os.makedirs(inbox_dir(spool_dir, shard_id), exist_ok=True)
+
+    def send(self, shard, urls):
+        name = "{:08d}-{}-{}.urls".format(self.sequence, self.shard_id, os.getpid())
+        self.sequence += 1
+        temp_file = os.path.join(self.spool_dir, "." + name + ".tmp")
+        with open(temp_file, "w", encoding="utf-8", errors="surrogateescape") as f:
+            f.writelines(url + "\n" for url in urls)
+        os.makedirs(inbox_dir(self.spool_dir, shard), exist_ok=True)
+        os.replace(temp_file, os.path.join(inbox_dir(self.spool_dir, shard), name))
+
+    def pending(self):
+        return sorted(os.listdir(inbox_dir(self.spool_dir, self.shard_id)))
+
+    def receive(self, names):
+        """
+        Reads and removes the given batches of the inbox, yields the urls of each batch
+        """
+        inbox = inbox_dir(self.spool_dir, self.shard_id)
+        for name in names:
+            path = os.path.join(inbox, name)
+            with open(path, encoding="utf-8", errors="surrogateescape") as f:
+                urls = [line.rstrip("\n") for line in f]
+            os.remove(path)
+            yield urls
+
+    def write_status(self, idle, **counters):
+        self.version += 1
+        status = dict(counters, idle=idle, version=self.version, pid=os.getpid())
+        status_file = status_file_name(self.spool_dir, self.shard_id)
+        with open(status_file + ".tmp", "w") as f:
+            json.dump(status, f)
+        os.replace(status_file + ".tmp", status_file)
+
+    def done(self):
+        return os.path.exists(os.path.join(self.spool_dir, self.DONE_FILE_NAME))
+
+
+def inbox_dir(spool_dir, shard):
+    return os.path.join(spool_dir, "inbox-{}".format(shard))
+
+
+def status_file_name(spool_dir, shard):
+    return os.path.join(spool_dir, "status-{}.json".format(shard))
+
+
+def shard_output_dir(spool_dir, shard):
+    return os.path.join(spool_dir, "shard-{}".format(shard))
+
+
+class ShardCrawler(Crawler):
+    """
+    Crawler of one shard. It only fetches the urls the ring assigns to its shard; links to other shards are sent to
+    them in batches of batch_size through the spool, and links other shards send are read from its inbox every
+    receive_interval pages and whenever it runs out of urls. An idle shard waits for more links until the coordinator
+    says the crawl is over
+    """
+
+    BATCH_SIZE = 500
+    RECEIVE_INTERVAL = 100
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, frontier, corpus, ring, spool, batch_size=BATCH_SIZE, **kwargs):
+        super().__init__(frontier, corpus, **kwargs)
+        self.ring = ring
+        self.spool = spool
+        self.shard_id = spool.shard_id
+        self.batch_size = batch_size
+        self.outbox = defaultdict(list)
+        self.sent = 0
+        self.received = 0
+
+    def shard_of(self, url):
+        return self.ring.shard_of(shard_key(url, self.suffixes))
+
+    def add_links(self, urls):
+        owned = []
+        for url in urls:
+            shard = self.shard_of(url)
+            if shard == self.shard_id:
+                owned.append(url)
+            else:
+                self.forward(shard, url)
+        super().add_links(owned)
+
+    def forward(self, shard, url):
+        batch = self.outbox[shard]
+        batch.append(url)
+        if len(batch) >= self.batch_size:
+            self.flush(shard)
+
+    def flush(self, shard):
+        urls = self.outbox.pop(shard)
+        self.spool.send(shard, urls)
+        self.sent += len(urls)
+
+    def write_status(self, idle):
+        self.spool.write_status(idle, fetched=self.frontier.fetched, sent=self.sent, received=self.received)
+
+    def start_crawling(self):
+        # the status says busy before anything is taken from the inbox, see wait_for_shards
+        self.write_status(idle=False)
+        idle = False
+        pages = 0
+        while True:
+            if idle or pages % self.RECEIVE_INTERVAL == 0:
+                names = self.spool.pending()
+                if names:
+                    if idle:
+                        self.write_status(idle=False)
+                        idle = False
+                    for urls in self.spool.receive(names):
+                        self.received += len(urls)
+                        super().add_links(urls)
+            if self.frontier.has_next_url():
+                url = self.frontier.get_next_url()
+                pages += 1
+                if self.shard_of(url) == self.shard_id:
+                    self.merge_page_result(self.process_url(url))
+                else:
+                    # the seed url, every shard starts from it
+                    self.forward(self.shard_of(url), url)
+                    self.frontier.mark_fetched(url)
+                continue
+            for shard in list(self.outbox):
+                self.flush(shard)
+            if not idle:
+                self.write_status(idle=True)
+                idle = True
+            if self.spool.done():
+                break
+            time.sleep(self.POLL_INTERVAL)
+        logger.info("Shard %s finished. Fetched: %s, sent: %s, received: %s", self.shard_id, self.frontier.fetched,
+                    self.sent, self.received)
+
+    def write_analytics(self):
+        self.analytics.write_state()
+        super().write_analytics()
+
+
+def run_shard(corpus_dir, shard_id, shards, spool_dir=SHARD_DIR_NAME, frontier_options=None, near_duplicates=None,
+              trap_detector=False, top_words_capacity=10000):
+    """
+    Crawls one shard with its own frontier state in frontier_state/shard-<id> and its analytics in
+    <spool_dir>/shard-<id>
+    """
+    frontier = Frontier(os.path.join(Frontier.FRONTIER_DIR_NAME, "shard-{}".format(shard_id)),
+                        **(frontier_options or {}))
+    frontier.load_frontier()
+    output_dir = shard_output_dir(spool_dir, shard_id)
+    os.makedirs(output_dir, exist_ok=True)
+    crawler = ShardCrawler(frontier, Corpus(corpus_dir), HashRing(shards), Spool(spool_dir, shard_id),
+                           analytics=CrawlAnalytics(output_dir, top_words_capacity=top_words_capacity),
+                           near_duplicates=NearDuplicateIndex(near_duplicates) if near_duplicates is not None else None,
+                           trap_detector=TrapDetector() if trap_detector else None)
+    try:
+        crawler.start_crawling()
+    finally:
+        frontier.close()
+    crawler.write_analytics()
+
+
+def read_statuses(spool_dir, shards):
+    statuses = {}
+    for shard in range(shards):
+        try:
+            with open(status_file_name(spool_dir, shard)) as f:
+                statuses[shard] = json.load(f)
+        except (OSError, ValueError):
+            pass
+    return statuses
+
+
+def wait_for_shards(spool_dir, shards, processes=(), poll_interval=0.2):
+    """
+    Waits until the crawl is over and tells the shards by creating the DONE file. The crawl is over when every shard is
+    idle, no batch is waiting in an inbox and no status changed while the inboxes were listed: a shard only leaves idle
+    for a batch in its inbox and says so before taking it, and only a busy shard sends batches
+    """
+    while True:
+        for process in processes:
+            if process.exitcode is not None and process.exitcode != 0:
+                raise RuntimeError("shard process {} exited with code {}".format(process.name, process.exitcode))
+        statuses = read_statuses(spool_dir, shards)
+        if len(statuses) == shards and all(status["idle"] for status in statuses.values()):
+            if not any(os.listdir(inbox_dir(spool_dir, shard)) for shard in range(shards)
+                       if os.path.isdir(inbox_dir(spool_dir, shard))):
+                if read_statuses(spool_dir, shards) == statuses:
+                    open(os.path.join(spool_dir, Spool.DONE_FILE_NAME), "w").close()
+                    return statuses
+        time.sleep(poll_interval)
+
+
+def reset_spool(spool_dir, shards):
+    """
+    Removes the DONE, status and analytics state files of an earlier crawl, batches waiting in the inboxes are kept
+    """
+    os.makedirs(spool_dir, exist_ok=True)
+    paths = [os.path.join(spool_dir, Spool.DONE_FILE_NAME)]
+    for shard in range(shards):
+        paths.append(status_file_name(spool_dir, shard))
+        paths.append(os.path.join(shard_output_dir(spool_dir, shard), CrawlAnalytics.STATE_FILE_NAME))
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def merge_shard_analytics(spool_dir, shards, output_dir=".", top_words_capacity=10000):
+    analytics = CrawlAnalytics(output_dir, top_words_capacity=top_words_capacity)
+    for shard in range(shards):
+        analytics.merge_output(shard_output_dir(spool_dir, shard))
+    try:
+        analytics.finish()
+    except ValueError as e:
+        logger.warning("Merged analytics not written, possibly empty corpus: %s", e)
+    return analytics
+
+
+def crawl_sharded(corpus_dir, shards, shard_id=None, coordinate_only=False, spool_dir=SHARD_DIR_NAME, **options):
+    """
+    Runs a sharded crawl. With a shard_id only that shard is crawled, by a process of a crawl coordinated elsewhere.
+    Otherwise the coordinator runs here: it starts every shard as a local process, unless coordinate_only is set
+    because the shards run on other machines sharing spool_dir, waits for the crawl to end and merges the analytics of
+    all shards into analytics.txt, valid_urls.txt and trapped_urls.txt
+    """
+    if shard_id is not None:
+        run_shard(corpus_dir, shard_id, shards, spool_dir, **options)
+        return
+    reset_spool(spool_dir, shards)
+    processes = []
+    if not coordinate_only:
+        import multiprocessing
+
+        for shard in range(shards):
+            process = multiprocessing.Process(target=run_shard, name="shard-{}".format(shard),
+                                              args=(corpus_dir, shard, shards, spool_dir), kwargs=options)
+            process.start()
+            processes.append(process)
+    try:
+        statuses = wait_for_shards(spool_dir, shards, processes)
+    except BaseException:
+        open(os.path.join(spool_dir, Spool.DONE_FILE_NAME), "w").close()
+        raise
+    finally:
+        for process in processes:
+            process.join()
+    logger.info("All %s shards idle, fetched per shard: %s", shards,
+                {shard: status["fetched"] for shard, status in sorted(statuses.items())})
+    if coordinate_only:
+        # the shards write their analytics after they see the DONE file
+        while any(not os.path.exists(os.path.join(shard_output_dir(spool_dir, shard), CrawlAnalytics.STATE_FILE_NAME))
+                  for shard in range(shards)):
+            time.sleep(ShardCrawler.POLL_INTERVAL)
+    merge_shard_analytics(spool_dir, shards, top_words_capacity=options.get("top_words_capacity", 10000))
+
+# ================
+# sources:
+# https://en.wikipedia.org/wiki/Consistent_hashing
+# https://docs.python.org/3/library/os.html#os.replace
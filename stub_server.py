@@ -0,0 +1,202 @@
+import argparse
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import logging
+import threading
+import time
+from urllib.parse import unquote
+
+from corpus import Corpus
+from url_canonical import parse_url
+
+logger = logging.getLogger(__name__)
+
+
+class StubServer:
+    """
+    A local stand-in for the web: an HTTP/1.1 forward proxy that answers every url from the corpus, so the crawler's
+    HttpFetcher can be run and measured without touching the network. A corpus record is served with its status code,
+    Content-Type and raw content, a url the corpus doesn't have gets a 404. A redirected record is answered with a 301
+    to its final_url, which then serves the record's content unless the corpus has a file of its own for it. Requests
+    for /robots.txt that the corpus doesn't answer get robots_txt, or a 404 (everything allowed) without one
+
+    Requests are counted per host with their arrival times, so how polite a client was can be checked afterwards
+
+    Attributes:
+        requests: requests answered
+        max_in_flight: most requests being answered at the same time
+    """
+
+    def __init__(self, corpus, host="127.0.0.1", port=0, latency=0.0, robots_txt=None):
+        self.corpus = corpus
+        self.latency = latency
+        self.robots_txt = robots_txt
+        self.lock = threading.Lock()
+        self.arrivals = defaultdict(list)
+        self.aliases: dict = {}
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.server = ThreadingHTTPServer((host, port), self.handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def address(self):
+        """
+        "host:port" the server listens on, HttpFetcher's proxy
+        """
+        host, port = self.server.server_address[:2]
+        return "{}:{}".format(host, port)
+
+    def handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # keep-alive, every response has a Content-Length
+            protocol_version = "HTTP/1.1"
+            # headers and body are written separately, Nagle's algorithm would hold the body back on a kept alive
+            # connection until the client's delayed ack
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                stub.handle(self)
+
+            def log_message(self, format, *args):
+                logger.debug(format, *args)
+
+        return Handler
+
+    def start(self):
+        """
+        Serves on a background thread, returns self
+        """
+        self.thread = threading.Thread(target=self.server.serve_forever, name="stub-server", daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def file_name(self, url):
+        file_name = self.corpus.get_file_name(url)
+        if file_name is None and "%" in url:
+            file_name = self.corpus.get_file_name(unquote(url))
+        if file_name is None:
+            with self.lock:
+                file_name = self.aliases.get(url)
+        return file_name
+
+    def response(self, url):
+        """
+        (status, headers, body) of url
+        """
+        try:
+            parsed = parse_url(url)
+        except ValueError:
+            return 400, {}, b""
+        file_name = self.file_name(url)
+        if file_name is None:
+            if parsed.path == "/robots.txt" and self.robots_txt is not None:
+                return 200, {"Content-Type": "text/plain"}, self.robots_txt.encode("utf-8")
+            return 404, {"Content-Type": "text/html"}, b""
+        url_data = self.corpus.read_file(url, file_name)
+        final_url = url_data["final_url"]
+        if url_data["is_redirected"] and final_url and final_url != url:
+            if self.corpus.get_file_name(final_url) is None:
+                with self.lock:
+                    self.aliases[final_url] = file_name
+            return 301, {"Location": final_url}, b""
+        content = url_data["content"] or b""
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        headers = {"Content-Type": url_data["content_type"]} if url_data["content_type"] else {}
+        return url_data["http_code"], headers, content
+
+    def handle(self, request):
+        url = request.path
+        if url.startswith("/"):
+            # a client that isn't using the server as a proxy
+            url = "http://{}{}".format(request.headers.get("Host", self.address), url)
+        host = parse_url(url).netloc.lower() if "://" in url else ""
+        with self.lock:
+            self.requests += 1
+            self.arrivals[host].append(time.monotonic())
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            status, headers, body = self.response(url)
+            request.send_response(status)
+            for name, value in headers.items():
+                request.send_header(name, value)
+            request.send_header("Content-Length", str(len(body)))
+            request.end_headers()
+            request.wfile.write(body)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def rate_violations(self, rate, burst=1, jitter=0.02):
+        """
+        Hosts whose requests came faster than a token bucket of rate requests per second and burst requests allows.
+        Requests may arrive up to jitter seconds off the schedule the client kept, so the bucket may go short by that
+        many seconds worth of tokens plus one. Returns host -> the most tokens the bucket went short by
+        """
+        tolerance = 1 + jitter * rate
+        violations = {}
+        with self.lock:
+            arrivals = {host: list(times) for host, times in self.arrivals.items()}
+        for host, times in arrivals.items():
+            tokens = float(burst)
+            last = times[0]
+            shortest = 0.0
+            for arrival in times:
+                tokens = min(burst, tokens + (arrival - last) * rate) - 1
+                last = arrival
+                shortest = min(shortest, tokens)
+            if shortest < -tolerance:
+                violations[host] = round(-shortest, 2)
+        return violations
+
+    def stats(self):
+        with self.lock:
+            per_host = {host: len(times) for host, times in self.arrivals.items()}
+        return {"requests": self.requests, "max_in_flight": self.max_in_flight, "hosts": per_host}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serves a local web corpus over HTTP as a forward proxy, for "
+                                                 "main.py --http --proxy")
+    parser.add_argument("corpus_dir", help="directory of the corpus files")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=8080, help="port to listen on (default: %(default)s)")
+    parser.add_argument("--latency", type=float, default=0.0, metavar="SECONDS",
+                        help="delay every response by this many seconds, like a remote server would")
+    parser.add_argument("--robots", default=None, metavar="FILE",
+                        help="robots.txt served for every host the corpus has none for (default: 404, all allowed)")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s (%(name)s) %(levelname)s %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p',
+                        level=logging.INFO)
+    robots_txt = None
+    if args.robots is not None:
+        with open(args.robots, encoding="utf-8") as f:
+            robots_txt = f.read()
+    stub = StubServer(Corpus(args.corpus_dir), host=args.host, port=args.port, latency=args.latency,
+                      robots_txt=robots_txt)
+    logger.info("Serving %s on %s", args.corpus_dir, stub.address)
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.server.server_close()
+        logger.info("Stub server: %s", stub.stats())
+
+# ================
+# sources:
+# https://docs.python.org/3/library/http.server.html
+# https://www.rfc-editor.org/rfc/rfc9110#section-7.3.2
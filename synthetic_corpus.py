@@ -0,0 +1,127 @@
+import json
+import os
+import random
+import string
+
+from cbor_record import encode
+from corpus import Corpus
+from frontier import Frontier
+
+MANIFEST_FILE_NAME = "synthetic.json"
+
+# links that UrlFilter always rejects, mixed into every page so filtering has its real share of work
+FILTERED_LINKS = ("mailto:someone@uci.edu", "http://www.ics.uci.edu/pix/logo.jpg", "http://www.example.com/",
+                  "http://www.ics.uci.edu/doc//index.html", "http://www.ics.uci.edu/paper.pdf", "#top",
+                  "http://www.ics.uci.edu/user?action=edit")
+
+
+def corpus_file_name(url):
+    """
+    Name of the corpus file of a url, the one Corpus.get_file_name looks for
+    """
+    return Corpus._url_digest(url).hex()
+
+
+def make_vocabulary(rng, size=5000):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 10))))
+    return sorted(words)
+
+
+def record(url, content, http_code=200, content_type="text/html; charset=utf-8"):
+    """
+    A corpus record in the layout of the real corpus: a map of field name -> {b'value': ...}
+    """
+    return encode({
+        b"url": {b"type": b"string", b"value": url.encode("utf-8")},
+        b"http_code": {b"type": b"int", b"value": http_code},
+        b"http_headers": {b"type": b"list", b"value": [
+            {b"k": {b"value": b"Server"}, b"v": {b"value": b"Apache"}},
+            {b"k": {b"value": b"Content-Type"}, b"v": {b"value": content_type.encode("ascii")}}]},
+        b"raw_content": {b"type": b"bytes", b"value": content},
+        b"is_redirected": {b"type": b"bool", b"value": False},
+        b"final_url": {b"type": b"string", b"value": None},
+    })
+
+
+def html_page(rng, vocabulary, weights, title, links, page_words):
+    """
+    An html page of about page_words words with the links spread over its paragraphs, plus the script and style blocks
+    real pages have
+    """
+    words = rng.choices(vocabulary, weights, k=page_words)
+    paragraphs = max(1, len(links))
+    per_paragraph = max(1, page_words // paragraphs)
+    parts = ["<html><head><title>{}</title><style>p {{ margin: 0 }}</style>"
+             "<script>var page = '{}';</script></head><body>".format(title, title)]
+    for i in range(paragraphs):
+        parts.append("<p>{}</p>".format(" ".join(words[i * per_paragraph:(i + 1) * per_paragraph])))
+        if i < len(links):
+            parts.append('<a href="{}">{}</a>'.format(links[i], rng.choice(vocabulary)))
+    parts.append("<!-- generated --></body></html>")
+    return "".join(parts).encode("utf-8")
+
+
+def generate_corpus(corpus_dir, pages=1000, fan_out=10, trap_rate=0.05, page_words=400, hosts=8, error_rate=0.03,
+                    seed=0):
+    """
+    Writes a reproducible synthetic corpus of about pages html pages to corpus_dir, every page named like
+    Corpus.get_file_name expects and reachable from the seed url. Each page links to fan_out urls: mostly other pages,
+    with probability trap_rate the entrance of a trap, plus a few links the url filter rejects. Traps are a calendar
+    whose every month links to the next one and session id variants of regular pages with the same content.
+    A fraction error_rate of the pages are 404s or not html. Returns the manifest, also written to synthetic.json
+    """
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(rng)
+    # word frequencies of natural text roughly follow Zipf's law
+    weights = [1.0 / rank for rank in range(1, len(vocabulary) + 1)]
+    host_names = ["www.ics.uci.edu"] + ["host{}.ics.uci.edu".format(i) for i in range(1, hosts)]
+    urls = [Frontier.SEED_URL] + ["http://{}/dir{}/page{}.html".format(host_names[i % hosts], i % 37, i)
+                                  for i in range(1, pages)]
+    trap_pages = max(1, int(pages * trap_rate))
+    calendar = ["http://calendar.ics.uci.edu/cal/{}/{}".format(2000 + month // 12, month % 12 + 1)
+                for month in range(trap_pages)]
+    os.makedirs(corpus_dir, exist_ok=True)
+    total_bytes = 0
+    written = 0
+
+    def write(url, data):
+        nonlocal total_bytes, written
+        with open(os.path.join(corpus_dir, corpus_file_name(url)), "wb") as f:
+            f.write(data)
+        total_bytes += len(data)
+        written += 1
+
+    for i, url in enumerate(urls):
+        links = []
+        for _ in range(fan_out):
+            roll = rng.random()
+            if roll < trap_rate:
+                links.append(calendar[0] if rng.random() < 0.5 else "{}?sid={:x}".format(url, rng.getrandbits(32)))
+            elif roll < 0.9:
+                target = urls[rng.randrange(1, pages)] if pages > 1 else url
+                # relative links have to be joined with the page url like real pages
+                links.append(target if rng.random() < 0.7 else "/" + target.split("/", 3)[3])
+            else:
+                links.append(rng.choice(FILTERED_LINKS))
+        content = html_page(rng, vocabulary, weights, "page {}".format(i), links, page_words)
+        roll = rng.random()
+        if i and roll < error_rate / 2:
+            write(url, record(url, b"not found", http_code=404))
+        elif i and roll < error_rate:
+            write(url, record(url, content, content_type="application/pdf"))
+        else:
+            write(url, record(url, content))
+        for link in links:
+            if "?sid=" in link:
+                write(link, record(link, content))
+    for month, url in enumerate(calendar):
+        links = [calendar[(month + 1) % len(calendar)] if month + 1 < len(calendar) else urls[0]]
+        write(url, record(url, html_page(rng, vocabulary, weights, "calendar", links, page_words // 4)))
+
+    manifest = {"pages": pages, "fan_out": fan_out, "trap_rate": trap_rate, "page_words": page_words, "hosts": hosts,
+                "error_rate": error_rate, "seed": seed, "files": written, "bytes": total_bytes}
+    with open(os.path.join(corpus_dir, MANIFEST_FILE_NAME), "w") as f:
+        json.dump(manifest, f)
+    return manifest
@@ -0,0 +1,79 @@
+import random
+from collections import Counter
+
+import pytest
+
+from analytics import SortedUrlFile, TopWords
+
+
+def zipf_stream(seed, length, vocabulary=3000):
+    rng = random.Random(seed)
+    words = ["w{}".format(i) for i in range(vocabulary)]
+    weights = [1.0 / (rank + 1) for rank in range(vocabulary)]
+    return rng.choices(words, weights, k=length)
+
+
+def check_bounds(top, true_counts):
+    """
+    Space saving bounds: a kept count is never below the true count nor above it by more than its error, the error is
+    at most the floor, and a word that isn't kept was counted at most floor times
+    """
+    for word, count in top.counts.items():
+        error = top.errors.get(word, 0)
+        assert count - error <= true_counts[word] <= count
+        assert error <= top.floor
+    for word, count in true_counts.items():
+        if word not in top.counts:
+            assert count <= top.floor
+
+
+def test_exact_under_capacity():
+    stream = zipf_stream(1, 5000, vocabulary=150)
+    top = TopWords(capacity=100)
+    for word in stream:
+        top.add(word)
+    assert top.floor == 0 and not top.errors
+    assert top.counts == Counter(stream)
+    assert top.most_common(10) == Counter(stream).most_common(10)
+
+
+@pytest.mark.parametrize("capacity", [20, 100, 400])
+def test_space_saving_bounds(capacity):
+    stream = zipf_stream(capacity, 30000)
+    top = TopWords(capacity=capacity)
+    for i in range(0, len(stream), 7):
+        top.update(Counter(stream[i:i + 7]))
+    true_counts = Counter(stream)
+    assert top.floor > 0
+    assert len(top.counts) <= 2 * capacity
+    check_bounds(top, true_counts)
+    # the words more frequent than the floor are all kept
+    assert {word for word, count in true_counts.items() if count > top.floor} <= set(top.counts)
+
+
+@pytest.mark.parametrize("capacity", [None, 30, 200])
+def test_merge_keeps_bounds(capacity):
+    streams = [zipf_stream(seed, 8000) for seed in range(3)]
+    merged = TopWords(capacity=capacity)
+    for stream in streams:
+        shard = TopWords(capacity=capacity)
+        for word in stream:
+            shard.add(word)
+        merged.merge(shard.counts, shard.errors, shard.floor)
+    true_counts = Counter(word for stream in streams for word in stream)
+    check_bounds(merged, true_counts)
+    if capacity is None:
+        assert merged.counts == true_counts and merged.floor == 0
+
+
+def test_sorted_url_file(tmp_path):
+    rng = random.Random(2)
+    urls = ["http://www.ics.uci.edu/{}".format(rng.randrange(500)) for _ in range(3000)]
+    path = str(tmp_path / "valid_urls.txt")
+    sorted_file = SortedUrlFile(path, run_size=200, recent_size=10)
+    for url in urls:
+        sorted_file.add(url, "{}\t{}".format(url, len(url)))
+    sorted_file.finish()
+    with open(path) as f:
+        assert f.read().splitlines() == ["{}\t{}".format(url, len(url)) for url in sorted(set(urls))]
+    assert [p.name for p in tmp_path.iterdir()] == ["valid_urls.txt"]
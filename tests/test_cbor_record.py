@@ -0,0 +1,80 @@
+import mmap
+
+import pytest
+
+from cbor_record import CborError, CborRecord, decode, encode, skip
+from synthetic_corpus import record
+
+VALUES = [
+    0, 23, 24, 255, 256, 65535, 65536, 2 ** 32, 2 ** 64 - 1, -1, -24, -25, -2 ** 64,
+    1.5, -0.0, float("inf"),
+    None, True, False,
+    b"", b"\x00\xff" * 20, "", "café", "\udcff",
+    [], [1, [2, [3]]], {}, {b"a": 1, "b": [None, {b"c": b"d"}]},
+]
+
+
+@pytest.mark.parametrize("value", VALUES)
+def test_round_trip(value):
+    data = encode(value)
+    assert decode(data, 0) == (value, len(data))
+    assert skip(data, 0) == len(data)
+
+
+def test_indefinite_lengths():
+    # RFC 8949 appendix A: chunked strings, arrays and maps terminated by a break
+    examples = [
+        ("5f42010243030405ff", b"\x01\x02\x03\x04\x05"),
+        ("7f657374726561646d696e67ff", "streaming"),
+        ("9fff", []),
+        ("9f018202039f0405ffff", [1, [2, 3], [4, 5]]),
+        ("bf61610161629f0203ffff", {"a": 1, "b": [2, 3]}),
+        ("c11a514b67b0", 1363896240),
+        ("f97e00", float("nan")),
+    ]
+    for hex_data, expected in examples:
+        data = bytes.fromhex(hex_data)
+        value, pos = decode(data, 0)
+        if expected != expected:
+            assert value != value
+        else:
+            assert value == expected
+        assert pos == skip(data, 0) == len(data)
+
+
+@pytest.mark.parametrize("hex_data", ["", "19ff", "62ff", "1f", "1c", "8201"])
+def test_malformed(hex_data):
+    with pytest.raises((CborError, IndexError)):
+        decode(bytes.fromhex(hex_data), 0)
+
+
+def test_record_matches_decode(tmp_path):
+    data = record("http://www.ics.uci.edu/a", b"<html>page</html>", http_code=404)
+    path = tmp_path / "record.cbor"
+    path.write_bytes(data)
+    full = decode(data, 0)[0]
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        for buf in (data, mapped, memoryview(data)):
+            lazy = CborRecord(buf)
+            for field, entry in full.items():
+                assert field in lazy
+                assert lazy.value(field) == entry[b"value"]
+            assert lazy.value(b"missing", "default") == "default"
+            start, end = lazy.value_span(b"raw_content")
+            assert bytes(buf[start:end]) == b"<html>page</html>"
+            assert lazy.value_span(b"http_code") is None
+
+
+def test_indefinite_record():
+    # a record written with indefinite length maps and a chunked url
+    data = (b"\xbf" + encode(b"url") + b"\xbf" + encode(b"value") + b"\x5f" + encode(b"http://") + encode(b"x.org")
+            + b"\xff\xff" + encode(b"http_code") + encode({b"value": 200}) + b"\xff")
+    lazy = CborRecord(data)
+    assert lazy.value(b"url") == b"http://x.org"
+    assert lazy.value_span(b"url") is None
+    assert lazy.value(b"http_code") == 200
+
+
+def test_not_a_map():
+    with pytest.raises(CborError):
+        CborRecord(encode([1, 2]))
@@ -0,0 +1,109 @@
+import os
+import zlib
+
+import pytest
+
+from frontier import Frontier
+
+HOSTS = ["www", "vision", "cs", "stat", "informatics"]
+
+
+def links_of(url):
+    """
+    A deterministic link graph over a few hundred pages, with other spellings of the same pages (upper case hosts,
+    fragments, default ports) so added urls are journaled with their keys, and a rejected url now and then
+    """
+    seed = zlib.crc32(url.lower().split("#")[0].encode())
+    links = []
+    for i in range(4):
+        page = (seed >> (i * 7)) % 300
+        host = HOSTS[page % len(HOSTS)]
+        spelling = (seed >> i) % 4
+        if spelling == 0:
+            links.append("http://{}.ics.uci.edu/page{}".format(host, page))
+        elif spelling == 1:
+            links.append("http://{}.ICS.uci.edu/page{}#top".format(host.upper(), page))
+        elif spelling == 2:
+            links.append("http://{}.ics.uci.edu:80/page{}".format(host, page))
+        else:
+            links.append("http://{}.ics.uci.edu/calendar/{}/{}".format(host, page, seed % 13))
+    return links
+
+
+def crawl(frontier, steps=None):
+    """
+    Takes urls in the order the frontier hands them out like the crawler does: the links of a page are added before the
+    page is marked fetched. Returns the urls taken
+    """
+    order = []
+    while frontier.has_next_url() and (steps is None or len(order) < steps):
+        url = frontier.get_next_url()
+        order.append(url)
+        for link in links_of(url):
+            if "/calendar/" in link and zlib.crc32(url.encode()) % 3 == 0:
+                frontier.add_rejected(link)
+                frontier.record_trap(link)
+            else:
+                frontier.add_url(link)
+        frontier.mark_fetched(url)
+    return order
+
+
+def new_frontier(state_dir, scheduler, seen_backend):
+    frontier = Frontier(str(state_dir), seen_backend=seen_backend, scheduler=scheduler)
+    # compact often so the restart reads a snapshot and a journal
+    frontier.MIN_COMPACTION_RECORDS = 150
+    frontier.CHECKPOINT_INTERVAL = 50
+    frontier.load_frontier()
+    return frontier
+
+
+def crash(frontier, cut):
+    """
+    Leaves the frontier like a killed process would: the journal written so far, less its last cut bytes
+    """
+    frontier.journal.flush()
+    journal_file = frontier.journal.name
+    frontier.journal.close()
+    size = os.path.getsize(journal_file)
+    with open(journal_file, "r+b") as f:
+        f.truncate(max(0, size - cut))
+
+
+@pytest.mark.parametrize("scheduler", ["fifo", "host"])
+@pytest.mark.parametrize("seen_backend", ["set", "fingerprint"])
+def test_restart_continues_in_order(tmp_path, scheduler, seen_backend):
+    expected = crawl(new_frontier(tmp_path / "uncrashed", scheduler, seen_backend))
+    assert len(expected) > 100
+    for steps in (1, 37, 120):
+        state_dir = tmp_path / "crashed{}".format(steps)
+        frontier = new_frontier(state_dir, scheduler, seen_backend)
+        order = crawl(frontier, steps)
+        crash(frontier, 0)
+        restarted = new_frontier(state_dir, scheduler, seen_backend)
+        assert restarted.fetched == steps
+        assert order + crawl(restarted) == expected
+        assert restarted.fetched == len(expected)
+
+
+@pytest.mark.parametrize("scheduler", ["fifo", "host"])
+@pytest.mark.parametrize("cut", [1, 5, 17, 60, 400])
+def test_restart_after_crash_mid_journal(tmp_path, scheduler, cut):
+    expected = crawl(new_frontier(tmp_path / "uncrashed", scheduler, "set"))
+    state_dir = tmp_path / "crashed"
+    frontier = new_frontier(state_dir, scheduler, "set")
+    order = crawl(frontier, 90)
+    crash(frontier, cut)
+    restarted = new_frontier(state_dir, scheduler, "set")
+    # the incomplete record is cut off the journal before anything is appended to it
+    with open(restarted.journal.name, "rb") as f:
+        assert f.read().endswith(b"\n")
+    order += crawl(restarted)
+    # pages whose "=" record was lost are crawled again, every page is crawled and counted once
+    assert set(order) == set(expected)
+    assert restarted.fetched == len(expected)
+    assert len(restarted.urls_set) == len(new_frontier(tmp_path / "uncrashed", scheduler, "set").urls_set)
+
+    # and the state after the restart loads back the same
+    restarted.close()
+    assert new_frontier(state_dir, scheduler, "set").fetched == len(expected)
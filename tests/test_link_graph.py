@@ -0,0 +1,83 @@
+import random
+
+import pytest
+
+numpy = pytest.importorskip("numpy")
+
+from link_graph import LinkGraph, hits, pagerank  # noqa: E402
+
+
+def random_graph(n, seed):
+    rng = random.Random(seed)
+    adjacency = numpy.zeros((n, n))
+    for source in range(n):
+        # some pages without outlinks
+        if rng.random() < 0.15:
+            continue
+        for target in rng.sample(range(n), rng.randint(1, 5)):
+            if target != source:
+                adjacency[source, target] = 1.0
+    return adjacency
+
+
+def to_csr(adjacency):
+    indptr = [0]
+    indices = []
+    for row in adjacency:
+        indices.extend(numpy.flatnonzero(row))
+        indptr.append(len(indices))
+    return numpy.array(indptr, dtype=numpy.int64), numpy.array(indices, dtype=numpy.int64)
+
+
+def dense_pagerank(adjacency, damping=0.85):
+    """
+    The stationary distribution of the dense Google matrix, dangling pages linking to every page
+    """
+    n = len(adjacency)
+    out_degree = adjacency.sum(axis=1)
+    transition = numpy.where(out_degree[:, None] > 0, adjacency / numpy.maximum(out_degree, 1)[:, None], 1.0 / n)
+    google = damping * transition + (1.0 - damping) / n
+    values, vectors = numpy.linalg.eig(google.T)
+    rank = numpy.real(vectors[:, numpy.argmax(numpy.real(values))])
+    return rank / rank.sum()
+
+
+def principal_vector(matrix):
+    values, vectors = numpy.linalg.eigh(matrix)
+    vector = numpy.abs(vectors[:, -1])
+    return vector / numpy.linalg.norm(vector)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_pagerank_matches_dense_reference(seed):
+    adjacency = random_graph(60, seed)
+    rank = pagerank(*to_csr(adjacency))
+    assert rank.sum() == pytest.approx(1.0)
+    numpy.testing.assert_allclose(rank, dense_pagerank(adjacency), atol=1e-8)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_hits_matches_dense_reference(seed):
+    adjacency = random_graph(60, seed)
+    authorities, hubs = hits(*to_csr(adjacency), max_iterations=1000)
+    numpy.testing.assert_allclose(authorities, principal_vector(adjacency.T @ adjacency), atol=1e-6)
+    numpy.testing.assert_allclose(hubs, principal_vector(adjacency @ adjacency.T), atol=1e-6)
+
+
+def test_link_graph_round_trip(tmp_path):
+    graph = LinkGraph(str(tmp_path))
+    graph.FLUSH_EDGES = 4
+    graph.add_page("http://www.ics.uci.edu/a", ["http://WWW.ics.uci.edu/b#x", "http://www.ics.uci.edu/b",
+                                                "http://www.ics.uci.edu/a", "http://www.ics.uci.edu/c"])
+    graph.add_page("http://www.ics.uci.edu/b", ["http://www.ics.uci.edu/a"])
+    graph.add_page("http://www.ics.uci.edu/c", [])
+    graph.add_page("http://www.ics.uci.edu/d", ["http://www.ics.uci.edu/a", "http://www.ics.uci.edu/e"])
+    assert graph.edges == 5
+    assert graph.urls() == ["http://www.ics.uci.edu/a", "http://WWW.ics.uci.edu/b#x", "http://www.ics.uci.edu/c",
+                            "http://www.ics.uci.edu/d", "http://www.ics.uci.edu/e"]
+    indptr, indices = graph.csr()
+    assert [sorted(indices[indptr[node]:indptr[node + 1]]) for node in range(5)] == [[1, 2], [0], [], [0, 4], []]
+    ranks = graph.rank(top=2)
+    assert ranks["pagerank"][0][0] == "http://www.ics.uci.edu/a"
+    assert ranks["authorities"][0][0] == "http://www.ics.uci.edu/a"
+    graph.close()
@@ -0,0 +1,61 @@
+import random
+
+import pytest
+
+import near_duplicates
+from near_duplicates import FINGERPRINT_BITS, NearDuplicateIndex, simhash
+
+
+def distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+def test_simhash_without_numpy_matches(monkeypatch):
+    rng = random.Random(1)
+    pages = [{"w{}".format(rng.randrange(400)): rng.randint(1, 9) for _ in range(rng.randint(1, 200))}
+             for _ in range(30)]
+    fingerprints = [simhash(page) for page in pages]
+    monkeypatch.setattr(near_duplicates, "numpy", None)
+    assert [simhash(page) for page in pages] == fingerprints
+    assert simhash({}) == 0
+
+
+def test_similar_pages_have_close_fingerprints():
+    rng = random.Random(3)
+    page = {"w{}".format(i): rng.randint(1, 20) for i in range(300)}
+    edited = dict(page, w0=page["w0"] + 1, extra=1)
+    other = {"v{}".format(i): rng.randint(1, 20) for i in range(300)}
+    assert distance(simhash(page), simhash(edited)) <= 3
+    assert distance(simhash(page), simhash(other)) > 10
+
+
+@pytest.mark.parametrize("max_distance", [0, 3, 4, 7])
+def test_index_matches_brute_force(max_distance):
+    rng = random.Random(max_distance)
+    index = NearDuplicateIndex(max_distance)
+    indexed = {}
+    for i in range(800):
+        if indexed and rng.random() < 0.5:
+            # a near or not so near copy of an indexed page
+            fingerprint = rng.choice(list(indexed.values()))
+            for bit in rng.sample(range(FINGERPRINT_BITS), rng.randint(0, max_distance + 2)):
+                fingerprint ^= 1 << bit
+        else:
+            fingerprint = rng.getrandbits(FINGERPRINT_BITS)
+        url = "http://www.ics.uci.edu/{}".format(i)
+        near = [other for other, other_fingerprint in indexed.items()
+                if distance(fingerprint, other_fingerprint) <= max_distance]
+        original = index.find_or_add(fingerprint, url)
+        if near:
+            assert original in near
+        else:
+            assert original is None
+            indexed[url] = fingerprint
+    assert index.pages == len(indexed)
+    assert index.duplicates == 800 - len(indexed)
+    assert sum(len(duplicates) for duplicates in index.clusters.values()) == index.duplicates
+
+
+def test_max_distance_range():
+    with pytest.raises(ValueError):
+        NearDuplicateIndex(FINGERPRINT_BITS)
@@ -0,0 +1,59 @@
+import random
+from collections import Counter
+
+import pytest
+
+from page_analysis import analyze_html, page_text
+from PartA import tokenize
+from synthetic_corpus import html_page
+
+BeautifulSoup = pytest.importorskip("bs4").BeautifulSoup
+
+STOP_WORDS = {"the", "and", "of", "a", "to"}
+
+PAGES = [
+    b"<html><head><title>The Title</title><style>p { color: red }</style></head>"
+    b"<body><p>Hello <b>bold</b> world &amp; friends</p><a href='/x'>x</a><a name='anchor'>no href</a>"
+    b"<script>var skipped = 'script text';</script><p>caf\xc3\xa9 na\xc3\xafve 42 abc123</p></body></html>",
+    b"<p>unclosed <a href=\"http://www.ics.uci.edu/a?b=1&amp;c=2\">one<p>two <a href=x>three</a>",
+    b"<!DOCTYPE html><!-- a comment with words --><html><body>The <i>and</i> of THE a b c<br/>end</body></html>",
+    b"<html><body><template><p>templated</p></template><div>after<script>x</script>tail</div></body></html>",
+    b"plain text, no tags at all",
+    b"<html><body>\xff\xfe broken bytes <a href='\xe9'>e</a></body></html>",
+    b"<html><head><meta charset='iso-8859-1'></head><body>caf\xe9 fa\xe7ade</body></html>",
+    b"<meta http-equiv='Content-Type' content='text/html; charset=windows-1252'><p>\x93quoted\x94 caf\xe9</p>",
+    b"\xef\xbb\xbf<p>caf\xc3\xa9 with a byte order mark</p>",
+    b"",
+]
+
+
+def reference(content):
+    """
+    What the crawler computed before single-pass analysis: a BeautifulSoup tree and get_text()
+    """
+    soup = BeautifulSoup(content, "lxml")
+    words = tokenize(soup.get_text())
+    frequencies = Counter(word for word in words if word.isalpha() and word.lower() not in STOP_WORDS)
+    return [a.get("href") for a in soup.find_all("a")], soup.get_text(), words, frequencies
+
+
+def synthetic_pages(count):
+    rng = random.Random(5)
+    vocabulary = ["word{}".format(i) for i in range(50)] + ["the", "and", "crawler"]
+    weights = [1.0] * len(vocabulary)
+    for i in range(count):
+        links = ["http://www.ics.uci.edu/page{}".format(rng.randrange(100)) for _ in range(rng.randrange(6))]
+        yield html_page(rng, vocabulary, weights, "page {}".format(i), links, 80)
+
+
+@pytest.mark.parametrize("content", PAGES + list(synthetic_pages(5)))
+def test_matches_beautifulsoup(content):
+    if isinstance(content, str):
+        content = content.encode()
+    hrefs, text, words, frequencies = reference(content)
+    analysis = analyze_html(content, STOP_WORDS)
+    assert page_text(content) == text
+    assert analysis.hrefs == hrefs
+    assert analysis.tokens == words
+    assert analysis.word_count == len(words)
+    assert dict(analysis.word_frequencies) == dict(frequencies)
@@ -0,0 +1,145 @@
+import random
+
+import pytest
+
+from search_index import (LEXICON_ENTRY, IndexWriter, SearchIndex, decode_postings, decode_varint, encode_postings,
+                          encode_varints, merge_segments, read_segment, write_segment_entry)
+
+
+def test_varints_round_trip():
+    numbers = [0, 1, 127, 128, 255, 16383, 16384, 2 ** 32, 2 ** 63 + 5]
+    out = bytearray()
+    encode_varints(numbers, out)
+    position = 0
+    decoded = []
+    while position < len(out):
+        number, position = decode_varint(out, position)
+        decoded.append(number)
+    assert decoded == numbers
+    assert len(out) == 1 + 1 + 1 + 2 + 2 + 2 + 3 + 5 + 10
+
+
+@pytest.mark.parametrize("spread", [1, 50, 100000])
+def test_postings_round_trip(spread):
+    rng = random.Random(spread)
+    postings = []
+    document = 0
+    for _ in range(200):
+        document += rng.randint(0 if not postings else 1, spread)
+        positions = sorted(rng.sample(range(spread * 3 + 5), rng.randint(1, 5)))
+        postings.append((document, positions))
+    data = encode_postings(postings)
+    assert list(decode_postings(data, len(postings))) == postings
+    assert list(decode_postings(data, len(postings), with_positions=False)) == [
+        (document, len(positions)) for document, positions in postings]
+
+
+def make_documents(count, seed=7):
+    rng = random.Random(seed)
+    vocabulary = ["w{}".format(i) for i in range(60)] + ["café", "uci", "ics"]
+    weights = [1.0 / (rank + 1) for rank in range(len(vocabulary))]
+    return [("http://www.ics.uci.edu/doc{}".format(i), rng.choices(vocabulary, weights, k=rng.randint(0, 40)))
+            for i in range(count)]
+
+
+def test_merge_segments_matches_one_segment(tmp_path):
+    documents = make_documents(150)
+    paths = []
+    for start in range(0, len(documents), 40):
+        # one segment per range of documents, like IndexWriter.flush writes them
+        batch = {}
+        for document in range(start, min(start + 40, len(documents))):
+            positions = {}
+            for position, term in enumerate(documents[document][1]):
+                positions.setdefault(term, []).append(position)
+            for term, term_positions in positions.items():
+                batch.setdefault(term, []).append((document, term_positions))
+        paths.append(str(tmp_path / "segment{}".format(len(paths))))
+        with open(paths[-1], "wb") as f:
+            for term, postings in sorted(batch.items()):
+                write_segment_entry(f, term.encode(), len(postings), postings[-1][0], encode_postings(postings))
+
+    merged = []
+    merge_segments(paths, lambda *entry: merged.append(entry))
+    assert [term for term, *_ in merged] == sorted({term.encode() for _, terms in documents for term in terms})
+    for term, count, last_document, postings in merged:
+        expected = [(document, [position for position, word in enumerate(terms) if word.encode() == term])
+                    for document, (_, terms) in enumerate(documents) if term.decode() in terms]
+        assert count == len(expected)
+        assert last_document == expected[-1][0]
+        assert list(decode_postings(postings, count)) == expected
+
+    # merging the merged segments again changes nothing
+    with open(tmp_path / "merged", "wb") as f:
+        for entry in merged:
+            write_segment_entry(f, *entry)
+    assert [(bytes(term), count, last, bytes(postings)) for term, count, last, postings in
+            read_segment(str(tmp_path / "merged"))] == [(term, count, last, bytes(postings))
+                                                        for term, count, last, postings in merged]
+
+
+def build_index(index_dir, documents, **options):
+    fan_in = options.pop("fan_in", None)
+    writer = IndexWriter(str(index_dir), **options)
+    if fan_in is not None:
+        writer.MERGE_FAN_IN = fan_in
+    for url, tokens in documents:
+        writer.add_document(url, tokens)
+    writer.close()
+    return writer, SearchIndex(str(index_dir))
+
+
+def index_contents(index):
+    terms = []
+    for entry in range(len(index.lexicon) // LEXICON_ENTRY.size if index.lexicon is not None else 0):
+        term = bytes(index.term_at(entry)[0]).decode()
+        terms.append((term, list(index.postings(term))))
+    return terms
+
+
+def test_segmented_index_matches_single_segment(tmp_path):
+    documents = make_documents(300)
+    _, single = build_index(tmp_path / "single", documents, max_overhead=float("inf"))
+    writer, segmented = build_index(tmp_path / "segmented", documents, batch_tokens=50, max_overhead=float("inf"),
+                                    fan_in=3)
+    assert writer.stats()["segments"] > 9
+    assert index_contents(segmented) == index_contents(single)
+    assert segmented.urls == single.urls == [url for url, _ in documents]
+    for query in ("w0", "w3 w7", "café uci", "missing"):
+        assert segmented.search(query, top=20) == single.search(query, top=20)
+    single.close()
+    segmented.close()
+
+
+def test_deferred_documents_are_indexed_on_close(tmp_path):
+    documents = make_documents(60)
+    _, inline = build_index(tmp_path / "inline", documents, max_overhead=float("inf"))
+    writer, deferred = build_index(tmp_path / "deferred", documents, max_overhead=0.0)
+    assert writer.deferred > 0
+    assert index_contents(deferred) == index_contents(inline)
+    inline.close()
+    deferred.close()
+
+
+def test_search_matches_brute_force(tmp_path):
+    documents = make_documents(200, seed=3)
+    _, index = build_index(tmp_path / "index", documents, batch_tokens=300, max_overhead=float("inf"))
+    assert len(index) == len(documents)
+    for term in ("w1", "W5", "ics"):
+        expected = [document for document, (_, tokens) in enumerate(documents) if term.lower() in tokens]
+        assert [document for document, _ in index.postings(term)] == expected
+        assert len(index.search(term, top=1000)) == len(expected)
+    phrase = documents[17][1][4:6]
+    expected = {url for url, tokens in documents
+                if any(tokens[i:i + len(phrase)] == phrase for i in range(len(tokens)))}
+    assert {url for url, _ in index.search(" ".join(phrase), top=1000, phrase=True)} == expected
+    assert index.search("nothing here") == []
+    index.close()
+
+
+def test_empty_index(tmp_path):
+    _, index = build_index(tmp_path / "empty", [])
+    assert len(index) == 0
+    assert index.lookup("w1") is None
+    assert index.search("w1") == []
+    index.close()
@@ -0,0 +1,26 @@
+from collections import Counter
+
+from sharding import HashRing
+
+HOSTS = ["host{}.ics.uci.edu".format(i) for i in range(5000)]
+
+
+def test_shards_are_balanced():
+    ring = HashRing(4)
+    sizes = Counter(ring.shard_of(host) for host in HOSTS)
+    assert sorted(sizes) == [0, 1, 2, 3]
+    assert max(sizes.values()) < 1.5 * len(HOSTS) / 4
+    assert [HashRing(4).shard_of(host) for host in HOSTS[:100]] == [ring.shard_of(host) for host in HOSTS[:100]]
+
+
+def test_adding_a_shard_only_moves_hosts_to_it():
+    before = HashRing(4)
+    after = HashRing(5)
+    moved = [host for host in HOSTS if before.shard_of(host) != after.shard_of(host)]
+    assert all(after.shard_of(host) == 4 for host in moved)
+    assert 0.1 < len(moved) / len(HOSTS) < 0.3
+
+
+def test_one_shard():
+    ring = HashRing(1, replicas=1)
+    assert {ring.shard_of(host) for host in HOSTS} == {0}
@@ -0,0 +1,50 @@
+from types import SimpleNamespace
+
+import pytest
+
+from trap_detector import TrapDetector, url_template
+
+
+@pytest.mark.parametrize("url, template", [
+    ("http://www.ics.uci.edu/calendar/2019-03-05/event?b=2&a=1&b=3", "www.ics.uci.edu/calendar/{date}/event?a&b"),
+    ("http://www.ics.uci.edu/calendar/20190305/event", "www.ics.uci.edu/calendar/{date}/event"),
+    ("http://WWW.ics.uci.edu:8080/page12/item345.html", "www.ics.uci.edu/page{n}/item{n}.html"),
+    ("http://www.ics.uci.edu/", "www.ics.uci.edu/"),
+    ("http://www.ics.uci.edu", "www.ics.uci.edu"),
+])
+def test_url_template(url, template):
+    assert url_template(url) == template
+
+
+def test_calendar_is_throttled_then_blacklisted():
+    detector = TrapDetector(throttle_urls=10, max_template_urls=20, throttle_step=4)
+    verdicts = [detector.check("http://www.ics.uci.edu/calendar/day{}".format(day)) for day in range(200)]
+    admitted = [day for day, reason in enumerate(verdicts) if reason is None]
+    # the first throttle_urls are let in, then one in throttle_step until max_template_urls were admitted
+    assert admitted[:10] == list(range(10))
+    assert admitted[10:13] == [13, 17, 21]
+    assert len(admitted) == 20
+    assert "blacklisted" in verdicts[-1]
+    assert detector.stats()["blacklisted"] == 1
+    # other templates of the host aren't affected
+    assert detector.check("http://www.ics.uci.edu/about") is None
+
+
+def test_low_content_template_is_blacklisted():
+    detector = TrapDetector(min_samples=5, max_low_content_rate=0.5, min_words=50)
+    for page in range(5):
+        url = "http://www.ics.uci.edu/empty/{}".format(page)
+        assert detector.check(url) is None
+        detector.record_page(SimpleNamespace(url=url, is_valid=True, duplicate_of=None, word_count=page))
+    assert detector.check("http://www.ics.uci.edu/empty/99").startswith("trap detector: template")
+    # the host is mostly low content too, so its other templates are throttled, other hosts aren't
+    assert detector.check("http://www.ics.uci.edu/full").startswith("trap detector: host")
+    assert detector.check("http://vision.ics.uci.edu/full") is None
+
+
+def test_patterns_are_bounded():
+    detector = TrapDetector(max_patterns=50)
+    for i in range(500):
+        detector.check("http://host{}.ics.uci.edu/section{}/page".format(i, "abcdefghij"[i % 10]))
+    assert len(detector.templates) <= 50
+    assert len(detector.hosts) <= 50
@@ -0,0 +1,162 @@
+from collections import OrderedDict
+import logging
+import re
+
+from url_canonical import parse_url
+
+logger = logging.getLogger(__name__)
+
+DATE_SEGMENT = re.compile(r"^\d{4}-\d{1,2}(-\d{1,2})?$|^(19|20)\d{6}$")
+DIGITS = re.compile(r"\d+")
+
+
+def url_template(url):
+    """
+    The path template of a url: host and path with dates replaced by {date} and every other run of digits by {n}, and
+    the query reduced to its sorted keys, so the urls a calendar or a paginated listing generates share a template
+    """
+    try:
+        parsed = parse_url(url)
+        host = parsed.hostname or ""
+    except ValueError:
+        return url
+    segments = []
+    for segment in parsed.path.split("/"):
+        if DATE_SEGMENT.match(segment):
+            segments.append("{date}")
+        else:
+            segments.append(DIGITS.sub("{n}", segment))
+    template = host + "/".join(segments)
+    if parsed.query:
+        keys = sorted({pair.split("=", 1)[0] for pair in parsed.query.split("&") if pair})
+        template += "?" + "&".join(keys)
+    return template
+
+
+def template_host(template):
+    return template.split("/", 1)[0].split("?", 1)[0]
+
+
+class PatternStats:
+    """
+    Counters of a path template or a host
+
+    Attributes:
+        admitted: distinct urls let into the frontier
+        offered: distinct urls checked since the pattern was throttled, the frontier keeps rejected urls from being
+            offered twice
+        fetched: pages fetched
+        low_content: fetched pages that were rejected, near duplicates or shorter than TrapDetector.min_words
+        blacklisted: why the pattern was blacklisted, None if it isn't
+    """
+
+    __slots__ = ("admitted", "offered", "fetched", "low_content", "blacklisted")
+
+    def __init__(self):
+        self.admitted = 0
+        self.offered = 0
+        self.fetched = 0
+        self.low_content = 0
+        self.blacklisted = None
+
+    def low_content_rate(self):
+        return self.low_content / self.fetched if self.fetched else 0.0
+
+
+class TrapDetector:
+    """
+    Online trap detection from per host and per path template statistics, on top of the fixed rules of UrlFilter.
+    A template is throttled, only one in throttle_step of its new urls let in, once throttle_urls of its urls were
+    admitted, and blacklisted once max_template_urls were, or once at least min_samples of its pages were fetched and
+    more than max_low_content_rate of them were low content. A host whose pages are mostly low content is throttled
+    the same way. Only the max_patterns most recently used templates and hosts are remembered, so memory is bounded
+    however many urls the crawl sees; a forgotten pattern starts counting again from zero
+
+    Every rejection comes with the reason, which ends up next to the url in trapped_urls.txt
+    """
+
+    def __init__(self, throttle_urls=200, max_template_urls=1000, throttle_step=4, min_samples=20,
+                 max_low_content_rate=0.8, min_words=50, max_patterns=100000):
+        self.throttle_urls = throttle_urls
+        self.max_template_urls = max_template_urls
+        self.throttle_step = throttle_step
+        self.min_samples = min_samples
+        self.max_low_content_rate = max_low_content_rate
+        self.min_words = min_words
+        self.max_patterns = max_patterns
+        self.templates = OrderedDict()
+        self.hosts = OrderedDict()
+        self.rejected = 0
+
+    def pattern_stats(self, patterns, key):
+        stats = patterns.get(key)
+        if stats is None:
+            stats = patterns[key] = PatternStats()
+            if len(patterns) > self.max_patterns:
+                patterns.popitem(last=False)
+        else:
+            patterns.move_to_end(key)
+        return stats
+
+    def check(self, url):
+        """
+        Decides on a url not yet in the frontier. Returns None and counts the url if it should be crawled, otherwise the
+        reason it is rejected
+        """
+        template = url_template(url)
+        stats = self.pattern_stats(self.templates, template)
+        host_stats = self.pattern_stats(self.hosts, template_host(template))
+        reason = self.verdict(template, stats, host_stats)
+        if reason is None:
+            stats.admitted += 1
+            host_stats.admitted += 1
+        else:
+            self.rejected += 1
+        return reason
+
+    def verdict(self, template, stats, host_stats):
+        if stats.blacklisted is not None:
+            return stats.blacklisted
+        if stats.admitted >= self.max_template_urls:
+            return self.blacklist(stats, "template {} blacklisted after {} distinct urls".format(
+                template, stats.admitted))
+        if stats.admitted >= self.throttle_urls:
+            return self.throttle(stats, "template {} throttled after {} distinct urls".format(template, stats.admitted))
+        if host_stats.fetched >= self.min_samples and host_stats.low_content_rate() > self.max_low_content_rate:
+            return self.throttle(host_stats, "host {} throttled, {} of {} fetched pages low content".format(
+                template_host(template), host_stats.low_content, host_stats.fetched))
+        return None
+
+    def throttle(self, stats, reason):
+        stats.offered += 1
+        return None if stats.offered % self.throttle_step == 0 else "trap detector: " + reason
+
+    @staticmethod
+    def blacklist(stats, reason):
+        logger.info("Trap detector: %s", reason)
+        stats.blacklisted = "trap detector: " + reason
+        return stats.blacklisted
+
+    def record_page(self, page):
+        """
+        Counts a fetched crawler.PageResult towards the low content rate of its template and host
+        """
+        template = url_template(page.url)
+        low_content = not page.is_valid or page.duplicate_of is not None or page.word_count < self.min_words
+        for stats in (self.pattern_stats(self.templates, template),
+                      self.pattern_stats(self.hosts, template_host(template))):
+            stats.fetched += 1
+            stats.low_content += low_content
+        stats = self.templates[template]
+        if (stats.blacklisted is None and stats.fetched >= self.min_samples
+                and stats.low_content_rate() > self.max_low_content_rate):
+            self.blacklist(stats, "template {} blacklisted, {} of {} fetched pages low content".format(
+                template, stats.low_content, stats.fetched))
+
+    def stats(self):
+        return {"templates": len(self.templates), "hosts": len(self.hosts), "rejected": self.rejected,
+                "blacklisted": sum(1 for stats in self.templates.values() if stats.blacklisted is not None)}
+
+# ================
+# sources:
+# https://en.wikipedia.org/wiki/Spider_trap
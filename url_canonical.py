@@ -0,0 +1,59 @@
+from functools import lru_cache
+from urllib.parse import urlparse
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+# query parameters that only say where a visitor came from, they never change the page
+TRACKING_PARAMS = frozenset(["fbclid", "gclid", "dclid", "msclkid", "yclid", "igshid", "mc_cid", "mc_eid", "_ga",
+                             "_gl", "ref_src"])
+CACHE_SIZE = 1 << 17
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_url(url):
+    """
+    urlparse with a memo shared by the whole crawl pipeline (frontier, corpus, url filter, scheduler, trap detector), so
+    a url string that shows up on many pages is parsed once. The result is a ParseResult and must not be modified
+    """
+    return urlparse(url)
+
+
+def is_tracking_param(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith("utm_")
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def canonical_url(url):
+    """
+    The key two urls of the same page share: lowercase scheme and host, no default port, user info or fragment, no
+    trailing slash (the corpus strips it too, http://x/a/ and http://x/a are the same file), and the query parameters
+    sorted with the tracking ones removed. Canonicalizing a canonical url returns it unchanged. A url that can't be parsed
+    is its own key
+    """
+    try:
+        parsed = parse_url(url)
+        port = parsed.port
+    except ValueError:
+        return url
+    if not parsed.netloc:
+        # mailto:, relative and other urls without a host only lose their fragment
+        return url.split("#", 1)[0]
+    scheme = parsed.scheme.lower()
+    netloc = (parsed.hostname or "").rstrip(".")
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        netloc += ":{}".format(port)
+    path = parsed.path.rstrip("/")
+    if parsed.params:
+        path += ";" + parsed.params
+    key = "{}://{}{}".format(scheme, netloc, path) if scheme else "//" + netloc + path
+    if parsed.query:
+        pairs = sorted(pair for pair in parsed.query.split("&")
+                       if pair and not is_tracking_param(pair.split("=", 1)[0]))
+        if pairs:
+            key += "?" + "&".join(pairs)
+    return key
+
+# ================
+# sources:
+# https://en.wikipedia.org/wiki/URI_normalization
+# https://www.rfc-editor.org/rfc/rfc3986#section-6
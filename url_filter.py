@@ -0,0 +1,90 @@
+from functools import lru_cache
+import re
+
+from url_canonical import parse_url
+
+# the rules Crawler.is_valid has always applied, in the order they are checked
+DEFAULT_RULES = {
+    # accepted url schemes
+    "schemes": ["http", "https"],
+    # longer urls are almost always generated (calendars, session ids, repeated directories)
+    "max_length": 100,
+    # substrings that mark a url as a trap: fragments, image directories, login and action pages
+    "blacklist": ["#", "/pix/", "=login", "action="],
+    # the host has to be this domain or one of its subdomains
+    "host_suffix": "ics.uci.edu",
+    # regular expressions searched in the url path, a match is a trap (repeated slashes)
+    "path_patterns": [r"(.)(/{2,})(.*)"],
+    # a path with an extension has to end in one of these, paths without a '.' are always accepted
+    "allowed_extensions": ["html", "htm", "css", 'rss', "js", "jsx", "less", "scss", "wasm",
+                           "php", 'shtml', 'xhtml', 'asp', 'asx'],
+}
+
+
+class UrlFilter:
+    """
+    Decides whether a url should be crawled. The rule set is compiled once when the filter is created, every url is
+    parsed at most once per check and the verdicts of recently checked urls are memoized, since the same links show up
+    on many pages
+
+    A verdict is None for an accepted url, otherwise the reason the url was rejected
+    """
+
+    def __init__(self, rules=None, cache_size=1 << 16):
+        rules = dict(DEFAULT_RULES, **(rules or {}))
+        self.schemes = frozenset(rules["schemes"])
+        self.max_length = rules["max_length"]
+        self.blacklist = tuple(rules["blacklist"])
+        self.host_suffix = rules["host_suffix"].lower().split('.')
+        self.path_patterns = [re.compile(pattern) for pattern in rules["path_patterns"]]
+        self.allowed_extensions = tuple('.' + ext.lower() for ext in rules["allowed_extensions"])
+        self.verdict = lru_cache(maxsize=cache_size)(self._evaluate)
+
+    def _evaluate(self, url):
+        try:
+            parsed = parse_url(url)
+            if parsed.scheme not in self.schemes:
+                return "scheme {} not allowed".format(parsed.scheme or "missing")
+            if len(url) > self.max_length:
+                return "longer than {} characters".format(self.max_length)
+            for substring in self.blacklist:
+                if substring in url:
+                    return "contains {}".format(substring)
+            if str(parsed.hostname).split('.')[-len(self.host_suffix):] != self.host_suffix:
+                return "host {} outside {}".format(parsed.hostname, '.'.join(self.host_suffix))
+            for pattern in self.path_patterns:
+                if pattern.search(parsed.path):
+                    return "path matches {}".format(pattern.pattern)
+            path = parsed.path.lower()
+            if '.' in path and not path.endswith(self.allowed_extensions):
+                return "file extension not allowed"
+            return None
+        except (TypeError, ValueError) as e:
+            return "unparseable url ({})".format(e)
+
+    def is_valid(self, url):
+        return self.verdict(url) is None
+
+    def filter_links(self, urls):
+        """
+        Validates all the links of a page in one call. Returns the accepted urls, in their original order, and a dict of
+        the rejected urls to their rejection reasons
+        """
+        verdict = self.verdict
+        accepted = []
+        rejected = {}
+        for url in urls:
+            reason = verdict(url)
+            if reason is None:
+                accepted.append(url)
+            else:
+                rejected[url] = reason
+        return accepted, rejected
+
+    def cache_info(self):
+        return self.verdict.cache_info()
+
+# ================
+# sources:
+# https://docs.python.org/3/library/functools.html#functools.lru_cache
+# https://docs.python.org/3/library/stdtypes.html#str.endswith